@@ -0,0 +1,136 @@
+"""Login performance profile: password hashing and per-request user lookup.
+
+Passwords are hashed with Argon2 when ``argon2-cffi`` is installed and with
+scrypt otherwise (``PASSWORD_HASH_ALGORITHM``), using parameters from the
+``PASSWORD_SCRYPT_*`` / ``PASSWORD_ARGON2_*`` settings. Hashes made with an
+older algorithm or other parameters still verify and are rehashed on the
+user's next successful login.
+
+``StudioModelBackend`` only signs users in on the hosts of studios they
+belong to. ``CachedModelBackend`` keeps the user row in the cache for
+``AUTH_USER_CACHE_SECONDS`` so ``AuthenticationMiddleware`` does not query it
+on every request. Logging in stores the fresh user row, and saving or
+deleting a user drops the cached copy. That is only safe when every process
+shares the cache, so the setting defaults to 0 (off) unless a shared cache
+is configured (``SHARED_CACHE``).
+"""
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.contrib.auth.backends import ModelBackend
+from django.contrib.auth.hashers import Argon2PasswordHasher, ScryptPasswordHasher
+from django.contrib.auth.signals import user_logged_in
+from django.core.cache import cache
+from django.db.models.signals import post_delete, post_save
+
+from . import metrics, tenancy
+
+
+class TunedScryptPasswordHasher(ScryptPasswordHasher):
+    """scrypt with the cost parameters from settings"""
+
+    @property
+    def work_factor(self):
+        return settings.PASSWORD_SCRYPT_WORK_FACTOR
+
+    @property
+    def block_size(self):
+        return settings.PASSWORD_SCRYPT_BLOCK_SIZE
+
+    @property
+    def parallelism(self):
+        return settings.PASSWORD_SCRYPT_PARALLELISM
+
+    @property
+    def maxmem(self):
+        # scrypt needs 128 * r * N bytes; OpenSSL refuses anything over 32 MiB unless told otherwise
+        return 2 * 128 * self.block_size * self.work_factor
+
+
+class TunedArgon2PasswordHasher(Argon2PasswordHasher):
+    """Argon2id with the cost parameters from settings"""
+
+    @property
+    def time_cost(self):
+        return settings.PASSWORD_ARGON2_TIME_COST
+
+    @property
+    def memory_cost(self):
+        return settings.PASSWORD_ARGON2_MEMORY_COST
+
+    @property
+    def parallelism(self):
+        return settings.PASSWORD_ARGON2_PARALLELISM
+
+
+def user_cache_key(user_id):
+    return f'auth:user:{user_id}'
+
+
+class StudioModelBackend(ModelBackend):
+    """ModelBackend that only accepts users belonging to the request's studio (see tenancy.is_member)"""
+
+    def user_can_authenticate(self, user):
+        return super().user_can_authenticate(user) and tenancy.is_member(user)
+
+    async def auser_can_authenticate(self, user):
+        return super().user_can_authenticate(user) and await tenancy.ais_member(user)
+
+    async def aget_user(self, user_id):
+        UserModel = get_user_model()
+        try:
+            user = await UserModel._default_manager.aget(pk=user_id)
+        except UserModel.DoesNotExist:
+            return None
+        return user if await self.auser_can_authenticate(user) else None
+
+
+class CachedModelBackend(StudioModelBackend):
+    """StudioModelBackend whose per-request user lookup is served from the cache"""
+
+    def get_user(self, user_id):
+        if not settings.AUTH_USER_CACHE_SECONDS:
+            return super().get_user(user_id)
+        key = user_cache_key(user_id)
+        user = cache.get(key)
+        metrics.record_cache_access('auth_user', user is not None)
+        if user is None:
+            UserModel = get_user_model()
+            try:
+                user = UserModel._default_manager.get(pk=user_id)
+            except UserModel.DoesNotExist:
+                return None
+            cache.set(key, user, settings.AUTH_USER_CACHE_SECONDS)
+        return user if self.user_can_authenticate(user) else None
+
+    async def aget_user(self, user_id):
+        if not settings.AUTH_USER_CACHE_SECONDS:
+            return await super().aget_user(user_id)
+        key = user_cache_key(user_id)
+        user = await cache.aget(key)
+        metrics.record_cache_access('auth_user', user is not None)
+        if user is None:
+            UserModel = get_user_model()
+            try:
+                user = await UserModel._default_manager.aget(pk=user_id)
+            except UserModel.DoesNotExist:
+                return None
+            await cache.aset(key, user, settings.AUTH_USER_CACHE_SECONDS)
+        return user if await self.auser_can_authenticate(user) else None
+
+
+def _user_changed(sender, instance, **kwargs):
+    # Covers password changes (which also rotate the session hash), deactivation and last_login
+    cache.delete(user_cache_key(instance.pk))
+
+
+def _user_logged_in(sender, request, user, **kwargs):
+    # Runs after update_last_login saved (and so uncached) the user; the next request finds it warm
+    if settings.AUTH_USER_CACHE_SECONDS:
+        cache.set(user_cache_key(user.pk), user, settings.AUTH_USER_CACHE_SECONDS)
+
+
+def install():
+    """Connect the user cache invalidation signals (called from AppConfig.ready)"""
+    post_save.connect(_user_changed, sender=settings.AUTH_USER_MODEL, dispatch_uid='accounts_user_saved')
+    post_delete.connect(_user_changed, sender=settings.AUTH_USER_MODEL, dispatch_uid='accounts_user_deleted')
+    user_logged_in.connect(_user_logged_in, dispatch_uid='accounts_user_logged_in')
@@ -1,7 +1,21 @@
-from django.contrib import admin
+from django import forms
+from django.contrib import admin, messages
+from django.contrib.admin.helpers import ActionForm
 from django.contrib.auth.models import User
 from django.contrib.auth.admin import UserAdmin
-from .models import Group, Pass, Teacher, Student, StudentVisit, Purchase
+from django.core.exceptions import PermissionDenied
+from django.db import transaction
+from django.http import FileResponse, Http404
+from django.shortcuts import get_object_or_404
+from django.urls import path, reverse
+from django.utils.html import format_html
+from .models import (
+    Studio, Group, Pass, Teacher, Student, StudentVisit, Purchase, PaymentEvent, StudentBalance, ArchivedVisit,
+    ArchivedPurchase, Task, QueryPlan, ProfileTrace, touch_lessons,
+)
+from .pagination import EstimatedCountPaginator
+from . import payments, profiling, tenancy
+from .routers import ReplicaChangelistMixin
 
 
 class TeacherInline(admin.StackedInline):
@@ -16,22 +30,98 @@ class StudentInline(admin.StackedInline):
     verbose_name_plural = 'Student'
 
 
-class CustomUserAdmin(UserAdmin):
+class SuperuserOnlyMixin:
+    """ModelAdmin mixin for models that are not scoped to a studio: only superusers see or change them"""
+
+    def has_module_permission(self, request):
+        return request.user.is_superuser and super().has_module_permission(request)
+
+    def has_view_permission(self, request, obj=None):
+        return request.user.is_superuser and super().has_view_permission(request, obj)
+
+    def has_add_permission(self, request):
+        return request.user.is_superuser and super().has_add_permission(request)
+
+    def has_change_permission(self, request, obj=None):
+        return request.user.is_superuser and super().has_change_permission(request, obj)
+
+    def has_delete_permission(self, request, obj=None):
+        return request.user.is_superuser and super().has_delete_permission(request, obj)
+
+
+class CustomUserAdmin(SuperuserOnlyMixin, UserAdmin):
     inlines = (TeacherInline, StudentInline)
 
 
+class TeacherListFilter(admin.RelatedFieldListFilter):
+    """Related filter for Teacher that loads users in the same query"""
+
+    def field_choices(self, field, request, model_admin):
+        ordering = self.field_admin_ordering(field, request, model_admin)
+        teachers = Teacher.objects.select_related('user')
+        if ordering:
+            teachers = teachers.order_by(*ordering)
+        return [(teacher.pk, str(teacher)) for teacher in teachers]
+
+
+class PurchaseActionForm(ActionForm):
+    payment_method = forms.ChoiceField(
+        choices=[('', 'Payment method')] + Purchase.PAYMENT_METHODS, required=False
+    )
+    cashier = forms.ModelChoiceField(
+        queryset=Teacher.objects.select_related('user'), required=False, empty_label='Cashier'
+    )
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.fields['cashier'].queryset = tenancy.scoped(self.fields['cashier'].queryset)
+
+
+class StudentVisitActionForm(ActionForm):
+    target_group = forms.ModelChoiceField(
+        queryset=Group.objects.all(), required=False, empty_label='Move to group'
+    )
+    target_date = forms.DateField(
+        required=False, widget=forms.DateInput(attrs={'type': 'date'})
+    )
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.fields['target_group'].queryset = tenancy.scoped(self.fields['target_group'].queryset)
+
+
+def bound_action_form(model_admin, request):
+    """Bind the admin's action form to the POSTed action parameters"""
+    form = model_admin.action_form(request.POST)
+    form.fields['action'].choices = model_admin.get_action_choices(request)
+    form.is_valid()
+    return form
+
+
 # Re-register UserAdmin
 admin.site.unregister(User)
 admin.site.register(User, CustomUserAdmin)
 
 
+@admin.register(Studio)
+class StudioAdmin(SuperuserOnlyMixin, admin.ModelAdmin):
+    list_display = ['name', 'slug', 'hostname', 'created_at']
+    search_fields = ['name', 'slug', 'hostname']
+    prepopulated_fields = {'slug': ['name']}
+    filter_horizontal = ['members']
+
+
 @admin.register(Group)
 class GroupAdmin(admin.ModelAdmin):
-    list_display = ['name', 'start_at', 'finished_at', 'duration', 'get_teachers']
-    list_filter = ['finished_at', 'start_at', 'teachers']
+    list_display = ['name', 'start_at', 'finished_at', 'duration', 'duration_minutes', 'get_teachers']
+    list_filter = ['finished_at', 'start_at', ('teachers', TeacherListFilter)]
     search_fields = ['name', 'location']
     filter_horizontal = ['teachers']
     date_hierarchy = 'start_at'
+    show_full_result_count = False
+
+    def get_queryset(self, request):
+        return super().get_queryset(request).prefetch_related('teachers__user')
 
     def get_teachers(self, obj):
         return ", ".join([str(teacher) for teacher in obj.teachers.all()])
@@ -40,15 +130,22 @@ class GroupAdmin(admin.ModelAdmin):
 
 @admin.register(Pass)
 class PassAdmin(admin.ModelAdmin):
-    list_display = ['name', 'group', 'price', 'lessons_included', 'skips_included']
+    list_display = ['name', 'group', 'price', 'lessons_included', 'skips_included', 'valid_days']
     list_filter = ['group']
     search_fields = ['name', 'group__name']
+    list_select_related = ['group']
+    show_full_result_count = False
 
 
 @admin.register(Teacher)
 class TeacherAdmin(admin.ModelAdmin):
     list_display = ['__str__', 'user__email', 'get_groups']
     search_fields = ['user__first_name', 'user__last_name', 'user__username', 'user__email']
+    list_select_related = ['user']
+    show_full_result_count = False
+
+    def get_queryset(self, request):
+        return super().get_queryset(request).prefetch_related('groups')
 
     def get_groups(self, obj):
         return ", ".join([group.name for group in obj.groups.all()])
@@ -61,6 +158,11 @@ class StudentAdmin(admin.ModelAdmin):
     list_filter = ['groups']
     search_fields = ['user__first_name', 'user__last_name', 'user__username', 'user__email', 'phone']
     filter_horizontal = ['groups']
+    list_select_related = ['user']
+    show_full_result_count = False
+
+    def get_queryset(self, request):
+        return super().get_queryset(request).prefetch_related('groups')
 
     def get_groups(self, obj):
         return ", ".join([group.name for group in obj.groups.all()])
@@ -68,21 +170,248 @@ class StudentAdmin(admin.ModelAdmin):
 
 
 @admin.register(StudentVisit)
-class StudentVisitAdmin(admin.ModelAdmin):
+class StudentVisitAdmin(ReplicaChangelistMixin, admin.ModelAdmin):
     list_display = ['student', 'group', 'date', 'skipped']
     list_filter = ['group', 'skipped', 'date']
     search_fields = ['student__user__first_name', 'student__user__last_name', 'group__name']
     date_hierarchy = 'date'
+    list_select_related = ['student__user', 'group']
+    show_full_result_count = False
+    paginator = EstimatedCountPaginator
+    action_form = StudentVisitActionForm
+    actions = ['toggle_skipped', 'move_to_lesson']
+
+    def delete_queryset(self, request, queryset):
+        # A queryset delete sends no per-row signals, so bump the lessons here as the bulk actions do
+        with transaction.atomic():
+            lessons = queryset.lessons()
+            super().delete_queryset(request, queryset)
+            touch_lessons(lessons)
+
+    @admin.action(description='Toggle skipped for selected visits')
+    def toggle_skipped(self, request, queryset):
+        updated = queryset.toggle_skipped()
+        self.message_user(request, f'Toggled skipped for {updated} visit(s).', messages.SUCCESS)
+
+    @admin.action(description='Move selected visits to another group/date')
+    def move_to_lesson(self, request, queryset):
+        form = bound_action_form(self, request)
+        group = form.cleaned_data.get('target_group')
+        lesson_date = form.cleaned_data.get('target_date')
+        if group is None or lesson_date is None:
+            self.message_user(request, 'Choose a target group and date.', messages.ERROR)
+            return
+
+        selected = queryset.count()
+        moved = queryset.move_to(group, lesson_date)
+        if moved == selected:
+            self.message_user(request, f'Moved {moved} visit(s).', messages.SUCCESS)
+        else:
+            self.message_user(
+                request,
+                f'Moved {moved} of {selected} visit(s); students already at the target lesson were skipped.',
+                messages.WARNING,
+            )
 
 
 @admin.register(Purchase)
-class PurchaseAdmin(admin.ModelAdmin):
-    list_display = ['student', 'dance_pass', 'created_at', 'paid_at', 'payment_method', 'cashier']
-    list_filter = ['payment_method', 'paid_at', 'dance_pass__group', 'cashier']
+class PurchaseAdmin(ReplicaChangelistMixin, admin.ModelAdmin):
+    list_display = ['student', 'dance_pass', 'created_at', 'paid_at', 'expires_at', 'payment_method', 'cashier']
+    list_filter = ['payment_method', 'paid_at', 'dance_pass__group', ('cashier', TeacherListFilter)]
     search_fields = ['student__user__first_name', 'student__user__last_name', 'dance_pass__name']
     date_hierarchy = 'created_at'
+    show_full_result_count = False
+    paginator = EstimatedCountPaginator
+    action_form = PurchaseActionForm
+    actions = ['mark_paid']
+
+    @admin.action(description='Mark selected purchases as paid')
+    def mark_paid(self, request, queryset):
+        form = bound_action_form(self, request)
+        payment_method = form.cleaned_data.get('payment_method')
+        if not payment_method:
+            self.message_user(request, 'Choose a payment method to mark purchases as paid.', messages.ERROR)
+            return
+
+        report = payments.mark_paid(
+            queryset.values_list('pk', flat=True), payment_method, cashier=form.cleaned_data.get('cashier')
+        )
+        self.message_user(request, f"Marked {report['updated']} purchase(s) as paid.", messages.SUCCESS)
+
+    def save_model(self, request, obj, form, change):
+        # Every edit that changes what the student owes goes through the payment event log
+        with transaction.atomic():
+            if change:
+                old = Purchase.objects.select_for_update(of=('self',)).select_related('dance_pass').get(pk=obj.pk)
+                if obj.dance_pass_id != old.dance_pass_id:
+                    obj.amount = obj.dance_pass.price
+            super().save_model(request, obj, form, change)
+            if change:
+                payments.record_events(payments.purchase_change_events(old, obj))
+            else:
+                payments.record_purchase(obj)
+
+    def delete_model(self, request, obj):
+        with transaction.atomic():
+            payments.void_purchases([obj])
+            super().delete_model(request, obj)
+
+    def delete_queryset(self, request, queryset):
+        with transaction.atomic():
+            payments.void_purchases(queryset.select_related('student__user', 'dance_pass__group'))
+            super().delete_queryset(request, queryset)
 
     def get_queryset(self, request):
         return super().get_queryset(request).select_related(
             'student__user', 'dance_pass__group', 'cashier__user'
         )
+
+
+@admin.register(PaymentEvent)
+class PaymentEventAdmin(ReplicaChangelistMixin, admin.ModelAdmin):
+    """Append-only: refunds and corrections are added as new events, never edited"""
+    list_display = ['created_at', 'student', 'kind', 'amount', 'purchase', 'payment_method', 'cashier']
+    list_filter = ['kind', 'payment_method']
+    search_fields = ['student__user__first_name', 'student__user__last_name', 'note']
+    list_select_related = ['student__user', 'purchase__dance_pass__group', 'cashier__user']
+    raw_id_fields = ['student', 'purchase', 'archived_purchase']
+    show_full_result_count = False
+    paginator = EstimatedCountPaginator
+
+    def has_change_permission(self, request, obj=None):
+        return False
+
+    def has_delete_permission(self, request, obj=None):
+        return False
+
+    def save_model(self, request, obj, form, change):
+        # Route through the log so the balance projection is updated too
+        payments.record_events([obj])
+
+
+@admin.register(StudentBalance)
+class StudentBalanceAdmin(ReplicaChangelistMixin, admin.ModelAdmin):
+    list_display = ['student', 'outstanding', 'last_event_id', 'updated_at']
+    search_fields = ['student__user__first_name', 'student__user__last_name']
+    list_select_related = ['student__user']
+    ordering = ['-outstanding']
+    show_full_result_count = False
+
+    def has_add_permission(self, request):
+        return False
+
+    def has_change_permission(self, request, obj=None):
+        return False
+
+
+class ArchiveAdmin(ReplicaChangelistMixin, admin.ModelAdmin):
+    """Archived history is read-only; archive.py is the only writer"""
+    show_full_result_count = False
+    paginator = EstimatedCountPaginator
+
+    def has_add_permission(self, request):
+        return False
+
+    def has_change_permission(self, request, obj=None):
+        return False
+
+
+@admin.register(ArchivedVisit)
+class ArchivedVisitAdmin(ArchiveAdmin):
+    list_display = ['student', 'group', 'date', 'skipped', 'archived_at']
+    list_filter = ['skipped', 'group']
+    search_fields = ['student__user__first_name', 'student__user__last_name', 'group__name']
+    list_select_related = ['student__user', 'group']
+    date_hierarchy = 'date'
+
+
+@admin.register(ArchivedPurchase)
+class ArchivedPurchaseAdmin(ArchiveAdmin):
+    list_display = ['student', 'dance_pass', 'created_at', 'paid_at', 'payment_method', 'archived_at']
+    list_filter = ['payment_method', 'dance_pass__group']
+    search_fields = ['student__user__first_name', 'student__user__last_name', 'dance_pass__name']
+    list_select_related = ['student__user', 'dance_pass__group']
+    date_hierarchy = 'created_at'
+
+
+@admin.register(Task)
+class TaskAdmin(SuperuserOnlyMixin, admin.ModelAdmin):
+    list_display = ['name', 'status', 'attempts', 'max_attempts', 'run_after', 'finished_at']
+    list_filter = ['status', 'name']
+    search_fields = ['name', 'idempotency_key']
+    readonly_fields = ['attempts', 'locked_until', 'last_error', 'created_at', 'finished_at']
+    show_full_result_count = False
+    paginator = EstimatedCountPaginator
+
+
+@admin.register(QueryPlan)
+class QueryPlanAdmin(SuperuserOnlyMixin, admin.ModelAdmin):
+    list_display = ['view_name', 'get_sql', 'duration_ms', 'vendor', 'captured_at']
+    list_filter = ['view_name', 'vendor']
+    search_fields = ['sql', 'view_name']
+    readonly_fields = ['view_name', 'sql', 'params_fingerprint', 'duration_ms', 'vendor', 'plan', 'captured_at']
+    show_full_result_count = False
+
+    def has_add_permission(self, request):
+        return False
+
+    def has_change_permission(self, request, obj=None):
+        return False
+
+    def get_sql(self, obj):
+        return obj.sql[:100]
+    get_sql.short_description = 'SQL'
+
+
+@admin.register(ProfileTrace)
+class ProfileTraceAdmin(SuperuserOnlyMixin, admin.ModelAdmin):
+    list_display = ['path', 'view_name', 'duration_ms', 'trigger', 'backend', 'captured_at']
+    list_filter = ['view_name', 'trigger', 'backend']
+    search_fields = ['path', 'view_name']
+    readonly_fields = [
+        'path', 'method', 'view_name', 'trigger', 'backend', 'duration_ms', 'captured_at',
+        'get_download', 'get_report',
+    ]
+    exclude = ['file_name']
+    show_full_result_count = False
+
+    def has_add_permission(self, request):
+        return False
+
+    def has_change_permission(self, request, obj=None):
+        return False
+
+    def get_urls(self):
+        return [
+            path(
+                '<int:trace_id>/download/',
+                self.admin_site.admin_view(self.download_view),
+                name='django_app_profiletrace_download',
+            ),
+        ] + super().get_urls()
+
+    def download_view(self, request, trace_id):
+        trace = get_object_or_404(ProfileTrace, pk=trace_id)
+        if not self.has_view_permission(request, trace):
+            raise PermissionDenied
+        trace_path = profiling.profile_dir() / trace.file_name
+        if not trace_path.exists():
+            raise Http404('Trace file is missing')
+        return FileResponse(open(trace_path, 'rb'), as_attachment=True, filename=trace.file_name)
+
+    def get_download(self, obj):
+        url = reverse('admin:django_app_profiletrace_download', args=[obj.pk])
+        return format_html('<a href="{}">{}</a>', url, obj.file_name)
+    get_download.short_description = 'Trace file'
+
+    def get_report(self, obj):
+        return format_html('<pre style="font-size: 12px">{}</pre>', profiling.report(obj))
+    get_report.short_description = 'Call tree (cumulative)'
+
+    def delete_model(self, request, obj):
+        profiling.delete_trace_files([obj])
+        super().delete_model(request, obj)
+
+    def delete_queryset(self, request, queryset):
+        profiling.delete_trace_files(queryset)
+        super().delete_queryset(request, queryset)
@@ -1,6 +1,18 @@
 from django.apps import AppConfig
+from django.db.models.signals import post_migrate
 
 
 class DjangoAppConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'django_app'
+
+    def ready(self):
+        from . import accounts, choices, instrumentation, roster, tenancy
+        # Importing these registers their tasks, also in workers that never load the views
+        from . import payroll, query_plans
+        accounts.install()
+        choices.install()
+        instrumentation.install()
+        roster.install()
+        tenancy.install()
+        post_migrate.connect(tenancy.ensure_default_studio, sender=self, dispatch_uid='tenancy_default_studio')
@@ -0,0 +1,94 @@
+"""Move attendance and purchase history of long-finished groups into archive tables.
+
+``StudentVisit`` and ``Purchase`` only serve current groups day to day, yet
+every finished season stays in them and in their indexes. ``archive_group``
+copies a finished group's visits and paid purchases into ``ArchivedVisit``
+and ``ArchivedPurchase`` (keeping the original ids) and deletes them from the
+hot tables, all in one transaction, so a group is either fully hot or fully
+archived. Unpaid purchases are debts and stay hot. Payment events keep their
+amounts and are pointed at the archived purchase before the hot one goes.
+
+Reports that cover history read both tables through ``visit_sources``.
+"""
+import logging
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import transaction
+from django.db.models import Exists, F, OuterRef, Q
+from django.utils import timezone
+
+from .models import ArchivedPurchase, ArchivedVisit, Group, Lesson, PaymentEvent, Purchase, StudentVisit
+
+logger = logging.getLogger(__name__)
+
+VISIT_FIELDS = ['id', 'student_id', 'group_id', 'date', 'skipped', 'notes']
+PURCHASE_FIELDS = [
+    'id', 'student_id', 'dance_pass_id', 'amount', 'created_at', 'paid_at', 'expires_at', 'payment_method',
+    'cashier_id', 'notes',
+]
+
+
+def default_cutoff():
+    """Groups that finished before this date are archived"""
+    return timezone.localdate() - timedelta(days=settings.ARCHIVE_AFTER_DAYS)
+
+
+def _archivable_purchases(group_id):
+    return Purchase.objects.filter(dance_pass__group_id=group_id, paid_at__isnull=False)
+
+
+def archivable_groups(cutoff=None):
+    """Groups finished before the cutoff that still have rows in the hot tables"""
+    cutoff = cutoff or default_cutoff()
+    return Group.objects.filter(finished_at__lt=cutoff).filter(
+        Q(Exists(StudentVisit.objects.filter(group=OuterRef('pk'))))
+        | Q(Exists(Purchase.objects.filter(dance_pass__group=OuterRef('pk'), paid_at__isnull=False)))
+    ).order_by('finished_at', 'pk')
+
+
+def _copy(source, target, fields, batch_size):
+    """Copy rows into an archive table in batches; rows already archived are skipped"""
+    rows = source.order_by('pk').values(*fields)
+    batch = []
+    for row in rows.iterator(chunk_size=batch_size):
+        batch.append(target(**row))
+        if len(batch) >= batch_size:
+            target.objects.bulk_create(batch, ignore_conflicts=True)
+            batch = []
+    if batch:
+        target.objects.bulk_create(batch, ignore_conflicts=True)
+
+
+def archive_group(group_id, batch_size=1000):
+    """Move one finished group's visits and paid purchases to the archive; returns (visits, purchases)"""
+    with transaction.atomic():
+        visits = StudentVisit.objects.filter(group_id=group_id)
+        purchases = _archivable_purchases(group_id)
+        _copy(visits, ArchivedVisit, VISIT_FIELDS, batch_size)
+        _copy(purchases, ArchivedPurchase, PURCHASE_FIELDS, batch_size)
+        # Deleting the purchases clears PaymentEvent.purchase; keep the link through the archive
+        PaymentEvent.objects.filter(purchase__in=purchases).update(archived_purchase_id=F('purchase_id'))
+        _, visit_counts = visits.delete()
+        _, purchase_counts = purchases.delete()
+        # Readers of both tables (payroll) key their caches on the lesson versions
+        Lesson.objects.filter(group_id=group_id).update(version=F('version') + 1, updated_at=timezone.now())
+    moved_visits = visit_counts.get(StudentVisit._meta.label, 0)
+    moved_purchases = purchase_counts.get(Purchase._meta.label, 0)
+    logger.info("Archived group %s: %s visit(s), %s purchase(s)", group_id, moved_visits, moved_purchases)
+    return moved_visits, moved_purchases
+
+
+def archive_history(cutoff=None, limit=None, batch_size=1000):
+    """Archive groups finished before the cutoff, oldest first; at most `limit` groups per run"""
+    group_ids = list(archivable_groups(cutoff).values_list('pk', flat=True)[:limit])
+    totals = [0, 0]
+    for group_id in group_ids:
+        for index, moved in enumerate(archive_group(group_id, batch_size)):
+            totals[index] += moved
+    return len(group_ids), totals[0], totals[1]
+
+
+def visit_sources():
+    """Managers of every table holding visits, hot first; union their querysets to read all history"""
+    return [StudentVisit.objects, ArchivedVisit.objects]
@@ -0,0 +1,122 @@
+"""Concurrency-safe attendance saves.
+
+Attendance for a lesson is a mapping ``{student_id: skipped}``; students
+missing from the mapping did not attend. The attendance form carries the
+lesson version and the state the teacher started from, so a save that
+raced with another teacher is merged student by student instead of the last
+writer silently replacing everything.
+"""
+import random
+import time
+
+from django.db import OperationalError, transaction
+from django.db.models import F
+from django.utils import timezone
+
+from . import metrics
+from .models import Lesson, StudentVisit
+
+LOCK_ERRORS = ('database is locked', 'deadlock detected', 'could not serialize')
+
+
+def is_lock_error(error):
+    return isinstance(error, OperationalError) and any(message in str(error) for message in LOCK_ERRORS)
+
+
+class AttendanceResult:
+    """Outcome of a save: the new lesson version and students left in conflict"""
+
+    def __init__(self, version, conflicts, changed):
+        self.version = version
+        self.conflicts = conflicts
+        self.changed = changed
+
+
+def attendance_state(attended_ids, skipped_ids):
+    """Build a {student_id: skipped} mapping from submitted id lists"""
+    skipped_ids = {int(student_id) for student_id in skipped_ids}
+    return {int(student_id): int(student_id) in skipped_ids for student_id in attended_ids}
+
+
+def merge(base, mine, theirs):
+    """Three-way merge per student.
+
+    Changes I made on top of ``base`` win when the other writer left that
+    student alone; students both writers changed differently are conflicts
+    and keep the stored state. Returns ``(merged, conflicting_student_ids)``.
+    """
+    merged = dict(theirs)
+    conflicts = []
+    for student_id in set(base) | set(mine) | set(theirs):
+        original, ours, stored = base.get(student_id), mine.get(student_id), theirs.get(student_id)
+        if ours == original or ours == stored:
+            continue
+        if stored == original:
+            if ours is None:
+                merged.pop(student_id, None)
+            else:
+                merged[student_id] = ours
+        else:
+            conflicts.append(student_id)
+    return merged, sorted(conflicts)
+
+
+def save_attendance(group, lesson_date, mine, base=None, version=None, retries=3, backoff=0.05):
+    """Save attendance for one lesson, retrying with backoff on lock contention.
+
+    Without ``base``/``version`` (or when nobody saved since the form was
+    loaded) the submitted state replaces the stored one.
+    """
+    for attempt in range(retries + 1):
+        try:
+            return _save_attendance(group, lesson_date, mine, base, version)
+        except OperationalError as error:
+            # A lock error on the last attempt is counted as failed by the request middleware
+            if attempt == retries or not is_lock_error(error):
+                raise
+            metrics.inc(metrics.DB_LOCK_ERRORS, view='save_attendance', outcome='retried')
+            time.sleep(backoff * (2 ** attempt) * (1 + random.random()))
+
+
+def _save_attendance(group, lesson_date, mine, base, version):
+    visits = StudentVisit.objects.filter(group=group, date=lesson_date)
+
+    # Keep the write transaction short: lock the lesson, diff, write, bump the version
+    with transaction.atomic():
+        lesson, _ = Lesson.objects.select_for_update().get_or_create(group=group, date=lesson_date)
+        theirs = dict(visits.values_list('student_id', 'skipped'))
+
+        if base is None or version == lesson.version:
+            merged, conflicts = mine, []
+        else:
+            merged, conflicts = merge(base, mine, theirs)
+
+        removed = [student_id for student_id in theirs if student_id not in merged]
+        added = [student_id for student_id in merged if student_id not in theirs]
+        flipped = [
+            student_id for student_id in merged
+            if student_id in theirs and merged[student_id] != theirs[student_id]
+        ]
+
+        if removed:
+            visits.filter(student_id__in=removed).delete()
+        if added:
+            StudentVisit.objects.bulk_create([
+                StudentVisit(student_id=student_id, group=group, date=lesson_date, skipped=merged[student_id])
+                for student_id in added
+            ])
+        for skipped in (True, False):
+            ids = [student_id for student_id in flipped if merged[student_id] is skipped]
+            if ids:
+                visits.filter(student_id__in=ids).update(skipped=skipped)
+
+        changed = bool(removed or added or flipped)
+        if changed:
+            Lesson.objects.filter(pk=lesson.pk).update(version=F('version') + 1, updated_at=timezone.now())
+            lesson.version += 1
+
+    return AttendanceResult(lesson.version, conflicts, changed)
+
+
+def current_version(group, lesson_date):
+    return Lesson.objects.filter(group=group, date=lesson_date).values_list('version', flat=True).first() or 0
@@ -0,0 +1,141 @@
+"""Cheap model choice fields for forms.
+
+``label_queryset`` narrows a choice queryset to the columns the option label
+(the model's ``__str__``) reads, joined with ``select_related``, so listing
+choices is one query instead of one per option.
+
+``CachedModelChoiceIterator`` goes further and serves the ``(value, label)``
+pairs from the cache. The key holds a version stamp for the choice model and
+every model its label reads (e.g. ``User`` for students); saving or deleting
+any of them replaces the stamp, so stale choices are never read again.
+Validating a submitted value still queries the database. The stamps only
+reach every process through a shared cache, so choices are cached for
+``CHOICES_CACHE_SECONDS``, which is 0 (off) unless ``SHARED_CACHE`` is set.
+"""
+import hashlib
+import uuid
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import transaction
+from django.db.models.signals import post_delete, post_save
+from django.forms.models import ModelChoiceIterator, ModelChoiceIteratorValue
+
+from . import metrics
+from .models import Group, Pass, Student, Teacher
+
+# Fields each model's __str__ reads
+LABEL_FIELDS = {
+    Group: ('name', 'start_at'),
+    Pass: ('name', 'price', 'group__name'),
+    Student: ('user__first_name', 'user__last_name', 'user__username'),
+    Teacher: ('user__first_name', 'user__last_name', 'user__username'),
+}
+
+
+def _relations(model):
+    return {field.rsplit('__', 1)[0] for field in LABEL_FIELDS.get(model, ()) if '__' in field}
+
+
+def label_models(model):
+    """The model and the related models its label reads"""
+    return [model, *(model._meta.get_field(name).related_model for name in sorted(_relations(model)))]
+
+
+def label_queryset(queryset):
+    """Restrict a choice queryset to what the option labels need"""
+    fields = LABEL_FIELDS.get(queryset.model)
+    if fields is None:
+        return queryset
+    return queryset.select_related(*_relations(queryset.model)).only(*fields)
+
+
+def version_key(model):
+    return f'choices:{model._meta.label_lower}:version'
+
+
+def versions(models):
+    """Current version stamps of the given models, starting a new one where the cache has none"""
+    keys = [version_key(model) for model in models]
+    stamps = cache.get_many(keys)
+    for key in keys:
+        if key not in stamps:
+            stamp = uuid.uuid4().hex
+            # Another process may have started one in the meantime; use theirs
+            stamps[key] = stamp if cache.add(key, stamp, None) else cache.get(key, stamp)
+    return [stamps[key] for key in keys]
+
+
+def choices_key(field):
+    queryset = field.queryset
+    digest = hashlib.md5(f'{type(field).__qualname__}:{queryset.query}'.encode()).hexdigest()
+    stamps = ':'.join(versions(label_models(queryset.model)))
+    return f'choices:{queryset.model._meta.label_lower}:{stamps}:{digest}'
+
+
+def field_choices(field):
+    return [(field.prepare_value(obj), field.label_from_instance(obj)) for obj in field.queryset]
+
+
+def cached_choices(field):
+    """``(value, label)`` pairs for a ModelChoiceField, from the cache while no label model changed"""
+    if field.queryset.query.is_empty():
+        return []
+    if not settings.CHOICES_CACHE_SECONDS:
+        return field_choices(field)
+    key = choices_key(field)
+    choices = cache.get(key)
+    metrics.record_cache_access('choices', choices is not None)
+    if choices is None:
+        choices = field_choices(field)
+        cache.set(key, choices, settings.CHOICES_CACHE_SECONDS)
+    return choices
+
+
+class CachedModelChoiceIterator(ModelChoiceIterator):
+    """ModelChoiceIterator yielding cached choices instead of querying for each render"""
+
+    def __init__(self, field):
+        super().__init__(field)
+        self._choices = None
+
+    def choices(self):
+        if self._choices is None:
+            self._choices = cached_choices(self.field)
+        return self._choices
+
+    def __iter__(self):
+        if self.field.empty_label is not None:
+            yield ('', self.field.empty_label)
+        for value, label in self.choices():
+            yield ModelChoiceIteratorValue(value, None), label
+
+    def __len__(self):
+        return len(self.choices()) + (self.field.empty_label is not None)
+
+    def __bool__(self):
+        return self.field.empty_label is not None or bool(self.choices())
+
+
+def invalidate(*models):
+    """Drop cached choices that list or label with these models (for bulk writes that send no signals)"""
+    keys = [version_key(model) for model in models]
+    cache.delete_many(keys)
+    # Again once committed, in case another process cached the old rows under a new stamp meanwhile
+    transaction.on_commit(lambda: cache.delete_many(keys))
+
+
+def _label_model_changed(sender, update_fields=None, **kwargs):
+    # Logging in saves last_login only, which no label reads
+    if update_fields and set(update_fields) <= {'last_login'}:
+        return
+    invalidate(sender)
+
+
+def install():
+    """Connect the version stamp signals (called from AppConfig.ready)"""
+    models = {model for choice_model in LABEL_FIELDS for model in label_models(choice_model)}
+    for model in models:
+        label = model._meta.label_lower
+        post_save.connect(_label_model_changed, sender=model, dispatch_uid=f'choices_saved_{label}')
+        post_delete.connect(_label_model_changed, sender=model, dispatch_uid=f'choices_deleted_{label}')
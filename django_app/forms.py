@@ -1,15 +1,39 @@
 from django import forms
 from django.contrib.auth.models import User
 from django.forms import formset_factory
-from .models import Group, Pass, Student, Teacher, Purchase, StudentVisit
+from .models import Group, Student, Purchase, StudentVisit, parse_duration_minutes
+from . import choices, schedule, tenancy
 
 
-class GroupForm(forms.ModelForm):
+class StudioScopedMixin:
+    """Limit model choices to the current studio and render them from the choices cache.
+
+    Querysets declared on the class are built at import, so they are scoped
+    here, per form, and narrowed to the columns the option labels read.
+    """
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        for field in self.fields.values():
+            if isinstance(field, forms.ModelChoiceField):
+                # Set before the queryset, which hands the widget its choices iterator
+                field.iterator = choices.CachedModelChoiceIterator
+                field.queryset = choices.label_queryset(tenancy.scoped(field.queryset))
+
+
+class GroupForm(StudioScopedMixin, forms.ModelForm):
+    allow_conflicts = forms.BooleanField(
+        required=False, label='Save despite schedule conflicts',
+        help_text="Teachers or the location are double-booked on purpose",
+    )
+
     class Meta:
         model = Group
         fields = ['name', 'schedule', 'duration', 'start_at', 'finished_at', 'location', 'teachers']
         widgets = {
-            'schedule': forms.TextInput(attrs={'placeholder': '[{"day": "tue", "time": "19:30"}, {"day": "thu", "time": "20:30"}]'}),
+            'schedule': forms.TextInput(attrs={
+                'placeholder': '[{"day": "tue", "time": "19:30"}, {"day": "thu", "time": "20:30"}]',
+            }),
             'start_at': forms.DateInput(attrs={'type': 'date'}),
             'finished_at': forms.DateInput(attrs={'type': 'date'}),
             'location': forms.Textarea(attrs={'rows': 3}),
@@ -41,8 +65,30 @@ class GroupForm(forms.ModelForm):
         except json.JSONDecodeError:
             raise forms.ValidationError("Schedule must be valid JSON")
 
+    def clean(self):
+        cleaned_data = super().clean()
+        # Unreadable durations are reported by Group.clean()
+        minutes = parse_duration_minutes(cleaned_data.get('duration'), default=None)
+        if self.errors or minutes is None or cleaned_data.get('allow_conflicts'):
+            return cleaned_data
+
+        # Reject double-booked teachers or locations unless explicitly allowed
+        slots = schedule.group_slots(
+            self.instance.pk, cleaned_data.get('name'), cleaned_data.get('schedule'),
+            minutes, cleaned_data.get('location'),
+            cleaned_data.get('start_at'), cleaned_data.get('finished_at'),
+            [teacher.pk for teacher in cleaned_data.get('teachers') or []],
+        )
+        conflicts = schedule.conflicts_for(slots, exclude_group_id=self.instance.pk)
+        if conflicts:
+            names = schedule.teacher_names(conflicts)
+            raise forms.ValidationError([
+                schedule.describe(conflict, names, group_id=self.instance.pk) for conflict in conflicts
+            ])
+        return cleaned_data
+
 
-class StudentForm(forms.ModelForm):
+class StudentForm(StudioScopedMixin, forms.ModelForm):
     first_name = forms.CharField(max_length=30)
     last_name = forms.CharField(max_length=30)
     email = forms.EmailField()
@@ -91,7 +137,7 @@ class StudentForm(forms.ModelForm):
         return student
 
 
-class PurchaseForm(forms.ModelForm):
+class PurchaseForm(StudioScopedMixin, forms.ModelForm):
     class Meta:
         model = Purchase
         fields = ['dance_pass', 'payment_method', 'notes']
@@ -102,10 +148,11 @@ class PurchaseForm(forms.ModelForm):
     def __init__(self, *args, **kwargs):
         super().__init__(*args, **kwargs)
         # Only show active groups' passes
-        self.fields['dance_pass'].queryset = Pass.objects.filter(group__finished_at__isnull=True)
+        field = self.fields['dance_pass']
+        field.queryset = field.queryset.filter(group__finished_at__isnull=True)
 
 
-class StudentVisitForm(forms.ModelForm):
+class StudentVisitForm(StudioScopedMixin, forms.ModelForm):
     class Meta:
         model = StudentVisit
         fields = ['student', 'skipped']
@@ -118,7 +165,7 @@ class StudentVisitForm(forms.ModelForm):
 StudentVisitFormSet = formset_factory(StudentVisitForm, extra=0)
 
 
-class StudentSelectionForm(forms.Form):
+class StudentSelectionForm(StudioScopedMixin, forms.Form):
     student = forms.ModelChoiceField(queryset=Student.objects.all(), empty_label="Select a student")
 
 
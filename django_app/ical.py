@@ -0,0 +1,205 @@
+"""iCalendar (.ics) lesson feeds per teacher and per group.
+
+Each ``Group.schedule`` entry becomes one weekly recurring VEVENT (RRULE)
+starting at the first matching day on or after ``start_at`` and ending at
+``finished_at``, so a feed stays a few lines long however many lessons it
+covers. Lesson times are local, so the feed carries a VTIMEZONE describing
+``TIME_ZONE`` with this year's offset rules. Calendar apps cannot log in, so
+feed URLs carry a signed token. The ETag is derived from the groups' fields,
+letting polling clients get a 304 after a single narrow query; DTSTAMP is
+the time the feed was generated.
+"""
+import calendar
+import functools
+import hashlib
+from datetime import datetime, time, timedelta
+from zoneinfo import ZoneInfo
+
+from django.conf import settings
+from django.core import signing
+from django.core.cache import cache
+from django.utils import timezone
+from django.utils.crypto import constant_time_compare
+
+from . import metrics, tenancy
+from .schedule import WEEKDAYS
+
+UTC = ZoneInfo('UTC')
+BYDAY_CODES = ['MO', 'TU', 'WE', 'TH', 'FR', 'SA', 'SU']
+
+FEED_FIELDS = ['id', 'name', 'schedule', 'duration_minutes', 'start_at', 'finished_at', 'location']
+PRODID = '-//Dancelog CRM//Lessons//EN'
+CACHE_TIMEOUT = 24 * 60 * 60
+
+_signer = signing.Signer(salt='django_app.ical')
+
+
+def feed_token(kind, pk):
+    """Token that authorises a calendar client to read one feed"""
+    return _signer.signature(f'{kind}:{pk}')
+
+
+def check_token(kind, pk, token):
+    return bool(token) and constant_time_compare(feed_token(kind, pk), token)
+
+
+def _escape(value):
+    return (
+        str(value).replace('\\', '\\\\').replace(';', '\\;').replace(',', '\\,')
+        .replace('\r\n', '\\n').replace('\n', '\\n')
+    )
+
+
+def _fold(line):
+    """Fold content lines longer than 75 octets (RFC 5545, section 3.1)"""
+    encoded = line.encode()
+    if len(encoded) <= 75:
+        return line
+    parts = []
+    while encoded:
+        limit = 75 if not parts else 74
+        cut = min(limit, len(encoded))
+        # Never split a UTF-8 sequence
+        while cut < len(encoded) and (encoded[cut] & 0xC0) == 0x80:
+            cut -= 1
+        parts.append(encoded[:cut].decode())
+        encoded = encoded[cut:]
+    return '\r\n '.join(parts)
+
+
+def _events(group, tz, stamp):
+    lines = []
+    for entry in group['schedule']:
+        weekday = WEEKDAYS.get(entry.get('day'))
+        try:
+            starts = datetime.strptime(entry.get('time', ''), '%H:%M').time()
+        except ValueError:
+            continue
+        if weekday is None:
+            continue
+
+        first = group['start_at'] + timedelta(days=(weekday - group['start_at'].weekday()) % 7)
+        start = datetime.combine(first, starts)
+        end = start + timedelta(minutes=group['duration_minutes'])
+        rule = f"FREQ=WEEKLY;BYDAY={entry['day'][:2].upper()}"
+        if group['finished_at']:
+            if group['finished_at'] < first:
+                continue
+            # UNTIL must be in UTC when DTSTART carries a TZID
+            until = datetime.combine(group['finished_at'], time(23, 59, 59), tzinfo=tz).astimezone(UTC)
+            rule += f";UNTIL={until:%Y%m%dT%H%M%SZ}"
+
+        lines += [
+            'BEGIN:VEVENT',
+            f"UID:group-{group['id']}-{entry['day']}-{starts:%H%M}@dancelog",
+            f'DTSTAMP:{stamp}',
+            f'DTSTART;TZID={tz.key}:{start:%Y%m%dT%H%M%S}',
+            f'DTEND;TZID={tz.key}:{end:%Y%m%dT%H%M%S}',
+            f'RRULE:{rule}',
+            f"SUMMARY:{_escape(group['name'])}",
+            f"LOCATION:{_escape(group['location'])}",
+            'END:VEVENT',
+        ]
+    return lines
+
+
+def _utc_offset(delta):
+    sign = '-' if delta < timedelta(0) else '+'
+    minutes, seconds = divmod(int(abs(delta).total_seconds()), 60)
+    return f"{sign}{minutes // 60:02d}{minutes % 60:02d}{f'{seconds:02d}' if seconds else ''}"
+
+
+@functools.lru_cache(maxsize=32)
+def _transitions(key, year):
+    """(UTC instant, offset before, offset after) of each UTC offset change of a zone in one year"""
+    tz = ZoneInfo(key)
+    changes = []
+    day, end = datetime(year, 1, 1, tzinfo=UTC), datetime(year + 1, 1, 1, tzinfo=UTC)
+    before = day.astimezone(tz).utcoffset()
+    while day < end:
+        after = (day + timedelta(days=1)).astimezone(tz).utcoffset()
+        if after != before:
+            moment = day
+            while moment.astimezone(tz).utcoffset() == before:
+                moment += timedelta(minutes=1)
+            changes.append((moment, before, after))
+            before = after
+        day += timedelta(days=1)
+    return changes
+
+
+def _nth_weekday(year, month, weekday, nth):
+    """Date of the nth (or, for -1, the last) given weekday of a month"""
+    days = calendar.monthrange(year, month)[1]
+    first = (weekday - calendar.weekday(year, month, 1)) % 7 + 1
+    day = first + 7 * (nth - 1) if nth > 0 else first + 7 * ((days - first) // 7)
+    return datetime(year, month, day)
+
+
+def _vtimezone(tz, year):
+    """VTIMEZONE for a zone, with yearly rules taken from the given year's offset changes"""
+    lines = ['BEGIN:VTIMEZONE', f'TZID:{tz.key}']
+    changes = _transitions(tz.key, year)
+    if not changes:
+        now = datetime(year, 1, 1, tzinfo=UTC).astimezone(tz)
+        return lines + [
+            'BEGIN:STANDARD', 'DTSTART:19700101T000000',
+            f'TZOFFSETFROM:{_utc_offset(now.utcoffset())}', f'TZOFFSETTO:{_utc_offset(now.utcoffset())}',
+            f'TZNAME:{now.tzname()}', 'END:STANDARD', 'END:VTIMEZONE',
+        ]
+
+    for moment, before, after in changes:
+        # Observances are written in the wall-clock time in force before the change
+        wall = (moment + before).replace(tzinfo=None)
+        nth = -1 if wall.day + 7 > calendar.monthrange(wall.year, wall.month)[1] else (wall.day - 1) // 7 + 1
+        first = datetime.combine(_nth_weekday(1970, wall.month, wall.weekday(), nth), wall.time())
+        local = moment.astimezone(tz)
+        kind = 'DAYLIGHT' if local.dst() else 'STANDARD'
+        lines += [
+            f'BEGIN:{kind}',
+            f'DTSTART:{first:%Y%m%dT%H%M%S}',
+            f'RRULE:FREQ=YEARLY;BYMONTH={wall.month};BYDAY={nth}{BYDAY_CODES[wall.weekday()]}',
+            f'TZOFFSETFROM:{_utc_offset(before)}',
+            f'TZOFFSETTO:{_utc_offset(after)}',
+            f'TZNAME:{local.tzname()}',
+            f'END:{kind}',
+        ]
+    return lines + ['END:VTIMEZONE']
+
+
+def etag_for(name, groups):
+    """Strong validator for a feed built from these group rows"""
+    digest = hashlib.sha1(repr((PRODID, settings.TIME_ZONE, name, groups)).encode()).hexdigest()
+    return f'"{digest}"'
+
+
+def render(name, groups):
+    """Full VCALENDAR document for a list of group value dicts"""
+    tz = ZoneInfo(settings.TIME_ZONE)
+    lines = [
+        'BEGIN:VCALENDAR',
+        'VERSION:2.0',
+        f'PRODID:{PRODID}',
+        'CALSCALE:GREGORIAN',
+        'METHOD:PUBLISH',
+        f'X-WR-CALNAME:{_escape(name)}',
+        f'X-WR-TIMEZONE:{tz.key}',
+    ]
+    now = timezone.now()
+    lines += _vtimezone(tz, now.year)
+    stamp = f'{now.astimezone(UTC):%Y%m%dT%H%M%SZ}'
+    for group in groups:
+        lines += _events(group, tz, stamp)
+    lines.append('END:VCALENDAR')
+    return '\r\n'.join(_fold(line) for line in lines) + '\r\n'
+
+
+def cached_render(name, groups, etag):
+    """Render a feed once per ETag; unchanged feeds are served from the cache"""
+    key = tenancy.cache_key(f'ical:{etag.strip(chr(34))}')
+    body = cache.get(key)
+    metrics.record_cache_access('ical', body is not None)
+    if body is None:
+        body = render(name, groups)
+        cache.set(key, body, CACHE_TIMEOUT)
+    return body
@@ -0,0 +1,159 @@
+"""Per-request SQL and template timing.
+
+A permanent ``execute_wrapper`` is attached to every database connection and
+records into the metrics of the current request, held in a context variable.
+Context variables follow the request into ``sync_to_async`` threads, so
+queries issued by async views are attributed correctly too. Templates are
+timed by the ``TimedDjangoTemplates`` backend configured in ``TEMPLATES``.
+"""
+import contextvars
+import heapq
+import re
+import time
+
+from django.db import connections
+from django.db.backends.signals import connection_created
+from django.template import TemplateDoesNotExist
+from django.template.backends.django import DjangoTemplates, Template, reraise
+
+current_metrics = contextvars.ContextVar('request_metrics', default=None)
+
+_STRING_LITERAL_RE = re.compile(r"'(?:[^']|'')*'")
+_NUMBER_RE = re.compile(r"\b\d+(?:\.\d+)?\b")
+_PLACEHOLDER_RE = re.compile(r"%s|\?")
+_IN_LIST_RE = re.compile(r"\bIN\s*\(\s*\?(?:\s*,\s*\?)*\s*\)", re.IGNORECASE)
+_WHITESPACE_RE = re.compile(r"\s+")
+
+
+def normalize_sql(sql):
+    """Collapse literals, parameters and IN lists so similar statements group together"""
+    sql = _STRING_LITERAL_RE.sub('?', sql)
+    sql = _NUMBER_RE.sub('?', sql)
+    sql = _PLACEHOLDER_RE.sub('?', sql)
+    sql = _IN_LIST_RE.sub('IN (...)', sql)
+    return _WHITESPACE_RE.sub(' ', sql).strip()
+
+
+class RequestMetrics:
+    """Counters collected while serving one request"""
+
+    def __init__(self, top_queries=5):
+        self.started = time.perf_counter()
+        self.top_queries = top_queries
+        self.query_count = 0
+        self.sql_time = 0.0
+        self.template_time = 0.0
+        self.template_depth = 0
+        self.total_time = 0.0
+        self.response_size = None
+        self.view_name = None
+        # Min-heap of (duration, sequence, alias, sql, params) for the slowest statements
+        self._slowest = []
+
+    def record_query(self, alias, sql, params, duration):
+        self.query_count += 1
+        self.sql_time += duration
+        if self.top_queries <= 0:
+            return
+        entry = (duration, self.query_count, alias, sql, params)
+        if len(self._slowest) < self.top_queries:
+            heapq.heappush(self._slowest, entry)
+        elif duration > self._slowest[0][0]:
+            heapq.heapreplace(self._slowest, entry)
+
+    def slowest_queries(self):
+        """Slowest statements first, as dicts with raw and normalized SQL"""
+        return [
+            {
+                'alias': alias,
+                'sql': sql,
+                'params': params,
+                'normalized': normalize_sql(sql),
+                'duration_ms': round(duration * 1000, 2),
+            }
+            for duration, _, alias, sql, params in sorted(self._slowest, key=lambda entry: -entry[0])
+        ]
+
+    def finish(self, response):
+        self.total_time = time.perf_counter() - self.started
+        if not getattr(response, 'streaming', False):
+            self.response_size = len(response.content)
+
+    def server_timing(self):
+        """Value for the Server-Timing response header"""
+        return ', '.join([
+            f'db;dur={self.sql_time * 1000:.1f};desc="{self.query_count} queries"',
+            f'tpl;dur={self.template_time * 1000:.1f}',
+            f'total;dur={self.total_time * 1000:.1f}',
+        ])
+
+    def as_dict(self):
+        return {
+            'view': self.view_name,
+            'duration_ms': round(self.total_time * 1000, 2),
+            'query_count': self.query_count,
+            'sql_ms': round(self.sql_time * 1000, 2),
+            'template_ms': round(self.template_time * 1000, 2),
+            'response_size': self.response_size,
+            'slowest_queries': [
+                {'sql': query['normalized'], 'duration_ms': query['duration_ms']}
+                for query in self.slowest_queries()
+            ],
+        }
+
+
+def record_execution(execute, sql, params, many, context):
+    """execute_wrapper hook: time the statement if a request is being measured"""
+    metrics = current_metrics.get()
+    if metrics is None:
+        return execute(sql, params, many, context)
+
+    started = time.perf_counter()
+    try:
+        return execute(sql, params, many, context)
+    finally:
+        metrics.record_query(context['connection'].alias, sql, params, time.perf_counter() - started)
+
+
+def install_query_wrapper(connection, **kwargs):
+    if record_execution not in connection.execute_wrappers:
+        connection.execute_wrappers.append(record_execution)
+
+
+class TimedTemplate(Template):
+    """Backend template whose renders add to the current request's template time"""
+
+    def render(self, context=None, request=None):
+        metrics = current_metrics.get()
+        if metrics is None:
+            return super().render(context, request)
+
+        # Only the outermost render counts; render_to_string from inside a template nests in it
+        metrics.template_depth += 1
+        started = time.perf_counter()
+        try:
+            return super().render(context, request)
+        finally:
+            metrics.template_depth -= 1
+            if metrics.template_depth == 0:
+                metrics.template_time += time.perf_counter() - started
+
+
+class TimedDjangoTemplates(DjangoTemplates):
+    """The Django template backend, with renders timed per request"""
+
+    def from_string(self, template_code):
+        return TimedTemplate(self.engine.from_string(template_code), self)
+
+    def get_template(self, template_name):
+        try:
+            return TimedTemplate(self.engine.get_template(template_name), self)
+        except TemplateDoesNotExist as exc:
+            reraise(exc, self)
+
+
+def install():
+    """Hook query timing into every database connection; safe to call more than once"""
+    connection_created.connect(install_query_wrapper, dispatch_uid='django_app.instrumentation')
+    for connection in connections.all(initialized_only=True):
+        install_query_wrapper(connection)
@@ -0,0 +1,224 @@
+"""Self-contained load generator for class-change traffic.
+
+Each virtual user is a seeded teacher (see ``manage.py seed_load_test``) that
+logs in, opens the dashboard and today's attendance screen, then waits at a
+barrier so every teacher posts attendance at the same moment, the way they
+do at 19:30. Run it against any local server (runserver, gunicorn, uvicorn)
+with ``manage.py load_test``.
+
+``--scenario login`` measures the login path instead: every virtual user logs
+in from a fresh cookie jar and then makes a series of authenticated requests,
+so password hashing, session and user lookups show up in the report.
+"""
+import http.cookiejar
+import math
+import re
+import threading
+import time
+import urllib.error
+import urllib.parse
+import urllib.request
+from collections import defaultdict
+
+TEACHER_USERNAME = 'loadtest-teacher-{}'
+SESSION_COOKIE = 'sessionid'
+STUDENT_ID_RE = re.compile(r'name="students"\s+value="(\d+)"')
+
+
+def percentile(sorted_values, p):
+    """Nearest-rank percentile of an already sorted list"""
+    if not sorted_values:
+        return 0.0
+    rank = max(1, math.ceil(p / 100 * len(sorted_values)))
+    return sorted_values[rank - 1]
+
+
+class Results:
+    """Thread-safe collection of request timings and errors per step"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.timings = defaultdict(list)
+        self.errors = defaultdict(int)
+        self.server_errors = 0
+        self.started = time.perf_counter()
+        self.finished = None
+
+    def record(self, step, duration, status, failed=False):
+        """Record one request; 4xx and 5xx responses and failed checks (e.g. a rejected login) are errors"""
+        with self._lock:
+            self.timings[step].append(duration)
+            if failed or status >= 400:
+                self.errors[step] += 1
+            if status >= 500:
+                self.server_errors += 1
+
+    def summary(self):
+        elapsed = (self.finished or time.perf_counter()) - self.started
+        total = sum(len(values) for values in self.timings.values())
+        steps = {}
+        for step, values in sorted(self.timings.items()):
+            values = sorted(values)
+            steps[step] = {
+                'requests': len(values),
+                'errors': self.errors[step],
+                'p50_ms': round(percentile(values, 50) * 1000, 1),
+                'p95_ms': round(percentile(values, 95) * 1000, 1),
+                'p99_ms': round(percentile(values, 99) * 1000, 1),
+            }
+        return {
+            'requests': total,
+            'errors': sum(self.errors.values()),
+            'server_errors': self.server_errors,
+            'elapsed_s': round(elapsed, 2),
+            'throughput_rps': round(total / elapsed, 1) if elapsed else 0.0,
+            'steps': steps,
+        }
+
+
+class Client:
+    """Minimal cookie-aware HTTP client that handles Django's CSRF token"""
+
+    def __init__(self, base_url, results, timeout=30):
+        self.base_url = base_url.rstrip('/')
+        self.results = results
+        self.timeout = timeout
+        self.cookies = http.cookiejar.CookieJar()
+        self.opener = urllib.request.build_opener(urllib.request.HTTPCookieProcessor(self.cookies))
+
+    def csrf_token(self):
+        for cookie in self.cookies:
+            if cookie.name == 'csrftoken':
+                return cookie.value
+        return ''
+
+    def has_session(self):
+        return any(cookie.name == SESSION_COOKIE for cookie in self.cookies)
+
+    def request(self, step, path, data=None, check=None):
+        """Make a request and record it; ``check(status, final_url)`` can fail a response that looks fine"""
+        url = self.base_url + path
+        final_url = url
+        body = None
+        headers = {}
+        if data is not None:
+            data = dict(data, csrfmiddlewaretoken=self.csrf_token())
+            body = urllib.parse.urlencode(data, doseq=True).encode()
+            headers['Referer'] = url
+        started = time.perf_counter()
+        try:
+            with self.opener.open(urllib.request.Request(url, body, headers), timeout=self.timeout) as response:
+                content = response.read()
+                status = response.status
+                final_url = response.geturl()
+        except urllib.error.HTTPError as error:
+            content = error.read()
+            status = error.code
+        except OSError:
+            content, status = b'', 599
+        failed = check is not None and status < 400 and not check(status, final_url)
+        self.results.record(step, time.perf_counter() - started, status, failed=failed)
+        return status, content
+
+
+def log_in(client, username, password):
+    """Log in through the login form; it only counts as a success if Django let the user in"""
+    def logged_in(status, final_url):
+        # A rejected login re-renders the form with 200; a good one redirects away and sets the session cookie
+        return urllib.parse.urlsplit(final_url).path != '/login/' or client.has_session()
+
+    client.request('login_page', '/login/')
+    client.request('login', '/login/', {'username': username, 'password': password}, check=logged_in)
+
+
+class ClassChangeScenario:
+    """Teacher opens attendance for today's lesson and saves it with everyone else"""
+
+    def __init__(self, client, teacher_number, password, group_id, lesson_date):
+        self.client = client
+        self.username = TEACHER_USERNAME.format(teacher_number)
+        self.password = password
+        self.group_id = group_id
+        self.lesson_date = lesson_date
+
+    def login(self):
+        log_in(self.client, self.username, self.password)
+
+    def open_attendance(self):
+        self.client.request('dashboard', '/')
+        _, content = self.client.request('lesson_detail', self.lesson_path())
+        return STUDENT_ID_RE.findall(content.decode(errors='replace'))
+
+    def save_attendance(self, student_ids):
+        # Mark everyone present, every third student as skipped
+        self.client.request('save_attendance', self.lesson_path(), {
+            'students': student_ids,
+            'skipped': student_ids[::3],
+        })
+
+    def lesson_path(self):
+        return f'/lesson/{self.group_id}/{self.lesson_date}/'
+
+
+class LoginScenario:
+    """Teacher logs in from a new browser, then keeps using the app while logged in"""
+
+    def __init__(self, client, teacher_number, password):
+        self.client = client
+        self.username = TEACHER_USERNAME.format(teacher_number)
+        self.password = password
+
+    def login(self):
+        log_in(self.client, self.username, self.password)
+
+    def browse(self):
+        self.client.request('authenticated', '/')
+
+
+def _run_threads(target, args_list):
+    threads = [threading.Thread(target=target, args=args, daemon=True) for args in args_list]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+
+def run(base_url, teachers, iterations=1, password='loadtest', lesson_date=None, timeout=30):
+    """Run the class-change scenario with one thread per (teacher number, group id) pair"""
+    lesson_date = lesson_date or time.strftime('%Y-%m-%d')
+    results = Results()
+    barrier = threading.Barrier(len(teachers))
+
+    def virtual_user(teacher_number, group_id):
+        scenario = ClassChangeScenario(
+            Client(base_url, results, timeout=timeout), teacher_number, password, group_id, lesson_date
+        )
+        scenario.login()
+        for _ in range(iterations):
+            student_ids = scenario.open_attendance()
+            try:
+                barrier.wait(timeout=timeout)
+            except threading.BrokenBarrierError:
+                pass
+            scenario.save_attendance(student_ids)
+
+    _run_threads(virtual_user, teachers)
+    results.finished = time.perf_counter()
+    return results.summary()
+
+
+def run_login(base_url, teacher_numbers, iterations=1, requests=10, password='loadtest', timeout=30):
+    """Log each teacher in ``iterations`` times, each time followed by ``requests`` authenticated pages"""
+    results = Results()
+
+    def virtual_user(teacher_number):
+        for _ in range(iterations):
+            # A fresh cookie jar, so every login does the full password check and creates a session
+            scenario = LoginScenario(Client(base_url, results, timeout=timeout), teacher_number, password)
+            scenario.login()
+            for _ in range(requests):
+                scenario.browse()
+
+    _run_threads(virtual_user, [(number,) for number in teacher_numbers])
+    results.finished = time.perf_counter()
+    return results.summary()
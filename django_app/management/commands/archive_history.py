@@ -0,0 +1,34 @@
+from datetime import date
+
+from django.core.management.base import BaseCommand, CommandError
+
+from django_app import archive
+
+
+class Command(BaseCommand):
+    help = "Move visits and paid purchases of long-finished groups into the archive tables"
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--before', type=date.fromisoformat,
+            help="Archive groups finished before this date (YYYY-MM-DD); default ARCHIVE_AFTER_DAYS ago",
+        )
+        parser.add_argument('--limit', type=int, help="Archive at most this many groups in this run")
+        parser.add_argument('--batch-size', type=int, default=1000, help="Rows copied per INSERT")
+        parser.add_argument('--dry-run', action='store_true', help="Only list the groups that would be archived")
+
+    def handle(self, *args, **options):
+        if options['limit'] is not None and options['limit'] < 1:
+            raise CommandError("--limit must be at least 1.")
+
+        if options['dry_run']:
+            groups = archive.archivable_groups(options['before'])[:options['limit']]
+            for group in groups:
+                self.stdout.write(f"{group} (finished {group.finished_at})")
+            self.stdout.write(f"{len(groups)} group(s) to archive.")
+            return
+
+        groups, visits, purchases = archive.archive_history(
+            options['before'], limit=options['limit'], batch_size=options['batch_size']
+        )
+        self.stdout.write(f"Archived {groups} group(s): {visits} visit(s), {purchases} purchase(s).")
@@ -0,0 +1,24 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from django_app import routers, schedule, tenancy
+from django_app.models import Studio
+
+
+class Command(BaseCommand):
+    help = "Report teachers and locations that are double-booked across running groups, per studio"
+
+    def handle(self, *args, **options):
+        studios = list(Studio.objects.order_by('pk'))
+        total = 0
+        for studio in studios:
+            # Locations are only comparable within a studio
+            with routers.use_replica(), tenancy.use_studio(studio):
+                conflicts = schedule.studio_conflicts()
+                names = schedule.teacher_names(conflicts)
+            for conflict in conflicts:
+                line = schedule.describe(conflict, names)
+                self.stdout.write(f"{studio}: {line}" if len(studios) > 1 else line)
+            total += len(conflicts)
+        if total:
+            raise CommandError(f"{total} schedule conflict(s) found.")
+        self.stdout.write("No schedule conflicts.")
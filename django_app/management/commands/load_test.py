@@ -0,0 +1,66 @@
+import json
+
+from django.core.management.base import BaseCommand, CommandError
+
+from django_app import loadtest
+from django_app.models import Teacher
+
+
+class Command(BaseCommand):
+    help = (
+        "Simulate class-change or login traffic against a running server (seed with seed_load_test first)"
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--base-url', default='http://127.0.0.1:8000')
+        parser.add_argument('--scenario', choices=['class_change', 'login'], default='class_change')
+        parser.add_argument('--users', type=int, default=15, help="Concurrent teachers")
+        parser.add_argument('--iterations', type=int, default=1, help="Attendance saves (or logins) per teacher")
+        parser.add_argument('--requests', type=int, default=10, help="Authenticated requests after each login")
+        parser.add_argument('--password', default='loadtest')
+        parser.add_argument('--date', help="Lesson date (YYYY-MM-DD), defaults to today")
+        parser.add_argument('--timeout', type=float, default=30)
+        parser.add_argument('--json', action='store_true', help="Print the report as JSON")
+
+    def handle(self, *args, **options):
+        teachers = []
+        for number in range(1, options['users'] + 1):
+            teacher = Teacher.objects.filter(
+                user__username=loadtest.TEACHER_USERNAME.format(number)
+            ).prefetch_related('groups').first()
+            if teacher is None or not teacher.groups.all():
+                raise CommandError(f"Teacher {number} is not seeded; run seed_load_test --teachers {options['users']}")
+            teachers.append((number, teacher.groups.all()[0].id))
+
+        if options['scenario'] == 'login':
+            summary = loadtest.run_login(
+                options['base_url'], [number for number, _ in teachers],
+                iterations=options['iterations'],
+                requests=options['requests'],
+                password=options['password'],
+                timeout=options['timeout'],
+            )
+        else:
+            summary = loadtest.run(
+                options['base_url'], teachers,
+                iterations=options['iterations'],
+                password=options['password'],
+                lesson_date=options['date'],
+                timeout=options['timeout'],
+            )
+
+        if options['json']:
+            self.stdout.write(json.dumps(summary, indent=2))
+            return
+
+        self.stdout.write(
+            f"{summary['requests']} requests in {summary['elapsed_s']}s "
+            f"({summary['throughput_rps']} req/s), {summary['errors']} error(s), "
+            f"{summary['server_errors']} server error(s)"
+        )
+        self.stdout.write(f"{'step':<18}{'requests':>10}{'errors':>8}{'p50 ms':>10}{'p95 ms':>10}{'p99 ms':>10}")
+        for step, stats in summary['steps'].items():
+            self.stdout.write(
+                f"{step:<18}{stats['requests']:>10}{stats['errors']:>8}"
+                f"{stats['p50_ms']:>10}{stats['p95_ms']:>10}{stats['p99_ms']:>10}"
+            )
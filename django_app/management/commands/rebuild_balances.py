@@ -0,0 +1,28 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from django_app import payments
+from django_app.models import PaymentEvent
+
+
+class Command(BaseCommand):
+    help = "Rebuild student balances from the payment event log"
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--check', action='store_true',
+            help="Only report balances that differ from the log; exit with an error if any do",
+        )
+
+    def handle(self, *args, **options):
+        if options['check']:
+            # Compare against the primary; a lagging replica would report drift that is not there
+            drift = payments.balance_drift()
+            for student_id, (stored, expected) in sorted(drift.items()):
+                self.stdout.write(f"Student {student_id}: stored {stored}, log says {expected}")
+            if drift:
+                raise CommandError(f"{len(drift)} balance(s) differ from the payment log.")
+            self.stdout.write("All balances match the payment log.")
+            return
+
+        rebuilt = payments.rebuild_balances()
+        self.stdout.write(f"Rebuilt {rebuilt} balance(s) from {PaymentEvent.objects.count()} event(s).")
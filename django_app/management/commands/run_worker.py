@@ -0,0 +1,77 @@
+import threading
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connections
+
+from django_app import tasks
+
+
+class Command(BaseCommand):
+    help = "Run background tasks from the Task queue"
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--concurrency', type=int, default=getattr(settings, 'TASK_WORKER_CONCURRENCY', 1),
+            help="Number of worker threads/processes",
+        )
+        parser.add_argument(
+            '--pool', choices=['thread', 'process'], default=getattr(settings, 'TASK_WORKER_POOL', 'thread'),
+            help="Run workers in a thread pool or a process pool",
+        )
+        parser.add_argument(
+            '--poll-interval', type=float, default=getattr(settings, 'TASK_POLL_INTERVAL', 1.0),
+            help="Seconds to sleep when the queue is empty",
+        )
+        parser.add_argument(
+            '--once', action='store_true',
+            help="Exit once the queue is drained instead of polling forever",
+        )
+
+    def handle(self, *args, **options):
+        concurrency = options['concurrency']
+        if concurrency < 1:
+            raise CommandError("--concurrency must be at least 1")
+
+        if concurrency == 1:
+            processed = self.run_inline(options)
+        elif options['pool'] == 'thread':
+            processed = self.run_threads(concurrency, options)
+        else:
+            processed = self.run_processes(concurrency, options)
+
+        self.stdout.write(self.style.SUCCESS(f"Processed {processed} task(s)."))
+
+    def run_inline(self, options):
+        try:
+            return tasks.work(once=options['once'], poll_interval=options['poll_interval'])
+        except KeyboardInterrupt:
+            return 0
+
+    def run_threads(self, concurrency, options):
+        stop_event = threading.Event()
+        with ThreadPoolExecutor(max_workers=concurrency) as executor:
+            futures = [
+                executor.submit(tasks.work, options['once'], options['poll_interval'], stop_event)
+                for _ in range(concurrency)
+            ]
+            try:
+                return sum(future.result() for future in futures)
+            except KeyboardInterrupt:
+                stop_event.set()
+                return 0
+
+    def run_processes(self, concurrency, options):
+        # Children open their own connections; never share a socket across processes
+        connections.close_all()
+        with ProcessPoolExecutor(max_workers=concurrency) as executor:
+            futures = [
+                executor.submit(tasks.work_in_process, options['once'], options['poll_interval'])
+                for _ in range(concurrency)
+            ]
+            try:
+                return sum(future.result() for future in futures)
+            except KeyboardInterrupt:
+                executor.shutdown(cancel_futures=True)
+                return 0
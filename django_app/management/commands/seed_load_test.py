@@ -0,0 +1,67 @@
+from datetime import date
+
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand
+from django.db import transaction
+
+from django_app import choices
+from django_app.loadtest import TEACHER_USERNAME
+from django_app.models import Group, Teacher, Student, Studio
+
+
+class Command(BaseCommand):
+    help = "Create teachers, groups and students for manage.py load_test"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--teachers', type=int, default=15)
+        parser.add_argument('--students-per-group', type=int, default=20)
+        parser.add_argument('--password', default='loadtest')
+
+    @transaction.atomic
+    def handle(self, *args, **options):
+        schedule = [{'day': day, 'time': '19:30'} for day, _ in Group.DAYS_OF_WEEK]
+        created_students = 0
+
+        for number in range(1, options['teachers'] + 1):
+            username = TEACHER_USERNAME.format(number)
+            user, created = User.objects.get_or_create(
+                username=username, defaults={'first_name': 'Load', 'last_name': f'Teacher {number}'}
+            )
+            if created:
+                user.set_password(options['password'])
+                user.save(update_fields=['password'])
+            teacher, _ = Teacher.objects.get_or_create(user=user)
+
+            group, _ = Group.objects.get_or_create(
+                name=f'Load test group {number}',
+                defaults={
+                    'schedule': schedule,
+                    'duration': '90min',
+                    'start_at': date.today(),
+                    'location': 'Load test studio',
+                },
+            )
+            group.teachers.add(teacher)
+
+            missing = options['students_per_group'] - group.students.count()
+            if missing > 0:
+                existing = User.objects.filter(username__startswith=f'loadtest-student-{number}-').count()
+                users = User.objects.bulk_create([
+                    User(username=f'loadtest-student-{number}-{existing + n}', first_name='Load',
+                         last_name=f'Student {number}.{existing + n}')
+                    for n in range(missing)
+                ])
+                students = Student.objects.bulk_create([Student(user=user) for user in users])
+                Membership = Studio.members.through
+                Membership.objects.bulk_create([
+                    Membership(studio_id=student.studio_id, user_id=student.user_id) for student in students
+                ])
+                group.students.add(*students)
+                created_students += len(students)
+
+        # bulk_create sends no post_save, so add memberships above and tell the forms' choice cache here
+        choices.invalidate(User, Student)
+
+        self.stdout.write(self.style.SUCCESS(
+            f"Seeded {options['teachers']} teacher(s) with {created_students} new student(s)."
+        ))
@@ -0,0 +1,201 @@
+"""Prometheus metrics shared across worker processes.
+
+Samples live in a small SQLite file (``METRICS_DB_PATH``) that every worker
+process updates with upserts, so ``/metrics`` reports totals for the whole
+deployment rather than for whichever process served the scrape. Requests
+only add to in-memory counters; a process writes them to the file at most
+every ``METRICS_FLUSH_SECONDS``, when it serves a scrape, and on exit, so a
+scrape may lag other processes by that interval.
+"""
+import atexit
+import logging
+import os
+import sqlite3
+import threading
+import time
+from collections import defaultdict
+
+from django.conf import settings
+
+REQUEST_DURATION = 'dancelog_request_duration_seconds'
+REQUEST_QUERIES = 'dancelog_request_queries'
+ATTENDANCE_SAVES = 'dancelog_attendance_saves_total'
+PURCHASES = 'dancelog_purchases_total'
+CACHE_REQUESTS = 'dancelog_cache_requests_total'
+DB_LOCK_ERRORS = 'dancelog_db_lock_errors_total'
+
+DURATION_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+QUERY_BUCKETS = (1, 2, 5, 10, 20, 50, 100, 200, 500)
+
+FAMILIES = {
+    REQUEST_DURATION: ('histogram', 'Request latency by view.'),
+    REQUEST_QUERIES: ('histogram', 'SQL queries per request by view.'),
+    ATTENDANCE_SAVES: ('counter', 'Attendance forms saved.'),
+    PURCHASES: ('counter', 'Purchases logged.'),
+    CACHE_REQUESTS: ('counter', 'Cache lookups by cache and result (hit/miss).'),
+    DB_LOCK_ERRORS: ('counter', 'Database lock errors by view and outcome (retried/failed).'),
+}
+
+logger = logging.getLogger(__name__)
+
+_local = threading.local()
+
+# Increments not yet written, by file: {path: {(name, labels): amount}}
+_lock = threading.Lock()
+_pending = defaultdict(lambda: defaultdict(float))
+_pending_pid = os.getpid()
+_last_flush = time.monotonic()
+
+
+def _path():
+    return str(getattr(settings, 'METRICS_DB_PATH', 'metrics.sqlite3'))
+
+
+def _connection(path=None):
+    path = path or _path()
+    key = (os.getpid(), path)
+    # Never reuse a connection inherited across fork, or one for another file
+    if getattr(_local, 'key', None) != key:
+        conn = sqlite3.connect(path, timeout=5, isolation_level=None)
+        conn.execute("PRAGMA journal_mode=WAL")
+        conn.execute("PRAGMA synchronous=OFF")
+        conn.execute(
+            "CREATE TABLE IF NOT EXISTS samples ("
+            "name TEXT NOT NULL, labels TEXT NOT NULL, value REAL NOT NULL, "
+            "PRIMARY KEY (name, labels))"
+        )
+        _local.conn, _local.key = conn, key
+    return _local.conn
+
+
+def enabled():
+    return getattr(settings, 'METRICS_ENABLED', True)
+
+
+def _escape(value):
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+def _labels(labels):
+    return ','.join(f'{key}="{_escape(value)}"' for key, value in sorted(labels.items()))
+
+
+def _add(samples):
+    """Add (name, labels, amount) increments to this process's counters"""
+    global _pending_pid
+    if not enabled() or not samples:
+        return
+    with _lock:
+        if _pending_pid != os.getpid():
+            # Counters inherited across fork are the parent's to write
+            _pending.clear()
+            _pending_pid = os.getpid()
+        counters = _pending[_path()]
+        for name, labels, amount in samples:
+            counters[name, labels] += amount
+        due = time.monotonic() - _last_flush >= getattr(settings, 'METRICS_FLUSH_SECONDS', 10)
+    if due:
+        flush()
+
+
+def flush():
+    """Write this process's counters to the metrics file, one transaction per file"""
+    global _last_flush
+    with _lock:
+        if _pending_pid != os.getpid():
+            return
+        pending = {path: counters for path, counters in _pending.items() if counters}
+        _pending.clear()
+        _last_flush = time.monotonic()
+    for path, counters in pending.items():
+        try:
+            conn = _connection(path)
+            with conn:
+                conn.execute("BEGIN IMMEDIATE")
+                conn.executemany(
+                    "INSERT INTO samples (name, labels, value) VALUES (?, ?, ?) "
+                    "ON CONFLICT (name, labels) DO UPDATE SET value = value + excluded.value",
+                    [(name, labels, amount) for (name, labels), amount in counters.items()],
+                )
+        except sqlite3.Error:
+            # Losing samples is better than failing the request
+            logger.exception("Could not record metrics")
+
+
+atexit.register(flush)
+
+
+def _histogram_samples(name, buckets, value, labels):
+    # Every bucket is written (0 or 1) so the exposition always lists the full set
+    samples = [
+        (f'{name}_bucket', _labels({**labels, 'le': bound}), 1 if value <= bound else 0)
+        for bound in buckets
+    ]
+    samples.append((f'{name}_bucket', _labels({**labels, 'le': '+Inf'}), 1))
+    samples.append((f'{name}_sum', _labels(labels), value))
+    samples.append((f'{name}_count', _labels(labels), 1))
+    return samples
+
+
+def inc(name, amount=1, **labels):
+    _add([(name, _labels(labels), amount)])
+
+
+def observe_request(view, duration, query_count):
+    """Record one request in the latency and query-count histograms"""
+    labels = {'view': view}
+    _add(
+        _histogram_samples(REQUEST_DURATION, DURATION_BUCKETS, duration, labels)
+        + _histogram_samples(REQUEST_QUERIES, QUERY_BUCKETS, query_count, labels)
+    )
+
+
+def record_cache_access(cache_name, hit):
+    inc(CACHE_REQUESTS, cache=cache_name, result='hit' if hit else 'miss')
+
+
+def _format_value(value):
+    return str(int(value)) if float(value).is_integer() else repr(value)
+
+
+def _sample_sort_key(sample):
+    name, labels, _ = sample
+    parts = labels.split(',') if labels else []
+    other = ','.join(part for part in parts if not part.startswith('le='))
+    le = next((part[4:-1] for part in parts if part.startswith('le=')), None)
+    bound = float('inf') if le == '+Inf' else float(le) if le is not None else 0.0
+    # Buckets in ascending order, then _sum and _count, per label set
+    return (other, name.endswith('_sum'), name.endswith('_count'), bound)
+
+
+def render():
+    """Render all samples in the Prometheus text exposition format"""
+    flush()
+    rows = _connection().execute("SELECT name, labels, value FROM samples ORDER BY name, labels").fetchall()
+
+    by_family = defaultdict(list)
+    for name, labels, value in rows:
+        family = name
+        for suffix in ('_bucket', '_sum', '_count'):
+            if name.endswith(suffix) and name[:-len(suffix)] in FAMILIES:
+                family = name[:-len(suffix)]
+        by_family[family].append((name, labels, value))
+
+    lines = []
+    for family, samples in sorted(by_family.items()):
+        kind, help_text = FAMILIES.get(family, ('untyped', ''))
+        lines.append(f'# HELP {family} {help_text}')
+        lines.append(f'# TYPE {family} {kind}')
+        for name, labels, value in sorted(samples, key=_sample_sort_key):
+            label_part = f'{{{labels}}}' if labels else ''
+            lines.append(f'{name}{label_part} {_format_value(value)}')
+    return '\n'.join(lines) + '\n'
+
+
+def reset():
+    """Drop all samples (used by tests)"""
+    with _lock:
+        _pending.pop(_path(), None)
+    conn = _connection()
+    with conn:
+        conn.execute("DELETE FROM samples")
@@ -0,0 +1,157 @@
+import json
+import logging
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction, sync_to_async
+from django.conf import settings
+
+from . import metrics as prometheus
+from . import attendance, profiling, query_plans
+from .instrumentation import RequestMetrics, current_metrics
+
+logger = logging.getLogger('django_app.instrumentation')
+
+
+class RequestMetricsMiddleware:
+    """Measure queries, SQL time, template time and response size for each request.
+
+    Adds a ``Server-Timing`` header for staff (or anyone with DEBUG on) and
+    logs a JSON line when the request is slower than ``REQUEST_METRICS_SLOW_MS``
+    or runs more than ``REQUEST_METRICS_MAX_QUERIES`` queries. Works with DEBUG
+    off. ``request.user`` is read once the inner middleware has set it. Views
+    failing on a database lock are counted in ``dancelog_db_lock_errors_total``.
+    """
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        if iscoroutinefunction(self.get_response):
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+
+        metrics, token = self.start(request)
+        try:
+            response = self.get_response(request)
+        finally:
+            current_metrics.reset(token)
+        self.finish(request, response, metrics)
+        return response
+
+    async def __acall__(self, request):
+        metrics, token = self.start(request)
+        try:
+            response = await self.get_response(request)
+        finally:
+            current_metrics.reset(token)
+        # finish() writes metrics and may capture query plans; keep that off the event loop
+        await sync_to_async(self.finish)(request, response, metrics)
+        return response
+
+    def start(self, request):
+        metrics = RequestMetrics(top_queries=getattr(settings, 'REQUEST_METRICS_TOP_QUERIES', 5))
+        request.metrics = metrics
+        return metrics, current_metrics.set(metrics)
+
+    def process_exception(self, request, exception):
+        if attendance.is_lock_error(exception):
+            view_name = request.resolver_match.view_name if request.resolver_match else 'unmatched'
+            prometheus.inc(prometheus.DB_LOCK_ERRORS, view=view_name, outcome='failed')
+            logger.warning("Database lock error in %s: %s", view_name, exception)
+
+    def shows_timing(self, request):
+        # Timings reveal how much work a page does; keep them from anonymous and regular users
+        if settings.DEBUG:
+            return True
+        user = getattr(request, 'user', None)
+        return bool(user and user.is_staff)
+
+    def finish(self, request, response, metrics):
+        metrics.finish(response)
+        if request.resolver_match is not None:
+            metrics.view_name = request.resolver_match.view_name
+
+        if prometheus.enabled():
+            prometheus.observe_request(metrics.view_name or 'unmatched', metrics.total_time, metrics.query_count)
+
+        if getattr(settings, 'REQUEST_METRICS_SERVER_TIMING', True) and self.shows_timing(request):
+            response['Server-Timing'] = metrics.server_timing()
+
+        slow_ms = getattr(settings, 'REQUEST_METRICS_SLOW_MS', 500)
+        max_queries = getattr(settings, 'REQUEST_METRICS_MAX_QUERIES', 50)
+        if getattr(settings, 'SLOW_QUERY_EXPLAIN', True) and metrics.total_time * 1000 > slow_ms:
+            query_plans.sample_slow_queries(metrics)
+        if metrics.total_time * 1000 > slow_ms or metrics.query_count > max_queries:
+            record = metrics.as_dict()
+            record.update({
+                'event': 'slow_request',
+                'method': request.method,
+                'path': request.path,
+                'status': response.status_code,
+            })
+            logger.warning(json.dumps(record, default=str))
+
+
+class ProfilingMiddleware:
+    """Profile sampled or explicitly requested requests, see django_app.profiling.
+
+    Must come after AuthenticationMiddleware. Under ASGI, cProfile also sees
+    other coroutines running on the event loop; pyinstrument's async mode
+    attributes time to the profiled request only.
+    """
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        if iscoroutinefunction(self.get_response):
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+
+        is_staff = request.GET.get('profile') == '1' and request.user.is_staff
+        trigger = profiling.trigger_for(request, is_staff)
+        if trigger is None or not profiling.acquire():
+            return self.get_response(request)
+
+        profiler = profiling.Profiler(profiling.backend_name())
+        try:
+            profiler.start()
+            try:
+                response = self.get_response(request)
+            finally:
+                profiler.stop()
+        finally:
+            profiling.release()
+        self.save(request, profiler, trigger)
+        return response
+
+    async def __acall__(self, request):
+        is_staff = request.GET.get('profile') == '1' and (await request.auser()).is_staff
+        trigger = profiling.trigger_for(request, is_staff)
+        if trigger is None or not profiling.acquire():
+            return await self.get_response(request)
+
+        profiler = profiling.Profiler(profiling.backend_name(), async_mode=True)
+        try:
+            profiler.start()
+            try:
+                response = await self.get_response(request)
+            finally:
+                profiler.stop()
+        finally:
+            profiling.release()
+        await sync_to_async(self.save)(request, profiler, trigger)
+        return response
+
+    def save(self, request, profiler, trigger):
+        view_name = request.resolver_match.view_name if request.resolver_match else ''
+        try:
+            profiling.save_trace(profiler, request, view_name, trigger)
+        except Exception:
+            # A failed trace must never fail the request it was measuring
+            logger.exception("Could not save profile trace")
@@ -0,0 +1,29 @@
+# Generated by Django 5.2.18 on 2026-10-19 00:19
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('django_app', '0002_task'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='QueryPlan',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('view_name', models.CharField(blank=True, max_length=200)),
+                ('sql', models.TextField(help_text='Normalized statement')),
+                ('params_fingerprint', models.CharField(max_length=40)),
+                ('duration_ms', models.FloatField()),
+                ('vendor', models.CharField(max_length=20)),
+                ('plan', models.TextField()),
+                ('captured_at', models.DateTimeField(auto_now_add=True)),
+            ],
+            options={
+                'ordering': ['-captured_at'],
+            },
+        ),
+    ]
@@ -0,0 +1,30 @@
+# Generated by Django 5.2.18 on 2026-10-19 00:22
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('django_app', '0003_queryplan'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ProfileTrace',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('path', models.CharField(max_length=500)),
+                ('method', models.CharField(max_length=10)),
+                ('view_name', models.CharField(blank=True, max_length=200)),
+                ('trigger', models.CharField(help_text='header, param or sample', max_length=20)),
+                ('backend', models.CharField(max_length=20)),
+                ('duration_ms', models.FloatField()),
+                ('file_name', models.CharField(max_length=255)),
+                ('captured_at', models.DateTimeField(auto_now_add=True)),
+            ],
+            options={
+                'ordering': ['-captured_at'],
+            },
+        ),
+    ]
@@ -0,0 +1,28 @@
+# Generated by Django 5.2.18 on 2026-10-19 00:26
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('django_app', '0004_profiletrace'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='Lesson',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('date', models.DateField()),
+                ('version', models.PositiveIntegerField(default=0)),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+                ('group', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='lessons', to='django_app.group')),
+            ],
+            options={
+                'ordering': ['-date'],
+                'unique_together': {('group', 'date')},
+            },
+        ),
+    ]
@@ -0,0 +1,52 @@
+# Generated by Django 5.2.18 on 2026-10-19 00:37
+
+import django.db.models.deletion
+import django.utils.timezone
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('django_app', '0006_idempotencykey'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='purchase',
+            name='amount',
+            field=models.DecimalField(decimal_places=2, default=0, editable=False, help_text='Price charged, taken from the pass when the purchase is made', max_digits=10),
+            preserve_default=False,
+        ),
+        migrations.AlterField(
+            model_name='purchase',
+            name='dance_pass',
+            field=models.ForeignKey(on_delete=django.db.models.deletion.PROTECT, related_name='purchases', to='django_app.pass'),
+        ),
+        migrations.CreateModel(
+            name='StudentBalance',
+            fields=[
+                ('student', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, primary_key=True, related_name='balance', serialize=False, to='django_app.student')),
+                ('outstanding', models.DecimalField(decimal_places=2, default=0, max_digits=12)),
+                ('last_event_id', models.PositiveBigIntegerField(default=0, help_text='Newest event applied')),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+            ],
+        ),
+        migrations.CreateModel(
+            name='PaymentEvent',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('kind', models.CharField(choices=[('created', 'Purchase created'), ('paid', 'Paid'), ('refunded', 'Refunded'), ('adjusted', 'Adjusted'), ('voided', 'Purchase voided')], max_length=10)),
+                ('amount', models.DecimalField(decimal_places=2, help_text="Change to the student's outstanding balance", max_digits=10)),
+                ('payment_method', models.CharField(blank=True, choices=[('TBC', 'TBC Bank'), ('BOG', 'Bank of Georgia'), ('CASH', 'Cash')], max_length=10)),
+                ('note', models.TextField(blank=True)),
+                ('created_at', models.DateTimeField(default=django.utils.timezone.now)),
+                ('cashier', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='payment_events', to='django_app.teacher')),
+                ('purchase', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='payment_events', to='django_app.purchase')),
+                ('student', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='payment_events', to='django_app.student')),
+            ],
+            options={
+                'ordering': ['pk'],
+            },
+        ),
+    ]
@@ -0,0 +1,49 @@
+from django.db import migrations
+from django.db.models import Max, OuterRef, Subquery, Sum
+
+
+def backfill(apps, schema_editor):
+    """Charge existing purchases the current pass price, seed the payment log from them and project balances"""
+    Pass = apps.get_model('django_app', 'Pass')
+    Purchase = apps.get_model('django_app', 'Purchase')
+    PaymentEvent = apps.get_model('django_app', 'PaymentEvent')
+    StudentBalance = apps.get_model('django_app', 'StudentBalance')
+
+    Purchase.objects.update(amount=Subquery(Pass.objects.filter(pk=OuterRef('dance_pass_id')).values('price')[:1]))
+
+    events = []
+    purchases = Purchase.objects.order_by('pk').values_list(
+        'pk', 'student_id', 'amount', 'created_at', 'paid_at', 'payment_method', 'cashier_id'
+    )
+    for pk, student_id, amount, created_at, paid_at, payment_method, cashier_id in purchases.iterator():
+        events.append(PaymentEvent(
+            student_id=student_id, purchase_id=pk, kind='created', amount=amount,
+            cashier_id=cashier_id, created_at=created_at,
+        ))
+        if paid_at:
+            events.append(PaymentEvent(
+                student_id=student_id, purchase_id=pk, kind='paid', amount=-amount,
+                payment_method=payment_method, cashier_id=cashier_id, created_at=paid_at,
+            ))
+    PaymentEvent.objects.bulk_create(events, batch_size=1000)
+
+    totals = PaymentEvent.objects.order_by().values('student_id').annotate(
+        outstanding=Sum('amount'), last_event_id=Max('pk')
+    )
+    StudentBalance.objects.bulk_create([StudentBalance(**row) for row in totals], batch_size=1000)
+
+
+def clear(apps, schema_editor):
+    apps.get_model('django_app', 'StudentBalance').objects.all().delete()
+    apps.get_model('django_app', 'PaymentEvent').objects.all().delete()
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('django_app', '0007_paymentevent_studentbalance'),
+    ]
+
+    operations = [
+        migrations.RunPython(backfill, clear),
+    ]
@@ -0,0 +1,17 @@
+# Generated by Django 5.2.18 on 2026-10-19 00:39
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('django_app', '0008_backfill_payment_events'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='purchase',
+            index=models.Index(condition=models.Q(('paid_at__isnull', True)), fields=['student', 'created_at'], name='purchase_unpaid_idx'),
+        ),
+    ]
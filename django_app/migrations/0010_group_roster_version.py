@@ -0,0 +1,18 @@
+# Generated by Django 5.2.18 on 2026-10-19 00:41
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('django_app', '0009_purchase_unpaid_idx'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='group',
+            name='roster_version',
+            field=models.PositiveIntegerField(default=0, editable=False, help_text='Bumped when the student list changes, see roster.py'),
+        ),
+    ]
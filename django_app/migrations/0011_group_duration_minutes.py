@@ -0,0 +1,18 @@
+# Generated by Django 5.2.18 on 2026-10-19 00:49
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('django_app', '0010_group_roster_version'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='group',
+            name='duration_minutes',
+            field=models.PositiveIntegerField(default=60, editable=False, help_text='Lesson length parsed from duration, kept in sync on save'),
+        ),
+    ]
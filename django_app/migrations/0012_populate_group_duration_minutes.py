@@ -0,0 +1,39 @@
+import re
+
+from django.db import migrations
+
+# Frozen copy of models.parse_duration_minutes as of this migration
+DURATION_RE = re.compile(
+    r'^(?:(?P<hours>\d+(?:[.,]\d+)?)\s*(?:h|hr|hrs|hour|hours)\.?)?'
+    r'\s*(?:(?P<minutes>\d+)\s*(?:m|min|mins|minute|minutes)?\.?)?$'
+)
+CLOCK_RE = re.compile(r'^(?P<hours>\d+):(?P<minutes>[0-5]\d)$')
+
+
+def parse_duration_minutes(text, default=60):
+    text = (text or '').strip().lower()
+    match = CLOCK_RE.match(text) or DURATION_RE.match(text)
+    if not text or not match or not any(match.groupdict().values()):
+        return default
+    hours = float((match.group('hours') or '0').replace(',', '.'))
+    total = round(hours * 60) + int(match.group('minutes') or 0)
+    return total or default
+
+
+def populate(apps, schema_editor):
+    Group = apps.get_model('django_app', 'Group')
+    groups = list(Group.objects.only('pk', 'duration'))
+    for group in groups:
+        group.duration_minutes = parse_duration_minutes(group.duration)
+    Group.objects.bulk_update(groups, ['duration_minutes'], batch_size=500)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('django_app', '0011_group_duration_minutes'),
+    ]
+
+    operations = [
+        migrations.RunPython(populate, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,46 @@
+# Generated by Django 5.2.18 on 2026-10-19 00:56
+
+from datetime import timedelta
+
+from django.db import migrations, models
+
+
+def backfill_expires_at(apps, schema_editor):
+    """Purchases of passes with a validity window expire created_at + the pass's valid_days"""
+    Purchase = apps.get_model('django_app', 'Purchase')
+    purchases = Purchase.objects.filter(expires_at__isnull=True, dance_pass__valid_days__isnull=False).only(
+        'pk', 'created_at', 'dance_pass__valid_days'
+    ).select_related('dance_pass')
+    batch = []
+    for purchase in purchases.iterator(chunk_size=1000):
+        purchase.expires_at = purchase.created_at + timedelta(days=purchase.dance_pass.valid_days)
+        batch.append(purchase)
+        if len(batch) == 1000:
+            Purchase.objects.bulk_update(batch, ['expires_at'])
+            batch = []
+    Purchase.objects.bulk_update(batch, ['expires_at'])
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('django_app', '0012_populate_group_duration_minutes'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='pass',
+            name='valid_days',
+            field=models.PositiveIntegerField(blank=True, help_text='Days a purchase stays usable after it is made; empty means it never expires', null=True),
+        ),
+        migrations.AddField(
+            model_name='purchase',
+            name='expires_at',
+            field=models.DateTimeField(blank=True, editable=False, help_text="Set from the pass's valid_days when the purchase is made", null=True),
+        ),
+        migrations.RunPython(backfill_expires_at, migrations.RunPython.noop),
+        migrations.AddIndex(
+            model_name='purchase',
+            index=models.Index(condition=models.Q(('paid_at__isnull', False)), fields=['student', 'expires_at'], name='purchase_paid_expiry_idx'),
+        ),
+    ]
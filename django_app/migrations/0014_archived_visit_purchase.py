@@ -0,0 +1,53 @@
+# Generated by Django 5.2.18 on 2026-10-19 00:58
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('django_app', '0013_pass_validity_purchase_expiry'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ArchivedPurchase',
+            fields=[
+                ('id', models.BigIntegerField(primary_key=True, serialize=False)),
+                ('amount', models.DecimalField(decimal_places=2, max_digits=10)),
+                ('created_at', models.DateTimeField()),
+                ('paid_at', models.DateTimeField()),
+                ('expires_at', models.DateTimeField(blank=True, null=True)),
+                ('payment_method', models.CharField(blank=True, choices=[('TBC', 'TBC Bank'), ('BOG', 'Bank of Georgia'), ('CASH', 'Cash')], max_length=10)),
+                ('notes', models.TextField(blank=True)),
+                ('archived_at', models.DateTimeField(auto_now_add=True)),
+                ('cashier', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='+', to='django_app.teacher')),
+                ('dance_pass', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='archived_purchases', to='django_app.pass')),
+                ('student', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='archived_purchases', to='django_app.student')),
+            ],
+            options={
+                'ordering': ['-created_at'],
+            },
+        ),
+        migrations.CreateModel(
+            name='ArchivedVisit',
+            fields=[
+                ('id', models.BigIntegerField(primary_key=True, serialize=False)),
+                ('date', models.DateField()),
+                ('skipped', models.BooleanField(default=False)),
+                ('notes', models.TextField(blank=True)),
+                ('archived_at', models.DateTimeField(auto_now_add=True)),
+                ('group', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='archived_visits', to='django_app.group')),
+                ('student', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='archived_visits', to='django_app.student')),
+            ],
+            options={
+                'ordering': ['-date']
+            },
+        ),
+        migrations.AddField(
+            model_name='paymentevent',
+            name='archived_purchase',
+            field=models.ForeignKey(blank=True, help_text='Set when the purchase was moved to the archive', null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='payment_events', to='django_app.archivedpurchase'),
+        ),
+    ]
@@ -0,0 +1,99 @@
+# Generated by Django 5.2.18 on 2026-10-19 01:02
+
+import django.db.models.deletion
+import django_app.tenancy
+from django.conf import settings
+from django.core.management.color import no_style
+from django.db import migrations, models
+
+
+def create_default_studio(apps, schema_editor):
+    """Existing rows all belong to the default studio, which must exist before they point at it"""
+    Studio = apps.get_model('django_app', 'Studio')
+    Studio.objects.get_or_create(pk=settings.DEFAULT_STUDIO_ID, defaults={'name': 'Main studio', 'slug': 'main'})
+    # An explicit id does not advance PostgreSQL's sequence
+    for sql in schema_editor.connection.ops.sequence_reset_sql(no_style(), [Studio]):
+        schema_editor.execute(sql)
+
+
+def add_members(apps, schema_editor):
+    """Every existing user, like every existing row, belongs to the default studio"""
+    User = apps.get_model(*settings.AUTH_USER_MODEL.split('.'))
+    Membership = apps.get_model('django_app', 'Studio').members.through
+    Membership.objects.bulk_create([
+        Membership(studio_id=settings.DEFAULT_STUDIO_ID, user_id=user_id)
+        for user_id in User.objects.values_list('pk', flat=True).iterator()
+    ], batch_size=1000)
+
+
+def tenant_field(related_name):
+    return models.ForeignKey(
+        default=django_app.tenancy.default_studio_id, editable=False, on_delete=django.db.models.deletion.PROTECT,
+        related_name=related_name, to='django_app.studio',
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('django_app', '0014_archived_visit_purchase'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='Studio',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('name', models.CharField(max_length=100)),
+                ('slug', models.SlugField(unique=True)),
+                ('hostname', models.CharField(blank=True, help_text="Host name serving this studio, e.g. 'salsa.example.com'; unknown hosts get the default studio", max_length=255, null=True, unique=True)),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('members', models.ManyToManyField(blank=True, help_text="Users who may sign in on this studio's host (superusers may sign in everywhere)", related_name='studios', to=settings.AUTH_USER_MODEL)),
+            ],
+        ),
+        migrations.RunPython(create_default_studio, migrations.RunPython.noop),
+        migrations.AddField(model_name='group', name='studio', field=tenant_field('groups')),
+        migrations.AddField(model_name='pass', name='studio', field=tenant_field('passes')),
+        migrations.AddField(model_name='student', name='studio', field=tenant_field('students')),
+        migrations.AddField(model_name='teacher', name='studio', field=tenant_field('teachers')),
+        migrations.AddField(model_name='archivedpurchase', name='studio', field=tenant_field('archived_purchases')),
+        migrations.AddField(model_name='archivedvisit', name='studio', field=tenant_field('archived_visits')),
+        migrations.AddField(model_name='paymentevent', name='studio', field=tenant_field('payment_events')),
+        migrations.AddField(model_name='purchase', name='studio', field=tenant_field('purchases')),
+        migrations.AddField(model_name='studentbalance', name='studio', field=tenant_field('balances')),
+        migrations.AddField(model_name='studentvisit', name='studio', field=tenant_field('visits')),
+        migrations.AddIndex(
+            model_name='group',
+            index=models.Index(fields=['studio', 'finished_at', 'start_at'], name='group_active_range_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='pass',
+            index=models.Index(fields=['studio', 'group'], name='pass_studio_group_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='archivedpurchase',
+            index=models.Index(fields=['studio', 'created_at'], name='archived_purchase_studio_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='archivedvisit',
+            index=models.Index(fields=['studio', 'date', 'group'], name='archived_visit_studio_date_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='paymentevent',
+            index=models.Index(fields=['studio', 'created_at'], name='event_studio_created_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='purchase',
+            index=models.Index(fields=['studio', 'created_at'], name='purchase_studio_created_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='studentbalance',
+            index=models.Index(fields=['studio', 'outstanding'], name='balance_studio_outstanding_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='studentvisit',
+            index=models.Index(fields=['studio', 'date', 'group'], name='visit_studio_date_idx'),
+        ),
+        migrations.RunPython(add_members, migrations.RunPython.noop),
+    ]
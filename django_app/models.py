@@ -1,6 +1,72 @@
-from django.db import models
+import re
+from datetime import timedelta
+
+from django.db import models, transaction
+from django.db.models import Case, Count, F, Min, OuterRef, Q, Subquery, Sum, Value, When
+from django.db.models.functions import Coalesce, TruncDate
 from django.contrib.auth.models import User
+from django.core.exceptions import ObjectDoesNotExist, ValidationError
 from django.core.validators import MinValueValidator
+from django.utils import timezone
+
+from .tenancy import TenantManager, TenantModel, TenantQuerySet, default_studio_id
+
+
+DURATION_RE = re.compile(
+    r'^(?:(?P<hours>\d+(?:[.,]\d+)?)\s*(?:h|hr|hrs|hour|hours)\.?)?'
+    r'\s*(?:(?P<minutes>\d+)\s*(?:m|min|mins|minute|minutes)?\.?)?$'
+)
+CLOCK_RE = re.compile(r'^(?P<hours>\d+):(?P<minutes>[0-5]\d)$')
+
+
+def parse_duration_minutes(text, default=60):
+    """Minutes from durations such as '1hr', '90min', '1h30', '1.5 hours', '1:30' or '45'.
+
+    Returns ``default`` for text that cannot be parsed or is zero.
+    """
+    text = (text or '').strip().lower()
+    match = CLOCK_RE.match(text) or DURATION_RE.match(text)
+    if not text or not match or not any(match.groupdict().values()):
+        return default
+    hours = float((match.group('hours') or '0').replace(',', '.'))
+    total = round(hours * 60) + int(match.group('minutes') or 0)
+    return total or default
+
+
+class Studio(models.Model):
+    """A dance studio (tenant); see tenancy.py"""
+    name = models.CharField(max_length=100)
+    slug = models.SlugField(max_length=50, unique=True)
+    hostname = models.CharField(
+        max_length=255, unique=True, null=True, blank=True,
+        help_text="Host name serving this studio, e.g. 'salsa.example.com'; unknown hosts get the default studio",
+    )
+    created_at = models.DateTimeField(auto_now_add=True)
+    members = models.ManyToManyField(
+        User, related_name='studios', blank=True,
+        help_text="Users who may sign in on this studio's host (superusers may sign in everywhere)",
+    )
+
+    def __str__(self):
+        return self.name
+
+    def save(self, *args, **kwargs):
+        self.hostname = self.hostname.lower() if self.hostname else None
+        super().save(*args, **kwargs)
+
+
+def studio_field(related_name):
+    """Tenant foreign key; new rows default to the current studio (child rows copy their parent's)"""
+    return models.ForeignKey(
+        Studio, on_delete=models.PROTECT, related_name=related_name, default=default_studio_id, editable=False,
+    )
+
+
+class GroupQuerySet(TenantQuerySet):
+    def running_between(self, start, end=None):
+        """Groups whose [start_at, finished_at] date range overlaps [start, end]; served by group_active_range_idx"""
+        groups = self.filter(Q(finished_at__isnull=True) | Q(finished_at__gte=start))
+        return groups if end is None else groups.filter(start_at__lte=end)
 
 
 class Group(models.Model):
@@ -14,114 +80,313 @@ class Group(models.Model):
         ('sun', 'Sunday'),
     ]
 
+    studio = studio_field('groups')
     name = models.CharField(max_length=100)
     schedule = models.JSONField(help_text="List of schedule entries, each with 'day' and 'time' keys")
     duration = models.CharField(max_length=20, help_text="e.g., '1hr', '90min'")
+    duration_minutes = models.PositiveIntegerField(
+        default=60, editable=False, help_text="Lesson length parsed from duration, kept in sync on save"
+    )
     start_at = models.DateField()
     finished_at = models.DateField(null=True, blank=True)
     location = models.TextField(help_text="Location name and Google link")
     teachers = models.ManyToManyField('Teacher', related_name='groups', blank=True)
+    roster_version = models.PositiveIntegerField(
+        default=0, editable=False, help_text="Bumped when the student list changes, see roster.py"
+    )
+
+    objects = TenantManager.from_queryset(GroupQuerySet)()
 
     def __str__(self):
         return f"{self.name} ({self.start_at})"
 
+    def clean(self):
+        if parse_duration_minutes(self.duration, default=None) is None:
+            raise ValidationError({'duration': "Enter a duration such as '1hr', '90min', '1h30' or '1:30'"})
+
+    def save(self, *args, **kwargs):
+        # clean() rejects unreadable durations; saves that skip validation get the parser's default
+        self.duration_minutes = parse_duration_minutes(self.duration)
+        update_fields = kwargs.get('update_fields')
+        if update_fields is not None and 'duration' in update_fields:
+            kwargs['update_fields'] = {*update_fields, 'duration_minutes'}
+        super().save(*args, **kwargs)
+
     class Meta:
         ordering = ['start_at', 'name']
+        indexes = [
+            models.Index(fields=['studio', 'finished_at', 'start_at'], name='group_active_range_idx'),
+        ]
 
 
 class Pass(models.Model):
+    studio = studio_field('passes')
     price = models.DecimalField(max_digits=10, decimal_places=2, validators=[MinValueValidator(0)])
     group = models.ForeignKey(Group, on_delete=models.CASCADE, related_name='passes')
     lessons_included = models.PositiveIntegerField()
     skips_included = models.PositiveIntegerField(default=0)
+    valid_days = models.PositiveIntegerField(
+        null=True, blank=True, help_text="Days a purchase stays usable after it is made; empty means it never expires"
+    )
     name = models.CharField(max_length=100, help_text="e.g., '10-lesson pass', 'Monthly unlimited'")
 
+    objects = TenantManager()
+
     def __str__(self):
         return f"{self.name} - {self.group.name} (${self.price})"
 
+    def expiry(self, purchased_at):
+        """When a purchase of this pass made at purchased_at stops being usable (None: never)"""
+        return purchased_at + timedelta(days=self.valid_days) if self.valid_days is not None else None
+
     class Meta:
         verbose_name_plural = "Passes"
+        indexes = [
+            models.Index(fields=['studio', 'group'], name='pass_studio_group_idx'),
+        ]
 
 
 class Teacher(models.Model):
+    studio = studio_field('teachers')
     user = models.OneToOneField(User, on_delete=models.CASCADE)
 
+    objects = TenantManager()
+
     def __str__(self):
         return f"{self.user.first_name} {self.user.last_name}" if self.user.first_name else self.user.username
 
 
 class Student(models.Model):
+    studio = studio_field('students')
     user = models.OneToOneField(User, on_delete=models.CASCADE)
     groups = models.ManyToManyField(Group, related_name='students', blank=True)
     phone = models.CharField(max_length=20, blank=True)
     notes = models.TextField(blank=True)
 
+    objects = TenantManager()
+
     def __str__(self):
         return f"{self.user.first_name} {self.user.last_name}" if self.user.first_name else self.user.username
 
+    @property
+    def outstanding_balance(self):
+        """Amount owed, read from the StudentBalance projection"""
+        try:
+            return self.balance.outstanding
+        except ObjectDoesNotExist:
+            return 0
+
+    def _paid_purchases(self):
+        return self.purchases.filter(paid_at__isnull=False).unexpired().select_related(
+            'dance_pass__group'
+        ).with_visits_used()
+
     def get_active_passes(self):
-        """Get all active passes (with remaining lessons > 0)"""
-        from django.db.models import Sum, Count
-
-        purchases = self.purchases.filter(paid_at__isnull=False).select_related('dance_pass')
-        active_passes = []
-
-        for purchase in purchases:
-            # Count total visits for this pass
-            visits_used = StudentVisit.objects.filter(
-                student=self,
-                group=purchase.dance_pass.group,
-                date__gte=purchase.created_at,
-                skipped=False
-            ).count()
-
-            remaining = purchase.dance_pass.lessons_included - visits_used
-            if remaining > 0:
-                active_passes.append({
-                    'purchase': purchase,
-                    'pass': purchase.dance_pass,
-                    'remaining_lessons': remaining,
-                    'visits_used': visits_used
-                })
-
-        return active_passes
-
-
-class StudentVisit(models.Model):
+        """Get all active passes (not expired, with remaining lessons > 0)"""
+        return build_active_passes(self._paid_purchases())
+
+    async def aget_active_passes(self):
+        """Async version of get_active_passes()"""
+        return build_active_passes([purchase async for purchase in self._paid_purchases().aiterator()])
+
+
+def build_active_passes(purchases):
+    """Build active pass entries from purchases annotated with `visits_used`"""
+    active_passes = []
+
+    for purchase in purchases:
+        remaining = purchase.dance_pass.lessons_included - purchase.visits_used
+        if remaining > 0:
+            active_passes.append({
+                'purchase': purchase,
+                'pass': purchase.dance_pass,
+                'remaining_lessons': remaining,
+                'visits_used': purchase.visits_used
+            })
+
+    return active_passes
+
+
+def touch_lessons(lessons):
+    """Bump the version of each ``(group_id, date)`` lesson, so forms opened before a bulk change merge with it"""
+    if not lessons:
+        return
+    Lesson.objects.bulk_create(
+        [Lesson(group_id=group_id, date=date) for group_id, date in lessons], ignore_conflicts=True
+    )
+    match = Q()
+    for group_id, date in lessons:
+        match |= Q(group_id=group_id, date=date)
+    Lesson.objects.filter(match).update(version=F('version') + 1, updated_at=timezone.now())
+
+
+class StudentVisitQuerySet(TenantQuerySet):
+    def lessons(self):
+        """The ``(group_id, date)`` lessons these visits belong to"""
+        return set(self.order_by().values_list('group_id', 'date').distinct())
+
+    def toggle_skipped(self):
+        """Flip the skipped flag of every visit in one UPDATE, returning the row count"""
+        with transaction.atomic():
+            lessons = self.lessons()
+            updated = self.update(skipped=Case(
+                When(skipped=True, then=Value(False)),
+                default=Value(True),
+            ))
+            touch_lessons(lessons)
+        return updated
+
+    def move_to(self, group, date):
+        """Move visits to another group/date in one UPDATE.
+
+        Visits whose student already has a visit at the target lesson are left
+        in place. Returns the number of visits moved.
+        """
+        if self.exclude(studio_id=group.studio_id).exists():
+            raise ValueError("Visits can only be moved to a group of their own studio")
+        with transaction.atomic():
+            taken = StudentVisit.objects.filter(group=group, date=date).exclude(
+                pk__in=self.values('pk')
+            ).values('student_id')
+            # Keep a single visit per student so the move cannot collide with itself
+            movable = self.exclude(student_id__in=taken).order_by().values('student_id').annotate(
+                keep=Min('pk')
+            ).values('keep')
+            moving = StudentVisit.objects.filter(pk__in=movable)
+            lessons = moving.lessons()
+            moved = moving.update(group=group, date=date)
+            if moved:
+                touch_lessons(lessons | {(group.pk, date)})
+        return moved
+
+
+class StudentVisit(TenantModel):
+    studio_parent = 'group'
+
+    studio = studio_field('visits')
     student = models.ForeignKey(Student, on_delete=models.CASCADE, related_name='visits')
     group = models.ForeignKey(Group, on_delete=models.CASCADE, related_name='visits')
     date = models.DateField()
     skipped = models.BooleanField(default=False)
     notes = models.TextField(blank=True)
 
+    objects = TenantManager.from_queryset(StudentVisitQuerySet)()
+
     def __str__(self):
         status = "Skipped" if self.skipped else "Attended"
         return f"{self.student} - {self.group.name} on {self.date} ({status})"
 
+    def save(self, *args, **kwargs):
+        # Bulk writes bump their lessons themselves; single saves (e.g. in the admin) bump the old and new lesson
+        with transaction.atomic():
+            lessons = StudentVisit.objects.filter(pk=self.pk).lessons() if self.pk else set()
+            super().save(*args, **kwargs)
+            touch_lessons(lessons | {(self.group_id, self.date)})
+
+    def delete(self, *args, **kwargs):
+        with transaction.atomic():
+            deleted = super().delete(*args, **kwargs)
+            touch_lessons({(self.group_id, self.date)})
+        return deleted
+
     class Meta:
         ordering = ['-date']
         unique_together = ['student', 'group', 'date']
+        indexes = [
+            models.Index(fields=['studio', 'date', 'group'], name='visit_studio_date_idx'),
+        ]
 
 
-class Purchase(models.Model):
+class Lesson(models.Model):
+    """One occurrence of a group's class; its version guards concurrent attendance saves"""
+    group = models.ForeignKey(Group, on_delete=models.CASCADE, related_name='lessons')
+    date = models.DateField()
+    version = models.PositiveIntegerField(default=0)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    def __str__(self):
+        return f"{self.group.name} on {self.date} (v{self.version})"
+
+    class Meta:
+        ordering = ['-date']
+        unique_together = ['group', 'date']
+
+
+class PurchaseQuerySet(TenantQuerySet):
+    def unexpired(self, at=None):
+        """Purchases still within their pass's validity window at the given time (default: now)"""
+        return self.filter(Q(expires_at__isnull=True) | Q(expires_at__gt=at or timezone.now()))
+
+    def with_visits_used(self):
+        """Annotate each purchase with the number of attended visits since it was created"""
+        visits = StudentVisit.objects.filter(
+            student=OuterRef('student'),
+            group=OuterRef('dance_pass__group'),
+            date__gte=OuterRef('created_on'),
+            skipped=False
+        ).order_by().values('student').annotate(count=Count('pk')).values('count')
+        return self.annotate(created_on=TruncDate('created_at')).annotate(
+            visits_used=Coalesce(Subquery(visits), 0)
+        )
+
+    def _mark_paid(self, payment_method, cashier=None):
+        """Mark unpaid purchases as paid in one UPDATE, returning the row count (use payments.mark_paid)"""
+        changes = {'paid_at': timezone.now(), 'payment_method': payment_method}
+        if cashier is not None:
+            changes['cashier'] = cashier
+        return self.filter(paid_at__isnull=True).update(**changes)
+
+    def debtors(self):
+        """One row per student with unpaid purchases: total owed, oldest unpaid date and count, and the balance"""
+        return self.filter(paid_at__isnull=True).order_by().values(
+            'student_id', 'student__user__first_name', 'student__user__last_name', 'student__user__username',
+            'student__balance__outstanding',
+        ).annotate(
+            total_owed=Sum('amount'),
+            oldest_unpaid=Min('created_at'),
+            unpaid_count=Count('pk'),
+        )
+
+
+class Purchase(TenantModel):
+    studio_parent = 'student'
+
     PAYMENT_METHODS = [
         ('TBC', 'TBC Bank'),
         ('BOG', 'Bank of Georgia'),
         ('CASH', 'Cash'),
     ]
 
+    studio = studio_field('purchases')
     student = models.ForeignKey(Student, on_delete=models.CASCADE, related_name='purchases')
-    dance_pass = models.ForeignKey(Pass, on_delete=models.CASCADE, related_name='purchases')
+    # Purchases are deleted through the admin, which voids them in the payment log first
+    dance_pass = models.ForeignKey(Pass, on_delete=models.PROTECT, related_name='purchases')
+    amount = models.DecimalField(
+        max_digits=10, decimal_places=2, editable=False,
+        help_text="Price charged, taken from the pass when the purchase is made",
+    )
     created_at = models.DateTimeField(auto_now_add=True)
     paid_at = models.DateTimeField(null=True, blank=True)
+    expires_at = models.DateTimeField(
+        null=True, blank=True, editable=False, help_text="Set from the pass's valid_days when the purchase is made"
+    )
     payment_method = models.CharField(max_length=10, choices=PAYMENT_METHODS, blank=True)
     cashier = models.ForeignKey(Teacher, on_delete=models.SET_NULL, null=True, blank=True)
     notes = models.TextField(blank=True)
 
+    objects = TenantManager.from_queryset(PurchaseQuerySet)()
+
     def __str__(self):
         status = "Paid" if self.paid_at else "Unpaid"
         return f"{self.student} - {self.dance_pass.name} ({status})"
 
+    def save(self, *args, **kwargs):
+        if self._state.adding and self.expires_at is None:
+            self.expires_at = self.dance_pass.expiry(self.created_at or timezone.now())
+        if self.amount is None:
+            self.amount = self.dance_pass.price
+        super().save(*args, **kwargs)
+
     @property
     def pass_(self):
         """Alias for dance_pass to match the field name in the spec"""
@@ -129,3 +394,224 @@ class Purchase(models.Model):
 
     class Meta:
         ordering = ['-created_at']
+        indexes = [
+            models.Index(fields=['studio', 'created_at'], name='purchase_studio_created_idx'),
+            # Small index covering only unpaid purchases, for the debtors list
+            models.Index(
+                fields=['student', 'created_at'], name='purchase_unpaid_idx', condition=Q(paid_at__isnull=True)
+            ),
+            # Paid purchases per student by expiry, so a student's active-pass lookup skips expired history
+            models.Index(
+                fields=['student', 'expires_at'], name='purchase_paid_expiry_idx', condition=Q(paid_at__isnull=False)
+            ),
+        ]
+
+
+class PaymentEvent(TenantModel):
+    """Append-only log of what a student owes and pays; StudentBalance is projected from it"""
+    studio_parent = 'student'
+
+    KIND_CREATED = 'created'
+    KIND_PAID = 'paid'
+    KIND_REFUNDED = 'refunded'
+    KIND_ADJUSTED = 'adjusted'
+    KIND_VOIDED = 'voided'
+    KINDS = [
+        (KIND_CREATED, 'Purchase created'),
+        (KIND_PAID, 'Paid'),
+        (KIND_REFUNDED, 'Refunded'),
+        (KIND_ADJUSTED, 'Adjusted'),
+        (KIND_VOIDED, 'Purchase voided'),
+    ]
+
+    studio = studio_field('payment_events')
+    student = models.ForeignKey(Student, on_delete=models.CASCADE, related_name='payment_events')
+    purchase = models.ForeignKey(
+        Purchase, on_delete=models.SET_NULL, null=True, blank=True, related_name='payment_events'
+    )
+    archived_purchase = models.ForeignKey(
+        'ArchivedPurchase', on_delete=models.SET_NULL, null=True, blank=True, related_name='payment_events',
+        help_text="Set when the purchase was moved to the archive"
+    )
+    kind = models.CharField(max_length=10, choices=KINDS)
+    amount = models.DecimalField(
+        max_digits=10, decimal_places=2, help_text="Change to the student's outstanding balance"
+    )
+    payment_method = models.CharField(max_length=10, choices=Purchase.PAYMENT_METHODS, blank=True)
+    cashier = models.ForeignKey(
+        Teacher, on_delete=models.SET_NULL, null=True, blank=True, related_name='payment_events'
+    )
+    note = models.TextField(blank=True)
+    created_at = models.DateTimeField(default=timezone.now)
+
+    objects = TenantManager()
+
+    def __str__(self):
+        return f"{self.get_kind_display()} {self.amount} ({self.student})"
+
+    def save(self, *args, **kwargs):
+        if self.pk is not None:
+            raise ValueError("Payment events are append-only; record an adjustment instead")
+        super().save(*args, **kwargs)
+
+    def delete(self, *args, **kwargs):
+        raise ValueError("Payment events are append-only; record an adjustment instead")
+
+    class Meta:
+        ordering = ['pk']
+        indexes = [
+            models.Index(fields=['studio', 'created_at'], name='event_studio_created_idx'),
+        ]
+
+
+class StudentBalance(TenantModel):
+    """Outstanding balance per student, maintained from PaymentEvent (see manage.py rebuild_balances)"""
+    studio_parent = 'student'
+
+    studio = studio_field('balances')
+    student = models.OneToOneField(Student, on_delete=models.CASCADE, primary_key=True, related_name='balance')
+    outstanding = models.DecimalField(max_digits=12, decimal_places=2, default=0)
+    last_event_id = models.PositiveBigIntegerField(default=0, help_text="Newest event applied")
+    updated_at = models.DateTimeField(auto_now=True)
+
+    objects = TenantManager()
+
+    def __str__(self):
+        return f"{self.student}: {self.outstanding}"
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['studio', 'outstanding'], name='balance_studio_outstanding_idx'),
+        ]
+
+
+class ArchivedVisit(TenantModel):
+    """StudentVisit of a long-finished group, moved out of the hot table by archive.py (keeps the original id)"""
+    studio_parent = 'group'
+
+    id = models.BigIntegerField(primary_key=True)
+    studio = studio_field('archived_visits')
+    student = models.ForeignKey(Student, on_delete=models.CASCADE, related_name='archived_visits')
+    group = models.ForeignKey(Group, on_delete=models.CASCADE, related_name='archived_visits')
+    date = models.DateField()
+    skipped = models.BooleanField(default=False)
+    notes = models.TextField(blank=True)
+    archived_at = models.DateTimeField(auto_now_add=True)
+
+    objects = TenantManager()
+
+    def __str__(self):
+        status = "Skipped" if self.skipped else "Attended"
+        return f"{self.student} - {self.group.name} on {self.date} ({status}, archived)"
+
+    class Meta:
+        ordering = ['-date']
+        indexes = [
+            models.Index(fields=['studio', 'date', 'group'], name='archived_visit_studio_date_idx'),
+        ]
+
+
+class ArchivedPurchase(TenantModel):
+    """Paid Purchase of a long-finished group, moved out of the hot table by archive.py (keeps the original id)"""
+    studio_parent = 'student'
+
+    id = models.BigIntegerField(primary_key=True)
+    studio = studio_field('archived_purchases')
+    student = models.ForeignKey(Student, on_delete=models.CASCADE, related_name='archived_purchases')
+    dance_pass = models.ForeignKey(Pass, on_delete=models.CASCADE, related_name='archived_purchases')
+    amount = models.DecimalField(max_digits=10, decimal_places=2)
+    created_at = models.DateTimeField()
+    paid_at = models.DateTimeField()
+    expires_at = models.DateTimeField(null=True, blank=True)
+    payment_method = models.CharField(max_length=10, choices=Purchase.PAYMENT_METHODS, blank=True)
+    cashier = models.ForeignKey(Teacher, on_delete=models.SET_NULL, null=True, blank=True, related_name='+')
+    notes = models.TextField(blank=True)
+    archived_at = models.DateTimeField(auto_now_add=True)
+
+    objects = TenantManager()
+
+    def __str__(self):
+        return f"{self.student} - {self.dance_pass.name} (Paid, archived)"
+
+    class Meta:
+        ordering = ['-created_at']
+        indexes = [
+            models.Index(fields=['studio', 'created_at'], name='archived_purchase_studio_idx'),
+        ]
+
+
+class IdempotencyKey(models.Model):
+    """Result of a request that must not be applied twice when the client retries it"""
+    key = models.CharField(max_length=200, unique=True)
+    result = models.JSONField(default=dict, blank=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    def __str__(self):
+        return self.key
+
+
+class Task(models.Model):
+    STATUS_PENDING = 'pending'
+    STATUS_RUNNING = 'running'
+    STATUS_DONE = 'done'
+    STATUS_FAILED = 'failed'
+    STATUSES = [
+        (STATUS_PENDING, 'Pending'),
+        (STATUS_RUNNING, 'Running'),
+        (STATUS_DONE, 'Done'),
+        (STATUS_FAILED, 'Failed'),
+    ]
+
+    name = models.CharField(max_length=200, help_text="Registered task name, see django_app/tasks.py")
+    payload = models.JSONField(default=dict, blank=True)
+    status = models.CharField(max_length=10, choices=STATUSES, default=STATUS_PENDING)
+    idempotency_key = models.CharField(max_length=200, null=True, blank=True, unique=True)
+    attempts = models.PositiveIntegerField(default=0)
+    max_attempts = models.PositiveIntegerField(default=3)
+    run_after = models.DateTimeField(default=timezone.now)
+    locked_until = models.DateTimeField(null=True, blank=True)
+    last_error = models.TextField(blank=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+    finished_at = models.DateTimeField(null=True, blank=True)
+
+    def __str__(self):
+        return f"{self.name} #{self.pk} ({self.status})"
+
+    class Meta:
+        ordering = ['run_after']
+        indexes = [
+            models.Index(fields=['status', 'run_after'], name='task_status_run_after_idx'),
+        ]
+
+
+class QueryPlan(models.Model):
+    view_name = models.CharField(max_length=200, blank=True)
+    sql = models.TextField(help_text="Normalized statement")
+    params_fingerprint = models.CharField(max_length=40)
+    duration_ms = models.FloatField()
+    vendor = models.CharField(max_length=20)
+    plan = models.TextField()
+    captured_at = models.DateTimeField(auto_now_add=True)
+
+    def __str__(self):
+        return f"{self.view_name or '-'}: {self.sql[:60]} ({self.duration_ms:.1f} ms)"
+
+    class Meta:
+        ordering = ['-captured_at']
+
+
+class ProfileTrace(models.Model):
+    path = models.CharField(max_length=500)
+    method = models.CharField(max_length=10)
+    view_name = models.CharField(max_length=200, blank=True)
+    trigger = models.CharField(max_length=20, help_text="header, param or sample")
+    backend = models.CharField(max_length=20)
+    duration_ms = models.FloatField()
+    file_name = models.CharField(max_length=255)
+    captured_at = models.DateTimeField(auto_now_add=True)
+
+    def __str__(self):
+        return f"{self.method} {self.path} ({self.duration_ms:.1f} ms)"
+
+    class Meta:
+        ordering = ['-captured_at']
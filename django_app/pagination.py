@@ -0,0 +1,51 @@
+from django.core.paginator import Paginator
+from django.db import DatabaseError, connections
+from django.db.models import QuerySet
+from django.utils.functional import cached_property
+
+
+def estimate_row_count(model, using='default'):
+    """Return the planner's row estimate for a model's table, or None if unknown"""
+    connection = connections[using]
+    table = model._meta.db_table
+
+    if connection.vendor == 'postgresql':
+        sql = "SELECT reltuples::bigint FROM pg_class WHERE relname = %s"
+    elif connection.vendor == 'sqlite':
+        # sqlite_stat1 only exists after ANALYZE; the first number of `stat` is the row count
+        sql = "SELECT stat FROM sqlite_stat1 WHERE tbl = %s LIMIT 1"
+    else:
+        return None
+
+    try:
+        with connection.cursor() as cursor:
+            cursor.execute(sql, [table])
+            row = cursor.fetchone()
+    except DatabaseError:
+        return None
+
+    if not row or row[0] is None:
+        return None
+    try:
+        estimate = int(str(row[0]).split()[0])
+    except ValueError:
+        return None
+    return estimate if estimate >= 0 else None
+
+
+class EstimatedCountPaginator(Paginator):
+    """Paginator that trusts the table statistics for large unfiltered querysets.
+
+    Filtered querysets, small tables and backends without statistics fall back
+    to the exact ``COUNT(*)``.
+    """
+    estimate_threshold = 10000
+
+    @cached_property
+    def count(self):
+        object_list = self.object_list
+        if isinstance(object_list, QuerySet) and not object_list.query.where:
+            estimate = estimate_row_count(object_list.model, using=object_list.db)
+            if estimate is not None and estimate > self.estimate_threshold:
+                return estimate
+        return super().count
@@ -0,0 +1,199 @@
+"""Payment state changes for purchases.
+
+Marking purchases paid is a single conditional ``UPDATE ... WHERE paid_at IS
+NULL`` that only touches the payment columns, so double-clicks and
+concurrent cashiers cannot overwrite each other. Requests that may be
+retried pass an idempotency key; a repeated key returns the stored report
+instead of applying the change again.
+
+Every change to what a student owes is also appended to the ``PaymentEvent``
+log, and applied to the ``StudentBalance`` projection in the same
+transaction, so the outstanding balance is a single row read and can be
+rebuilt from the log with ``manage.py rebuild_balances``. That includes
+purchases edited or deleted in the admin (``purchase_change_events``,
+``void_purchases``).
+"""
+from collections import defaultdict
+
+from django.db import IntegrityError, transaction
+from django.db.models import F, Max, Sum
+from django.utils import timezone
+
+from .models import IdempotencyKey, PaymentEvent, Purchase, StudentBalance
+
+
+def record_events(events):
+    """Append unsaved PaymentEvents and apply them to the balance projection"""
+    with transaction.atomic():
+        events = PaymentEvent.objects.bulk_create(events)
+        apply_to_balances(events)
+    return events
+
+
+def record_event(student, kind, amount, **fields):
+    """Append a single event, e.g. a manual adjustment or a refund"""
+    return record_events([PaymentEvent(student=student, kind=kind, amount=amount, **fields)])[0]
+
+
+def apply_to_balances(events):
+    """Add event amounts to each student's balance row, one UPDATE per student"""
+    deltas = defaultdict(int)
+    last_event = {}
+    for event in events:
+        deltas[event.student_id] += event.amount
+        last_event[event.student_id] = max(event.pk, last_event.get(event.student_id, 0))
+
+    now = timezone.now()
+    for student_id, delta in deltas.items():
+        changes = {'outstanding': F('outstanding') + delta, 'last_event_id': last_event[student_id], 'updated_at': now}
+        if StudentBalance.objects.filter(student_id=student_id).update(**changes):
+            continue
+        try:
+            with transaction.atomic():
+                StudentBalance.objects.create(
+                    student_id=student_id, outstanding=delta, last_event_id=last_event[student_id]
+                )
+        except IntegrityError:
+            # Another transaction created the row first
+            StudentBalance.objects.filter(student_id=student_id).update(**changes)
+
+
+def purchase_events(purchase):
+    """Unsaved events for a new purchase, and for its payment when it was paid on the spot"""
+    events = [PaymentEvent(
+        student_id=purchase.student_id, purchase=purchase, kind=PaymentEvent.KIND_CREATED,
+        amount=purchase.amount, cashier=purchase.cashier, created_at=purchase.created_at,
+    )]
+    if purchase.paid_at:
+        events.append(PaymentEvent(
+            student_id=purchase.student_id, purchase=purchase, kind=PaymentEvent.KIND_PAID,
+            amount=-purchase.amount, payment_method=purchase.payment_method, cashier=purchase.cashier,
+            created_at=purchase.paid_at,
+        ))
+    return events
+
+
+def record_purchase(purchase):
+    """Log a new purchase, and its payment when it was paid on the spot"""
+    return record_events(purchase_events(purchase))
+
+
+def _amount_due(purchase):
+    return 0 if purchase.paid_at else purchase.amount
+
+
+def purchase_change_events(old, purchase):
+    """Unsaved events for an edited purchase, given its stored version from before the edit"""
+    if (old.student_id, old.dance_pass_id) != (purchase.student_id, purchase.dance_pass_id):
+        # Void the old charge and charge the new student/pass for whatever is left unpaid
+        return void_events([old]) + [PaymentEvent(
+            student_id=purchase.student_id, purchase=purchase, kind=PaymentEvent.KIND_ADJUSTED,
+            amount=_amount_due(purchase), cashier=purchase.cashier, note=f'Purchase changed to {purchase}',
+        )]
+    if old.paid_at is None and purchase.paid_at is not None:
+        return [PaymentEvent(
+            student_id=purchase.student_id, purchase=purchase, kind=PaymentEvent.KIND_PAID,
+            amount=-purchase.amount, payment_method=purchase.payment_method, cashier=purchase.cashier,
+            created_at=purchase.paid_at,
+        )]
+    if old.paid_at is not None and purchase.paid_at is None:
+        return [PaymentEvent(
+            student_id=purchase.student_id, purchase=purchase, kind=PaymentEvent.KIND_ADJUSTED,
+            amount=purchase.amount, payment_method=old.payment_method, cashier=purchase.cashier,
+            note='Payment removed',
+        )]
+    if old.paid_at != purchase.paid_at:
+        # Nothing owed changes, but the log keeps the correction
+        return [PaymentEvent(
+            student_id=purchase.student_id, purchase=purchase, kind=PaymentEvent.KIND_ADJUSTED, amount=0,
+            payment_method=purchase.payment_method, cashier=purchase.cashier,
+            note=f'Payment date changed from {old.paid_at:%Y-%m-%d %H:%M} to {purchase.paid_at:%Y-%m-%d %H:%M}',
+        )]
+    return []
+
+
+def void_events(purchases):
+    """Unsaved events cancelling what the given purchases still add to their students' balances"""
+    return [
+        PaymentEvent(
+            student_id=purchase.student_id, purchase=purchase, kind=PaymentEvent.KIND_VOIDED,
+            amount=-_amount_due(purchase), note=f'Voided {purchase}',
+        )
+        for purchase in purchases
+    ]
+
+
+def void_purchases(purchases):
+    """Log the voiding of purchases that are about to be deleted"""
+    return record_events(void_events(purchases))
+
+
+def rebuild_balances():
+    """Recompute every balance from the event log with one grouped query"""
+    totals = PaymentEvent.objects.order_by().values('student_id').annotate(
+        outstanding=Sum('amount'), last_event_id=Max('pk')
+    )
+    with transaction.atomic():
+        StudentBalance.objects.all().delete()
+        balances = StudentBalance.objects.bulk_create(
+            [StudentBalance(**row) for row in totals.iterator()], batch_size=1000
+        )
+    return len(balances)
+
+
+def balance_drift():
+    """Students whose stored balance differs from the event log, as {student_id: (stored, expected)}"""
+    expected = dict(
+        PaymentEvent.objects.order_by().values('student_id').annotate(total=Sum('amount')).values_list(
+            'student_id', 'total'
+        )
+    )
+    stored = dict(StudentBalance.objects.values_list('student_id', 'outstanding'))
+    return {
+        student_id: (stored.get(student_id, 0), expected.get(student_id, 0))
+        for student_id in set(expected) | set(stored)
+        if stored.get(student_id, 0) != expected.get(student_id, 0)
+    }
+
+
+def mark_paid(purchase_ids, payment_method, cashier=None, idempotency_key=None):
+    """Mark unpaid purchases as paid and report how many rows actually changed"""
+    purchase_ids = sorted({int(purchase_id) for purchase_id in purchase_ids})
+
+    with transaction.atomic():
+        if idempotency_key:
+            try:
+                with transaction.atomic():
+                    record = IdempotencyKey.objects.create(key=idempotency_key)
+            except IntegrityError:
+                report = IdempotencyKey.objects.get(key=idempotency_key).result
+                return dict(report, replayed=True)
+
+        # Lock the unpaid rows first so the paid events match exactly the rows the UPDATE changes
+        unpaid = list(
+            Purchase.objects.select_for_update(of=('self',)).filter(pk__in=purchase_ids, paid_at__isnull=True)
+            .values_list('pk', 'student_id', 'amount')
+        )
+        updated = Purchase.objects.filter(pk__in=[pk for pk, _, _ in unpaid])._mark_paid(
+            payment_method, cashier=cashier
+        )
+        record_events([
+            PaymentEvent(
+                student_id=student_id, purchase_id=pk, kind=PaymentEvent.KIND_PAID, amount=-amount,
+                payment_method=payment_method, cashier=cashier,
+            )
+            for pk, student_id, amount in unpaid
+        ])
+        report = {'requested': len(purchase_ids), 'updated': updated, 'unchanged': len(purchase_ids) - updated}
+
+        if idempotency_key:
+            record.result = report
+            record.save(update_fields=['result'])
+
+    return dict(report, replayed=False)
+
+
+def idempotency_key_for(request, scope):
+    """Scoped idempotency key from the Idempotency-Key header or form field, or None"""
+    key = request.headers.get('Idempotency-Key') or request.POST.get('idempotency_key')
+    return f'{scope}:{request.user.pk}:{key[:150]}' if key else None
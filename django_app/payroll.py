@@ -0,0 +1,132 @@
+"""Teacher hours for payroll, aggregated from attendance.
+
+A lesson (group, date) counts as taught when at least one student attended
+it. One grouped query over ``StudentVisit`` (and, through a UNION,
+``ArchivedVisit``) joined to ``Group.teachers`` returns the number of
+distinct lesson dates per (teacher, group); each is multiplied by the
+group's ``duration_minutes`` and summed per teacher.
+Reports for closed months rarely change, so they are cached under a stamp
+of the month's ``Lesson`` rows: every change to a visit bumps its lesson's
+version, which replaces the stamp. The stamp and, on a miss, the report are
+read from the primary so a lagging replica is never cached. With a shared
+cache, saving attendance of a closed month queues ``warm_monthly_report`` so
+the worker, not the next payroll page, pays for the rebuild.
+"""
+import calendar
+import csv
+from collections import namedtuple
+from datetime import date
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db.models import Count, Max, Sum
+from django.utils import timezone
+
+from . import archive, metrics, tenancy
+from .models import Group, Lesson
+from .roster import display_name
+from .routers import PRIMARY
+from .tasks import task
+
+
+class PayrollRow(namedtuple('PayrollRow', ['teacher_id', 'name', 'lessons', 'minutes'])):
+    __slots__ = ()
+
+    @property
+    def hours(self):
+        return self.minutes / 60
+
+
+CSV_HEADER = ['Teacher ID', 'Teacher', 'Lessons', 'Hours']
+CACHE_TIMEOUT = 30 * 24 * 60 * 60
+
+
+def month_bounds(year, month):
+    """First and last day of a month"""
+    return date(year, month, 1), date(year, month, calendar.monthrange(year, month)[1])
+
+
+def teacher_hours(start, end, using=None):
+    """PayrollRow per teacher who taught between start and end (inclusive), by name"""
+    first, *rest = [
+        source.using(using).filter(date__range=(start, end), skipped=False, group__teachers__isnull=False).order_by().values(
+            'group__teachers', 'group_id', 'group__teachers__user__first_name', 'group__teachers__user__last_name',
+            'group__teachers__user__username', 'group__duration_minutes',
+        ).annotate(lessons=Count('date', distinct=True))
+        for source in archive.visit_sources()
+    ]
+    # A group is archived as a whole, so each lesson is counted in exactly one source
+    rows = first.union(*rest, all=True)
+
+    totals = {}
+    for row in rows:
+        teacher_id = row['group__teachers']
+        name, lessons, minutes = totals.get(teacher_id, (display_name(
+            row['group__teachers__user__first_name'], row['group__teachers__user__last_name'],
+            row['group__teachers__user__username'],
+        ), 0, 0))
+        totals[teacher_id] = (name, lessons + row['lessons'], minutes + row['lessons'] * row['group__duration_minutes'])
+    report = [PayrollRow(teacher_id, *values) for teacher_id, values in totals.items()]
+    return sorted(report, key=lambda row: (row.name.casefold(), row.teacher_id))
+
+
+def is_closed(year, month):
+    """True once the month has fully passed"""
+    return month_bounds(year, month)[1] < timezone.localdate()
+
+
+def attendance_stamp(start, end):
+    """Changes whenever a visit between start and end is added, edited, moved, deleted or archived"""
+    stamp = Lesson.objects.using(PRIMARY).filter(
+        group__in=Group.objects.using(PRIMARY).values('pk'), date__range=(start, end)
+    ).aggregate(lessons=Count('pk'), versions=Sum('version'), updated=Max('updated_at'))
+    updated = stamp['updated'].timestamp() if stamp['updated'] else 0
+    return f"{stamp['lessons']}:{stamp['versions'] or 0}:{updated}"
+
+
+def monthly_report(year, month):
+    """Teacher hours for one month; closed months are cached until their attendance changes"""
+    start, end = month_bounds(year, month)
+    if not is_closed(year, month):
+        return teacher_hours(start, end)
+
+    key = tenancy.cache_key(f'payroll:{year:04d}-{month:02d}:{attendance_stamp(start, end)}')
+    report = cache.get(key)
+    metrics.record_cache_access('payroll', report is not None)
+    if report is None:
+        report = teacher_hours(start, end, using=PRIMARY)
+        cache.set(key, report, CACHE_TIMEOUT)
+    return report
+
+
+@task(name='payroll.warm_monthly_report')
+def warm_monthly_report(studio_id, year, month):
+    """Rebuild a closed month's cached report"""
+    with tenancy.use_studio(studio_id):
+        monthly_report(year, month)
+
+
+def attendance_changed(group, lesson_date, version):
+    """Queue a rebuild of the cached report when attendance of a closed month changed, returning the task"""
+    if not settings.PAYROLL_WARM_CACHE or not is_closed(lesson_date.year, lesson_date.month):
+        return None
+    # One task per change: the lesson version is bumped by every save that changes a visit
+    return warm_monthly_report.enqueue(
+        idempotency_key=f'payroll-warm:{group.pk}:{lesson_date.isoformat()}:{version}',
+        studio_id=group.studio_id, year=lesson_date.year, month=lesson_date.month,
+    )
+
+
+class _Echo:
+    """File-like object whose write() hands the line back to csv.writer's caller"""
+
+    def write(self, value):
+        return value
+
+
+def csv_lines(report):
+    """CSV text, one line at a time, for a StreamingHttpResponse"""
+    writer = csv.writer(_Echo())
+    yield writer.writerow(CSV_HEADER)
+    for row in report:
+        yield writer.writerow([row.teacher_id, row.name, row.lessons, f'{row.hours:.2f}'])
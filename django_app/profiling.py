@@ -0,0 +1,144 @@
+"""Sampling request profiler.
+
+A request is profiled when it carries the ``X-Profile`` header with the
+``PROFILING_TOKEN`` value, when a staff user adds ``?profile=1``, or at random
+with probability ``PROFILING_SAMPLE_RATE``. Traces are written to
+``PROFILING_DIR`` (cProfile ``.prof`` files, or pyinstrument ``.html`` when
+``PROFILING_BACKEND = 'pyinstrument'`` and it is installed), indexed by the
+``ProfileTrace`` table and rotated to the newest ``PROFILING_MAX_FILES``.
+"""
+import cProfile
+import io
+import pstats
+import random
+import threading
+import time
+import uuid
+from pathlib import Path
+
+from django.conf import settings
+from django.utils import timezone
+
+from .models import ProfileTrace
+
+try:
+    import pyinstrument
+except ImportError:  # pragma: no cover - optional dependency
+    pyinstrument = None
+
+# Only one profiler can be active per interpreter thread; concurrent requests skip profiling
+_profiler_lock = threading.Lock()
+
+
+def profile_dir():
+    return Path(getattr(settings, 'PROFILING_DIR', 'profiles'))
+
+
+def backend_name():
+    backend = getattr(settings, 'PROFILING_BACKEND', 'cprofile')
+    if backend == 'pyinstrument' and pyinstrument is None:
+        return 'cprofile'
+    return backend
+
+
+def trigger_for(request, is_staff):
+    """Return why this request should be profiled, or None"""
+    token = getattr(settings, 'PROFILING_TOKEN', '')
+    if token and request.headers.get('X-Profile') == token:
+        return 'header'
+    if is_staff and request.GET.get('profile') == '1':
+        return 'param'
+    rate = getattr(settings, 'PROFILING_SAMPLE_RATE', 0.0)
+    if rate > 0 and random.random() < rate:
+        return 'sample'
+    return None
+
+
+class Profiler:
+    """Thin wrapper giving cProfile and pyinstrument the same start/stop/save API"""
+
+    def __init__(self, backend, async_mode=False):
+        self.backend = backend
+        if backend == 'pyinstrument':
+            self._profiler = pyinstrument.Profiler(async_mode='enabled' if async_mode else 'disabled')
+        else:
+            self._profiler = cProfile.Profile()
+        self.started = None
+        self.duration = 0.0
+
+    def start(self):
+        self.started = time.perf_counter()
+        if self.backend == 'pyinstrument':
+            self._profiler.start()
+        else:
+            self._profiler.enable()
+
+    def stop(self):
+        if self.backend == 'pyinstrument':
+            self._profiler.stop()
+        else:
+            self._profiler.disable()
+        self.duration = time.perf_counter() - self.started
+
+    def save(self, path):
+        if self.backend == 'pyinstrument':
+            path.write_text(self._profiler.output_html())
+        else:
+            self._profiler.dump_stats(str(path))
+
+
+def acquire():
+    return _profiler_lock.acquire(blocking=False)
+
+
+def release():
+    _profiler_lock.release()
+
+
+def save_trace(profiler, request, response_view_name, trigger):
+    """Write a finished profile to disk, index it and rotate old traces"""
+    directory = profile_dir()
+    directory.mkdir(parents=True, exist_ok=True)
+    suffix = 'html' if profiler.backend == 'pyinstrument' else 'prof'
+    file_name = f"{timezone.now():%Y%m%d-%H%M%S}-{response_view_name or 'unmatched'}-{uuid.uuid4().hex[:8]}.{suffix}"
+    profiler.save(directory / file_name)
+
+    trace = ProfileTrace.objects.create(
+        path=request.path[:500],
+        method=request.method,
+        view_name=response_view_name or '',
+        trigger=trigger,
+        backend=profiler.backend,
+        duration_ms=profiler.duration * 1000,
+        file_name=file_name,
+    )
+    rotate()
+    return trace
+
+
+def delete_trace_files(traces):
+    for trace in traces:
+        (profile_dir() / trace.file_name).unlink(missing_ok=True)
+
+
+def rotate():
+    """Keep only the newest PROFILING_MAX_FILES traces"""
+    keep = getattr(settings, 'PROFILING_MAX_FILES', 200)
+    old = list(ProfileTrace.objects.order_by('-pk')[keep:])
+    if old:
+        delete_trace_files(old)
+        ProfileTrace.objects.filter(pk__in=[trace.pk for trace in old]).delete()
+
+
+def report(trace, limit=60):
+    """Human-readable call tree summary for the admin"""
+    path = profile_dir() / trace.file_name
+    if not path.exists():
+        return 'Trace file is missing (rotated or deleted).'
+    if trace.backend == 'pyinstrument':
+        return 'pyinstrument trace: download the HTML file to view the call tree.'
+
+    stream = io.StringIO()
+    stats = pstats.Stats(str(path), stream=stream)
+    stats.strip_dirs().sort_stats('cumulative').print_stats(limit)
+    return stream.getvalue()
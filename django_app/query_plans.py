@@ -0,0 +1,128 @@
+"""Capture EXPLAIN output for the slowest statements of slow requests.
+
+The middleware only picks the slowest SELECTs of a slow request and queues
+``capture_query_plan`` for statement shapes not seen yet today. The worker
+runs EXPLAIN later, without the request's parameters: PostgreSQL plans the
+statement generically (``EXPLAIN (GENERIC_PLAN)``, PostgreSQL 16+), other
+databases plan it with NULLs bound. Nothing is executed, and the plans land
+in the capped ``QueryPlan`` table. Parameter values never leave the request;
+only a fingerprint of them is kept.
+"""
+import hashlib
+import json
+import logging
+import re
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import connections
+from django.utils import timezone
+
+from .instrumentation import normalize_sql
+from .models import QueryPlan
+from .tasks import task
+
+logger = logging.getLogger(__name__)
+
+_PLACEHOLDER_RE = re.compile(r'%%|%s')
+
+
+def _param_value(value):
+    if isinstance(value, (bytes, bytearray, memoryview)):
+        return bytes(value).hex()
+    return str(value)
+
+
+def params_fingerprint(params):
+    encoded = json.dumps(params, default=_param_value, sort_keys=True)
+    return hashlib.sha1(encoded.encode()).hexdigest()
+
+
+def shape_digest(normalized_sql):
+    return hashlib.sha1(normalized_sql.encode()).hexdigest()
+
+
+def explain(sql, using='default'):
+    """Plan a parametrized statement without its parameters and return the plan as text"""
+    connection = connections[using]
+    prefix = connection.ops.explain_query_prefix(None)
+    count = 0
+
+    def placeholder(match):
+        nonlocal count
+        if match.group() == '%%':
+            return '%'
+        count += 1
+        return f'${count}'
+
+    if connection.vendor == 'postgresql':
+        # Sent without parameters, so the driver leaves $n and % alone
+        statement, params = f'{prefix} (GENERIC_PLAN) {_PLACEHOLDER_RE.sub(placeholder, sql)}', None
+    else:
+        statement = f'{prefix} {sql}'
+        params = [None] * sum(match.group() == '%s' for match in _PLACEHOLDER_RE.finditer(sql))
+
+    with connection.cursor() as cursor:
+        cursor.execute(statement, params)
+        rows = cursor.fetchall()
+
+    if connection.vendor == 'sqlite':
+        return _format_sqlite_plan(rows)
+    return '\n'.join(' '.join(str(column) for column in row) for row in rows)
+
+
+def _format_sqlite_plan(rows):
+    """Indent EXPLAIN QUERY PLAN rows (id, parent, notused, detail) as a tree"""
+    depth = {0: -1}
+    lines = []
+    for node_id, parent, _, detail in rows:
+        depth[node_id] = depth.get(parent, -1) + 1
+        lines.append('  ' * depth[node_id] + detail)
+    return '\n'.join(lines)
+
+
+def store_plan(view_name, sql, fingerprint, duration_ms, using='default'):
+    """Explain a statement and keep the plan, trimming the table to SLOW_QUERY_PLANS_MAX rows"""
+    plan = QueryPlan.objects.create(
+        view_name=view_name or '',
+        sql=normalize_sql(sql),
+        params_fingerprint=fingerprint,
+        duration_ms=duration_ms,
+        vendor=connections[using].vendor,
+        plan=explain(sql, using=using),
+    )
+
+    cap = getattr(settings, 'SLOW_QUERY_PLANS_MAX', 500)
+    boundary = QueryPlan.objects.order_by('-pk').values_list('pk', flat=True)[cap:cap + 1]
+    if boundary:
+        QueryPlan.objects.filter(pk__lte=boundary[0]).delete()
+    return plan
+
+
+@task(name='query_plans.capture', max_attempts=1)
+def capture_query_plan(view_name, sql, fingerprint, duration_ms, using='default'):
+    """Store the plan of a slow statement unless its shape was already captured today"""
+    if not QueryPlan.objects.filter(sql=normalize_sql(sql), captured_at__date=timezone.now().date()).exists():
+        store_plan(view_name, sql, fingerprint, duration_ms, using=using)
+
+
+def sample_slow_queries(metrics):
+    """Queue plan captures for the slowest SELECTs of a slow request, once per statement shape and day"""
+    limit = getattr(settings, 'SLOW_QUERY_EXPLAIN_COUNT', 3)
+    today = timezone.now().date().isoformat()
+    for query in metrics.slowest_queries()[:limit]:
+        if not query['sql'].lstrip().upper().startswith('SELECT'):
+            continue
+        try:
+            digest = shape_digest(query['normalized'])
+            # The cache spares most repeats a database write; the idempotency key catches the rest
+            if not cache.add(f'query-plan:{digest}:{today}', True, 24 * 60 * 60):
+                continue
+            capture_query_plan.enqueue(
+                idempotency_key=f'query-plan:{digest}:{today}',
+                view_name=metrics.view_name, sql=query['sql'], fingerprint=params_fingerprint(query['params']),
+                duration_ms=query['duration_ms'], using=query['alias'],
+            )
+        except Exception:
+            # Losing a plan is better than failing the request
+            logger.exception("Could not queue a query plan capture")
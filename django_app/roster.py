@@ -0,0 +1,102 @@
+"""Compact per-group roster for the attendance screen.
+
+The roster is a tuple of ``(id, name, phone)`` rows built with one
+``values_list`` query and cached under the group's ``roster_version``, which
+signal handlers bump whenever membership or a member's name or phone
+changes. Balances change with every payment, so they are overlaid on each
+read with one narrow query instead of being cached.
+"""
+from collections import namedtuple
+
+from django.contrib.auth.models import User
+from django.core.cache import cache
+from django.db.models import F
+from django.db.models.signals import m2m_changed, post_save, pre_delete
+
+from . import metrics, tenancy
+from .models import Group, Student, StudentBalance
+
+RosterEntry = namedtuple('RosterEntry', ['id', 'name', 'phone', 'balance'])
+
+CACHE_TIMEOUT = 60 * 60
+
+
+def display_name(first_name, last_name, username):
+    """Same as str(Student), from plain column values"""
+    return f"{first_name} {last_name}" if first_name else username
+
+
+def cache_key(group):
+    return tenancy.cache_key(f'roster:{group.pk}:{group.roster_version}', group.studio_id)
+
+
+def _build_snapshot(group_id):
+    rows = Student.objects.filter(groups=group_id).values_list(
+        'pk', 'user__first_name', 'user__last_name', 'user__username', 'phone'
+    )
+    entries = [
+        (pk, display_name(first_name, last_name, username), phone)
+        for pk, first_name, last_name, username, phone in rows
+    ]
+    return tuple(sorted(entries, key=lambda row: (row[1].casefold(), row[0])))
+
+
+def snapshot(group):
+    """Roster rows for a group, from the cache while its roster_version is unchanged"""
+    key = cache_key(group)
+    rows = cache.get(key)
+    metrics.record_cache_access('roster', rows is not None)
+    if rows is None:
+        rows = _build_snapshot(group.pk)
+        cache.set(key, rows, CACHE_TIMEOUT)
+
+    balances = dict(
+        StudentBalance.objects.filter(student_id__in=[row[0] for row in rows]).values_list(
+            'student_id', 'outstanding'
+        )
+    )
+    return [RosterEntry(pk, name, phone, balances.get(pk, 0)) for pk, name, phone in rows]
+
+
+def bump(groups):
+    """Invalidate cached rosters by bumping roster_version of a Group queryset"""
+    groups.update(roster_version=F('roster_version') + 1)
+
+
+def _membership_changed(sender, instance, action, reverse, pk_set, **kwargs):
+    if reverse:
+        # instance is a Group
+        if action in ('post_add', 'post_remove', 'post_clear'):
+            bump(Group.objects.filter(pk=instance.pk))
+        return
+    # instance is a Student; pk_set holds group ids
+    if action == 'pre_clear':
+        instance._roster_cleared_groups = list(instance.groups.values_list('pk', flat=True))
+    elif action == 'post_clear':
+        bump(Group.objects.filter(pk__in=getattr(instance, '_roster_cleared_groups', [])))
+    elif action in ('post_add', 'post_remove') and pk_set:
+        bump(Group.objects.filter(pk__in=pk_set))
+
+
+def _student_saved(sender, instance, created, **kwargs):
+    if not created:
+        bump(Group.objects.filter(students=instance))
+
+
+def _student_deleted(sender, instance, **kwargs):
+    bump(Group.objects.filter(students=instance))
+
+
+def _user_saved(sender, instance, created, update_fields=None, **kwargs):
+    # Logins only touch last_login; skip those
+    if created or (update_fields and not {'first_name', 'last_name', 'username'} & set(update_fields)):
+        return
+    bump(Group.objects.filter(students__user=instance))
+
+
+def install():
+    """Connect the roster invalidation signals (called from AppConfig.ready)"""
+    m2m_changed.connect(_membership_changed, sender=Student.groups.through, dispatch_uid='roster_membership')
+    post_save.connect(_student_saved, sender=Student, dispatch_uid='roster_student_saved')
+    pre_delete.connect(_student_deleted, sender=Student, dispatch_uid='roster_student_deleted')
+    post_save.connect(_user_saved, sender=User, dispatch_uid='roster_user_saved')
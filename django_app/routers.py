@@ -0,0 +1,160 @@
+"""Send heavy, read-only work to a replica database.
+
+Only code that opts in reads from the ``replica`` alias: views decorated with
+``replica_reads``, admin changelists using ``ReplicaChangelistMixin`` and
+commands running inside ``use_replica()``. Everything else, and every write,
+goes to ``default``. When no replica is configured (``REPLICA_DATABASE_URL``
+unset) the router never picks one.
+
+A replica lags behind the primary, so reads stick to the primary once the
+current request or command has written anything. ``ReplicaPinMiddleware``
+extends that to the client's next requests for ``REPLICA_PIN_SECONDS``
+with a cookie, so a user sees their own changes right after saving them.
+"""
+import functools
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction
+from django.conf import settings
+
+REPLICA = 'replica'
+PRIMARY = 'default'
+PIN_COOKIE = 'primary_pin'
+SAFE_METHODS = ('GET', 'HEAD', 'OPTIONS', 'TRACE')
+
+
+class RoutingState:
+    """Per request (or command) routing flags, shared with threads the request hands work to"""
+    __slots__ = ('replica', 'pinned', 'wrote')
+
+    def __init__(self, pinned=False):
+        self.replica = False
+        self.pinned = pinned
+        self.wrote = False
+
+    def reads_from_replica(self):
+        return self.replica and not (self.pinned or self.wrote)
+
+
+_state = ContextVar('replica_routing_state', default=None)
+
+
+def replica_configured():
+    return REPLICA in settings.DATABASES
+
+
+@contextmanager
+def use_replica():
+    """Read from the replica inside the block (until something is written)"""
+    state, token = _state.get(), None
+    if state is None:
+        state = RoutingState()
+        token = _state.set(state)
+    previous, state.replica = state.replica, True
+    try:
+        yield state
+    finally:
+        state.replica = previous
+        if token is not None:
+            _state.reset(token)
+
+
+def replica_reads(view):
+    """Decorator for read-only views (sync or async) whose queries may go to the replica"""
+    if iscoroutinefunction(view):
+        @functools.wraps(view)
+        async def wrapper(*args, **kwargs):
+            with use_replica():
+                return await view(*args, **kwargs)
+    else:
+        @functools.wraps(view)
+        def wrapper(*args, **kwargs):
+            with use_replica():
+                return view(*args, **kwargs)
+    return wrapper
+
+
+class ReplicaRouter:
+    """Route opted-in reads to the replica; writes always go to the primary"""
+
+    def db_for_read(self, model, **hints):
+        state = _state.get()
+        if state is not None and state.reads_from_replica() and replica_configured():
+            return REPLICA
+        return None
+
+    def db_for_write(self, model, **hints):
+        state = _state.get()
+        if state is not None:
+            state.wrote = True
+        return PRIMARY
+
+    def allow_relation(self, obj1, obj2, **hints):
+        # Both aliases hold the same data
+        if {obj1._state.db, obj2._state.db} <= {PRIMARY, REPLICA}:
+            return True
+        return None
+
+    def allow_migrate(self, db, app_label, model_name=None, **hints):
+        # The replica gets its schema from the primary
+        if db == REPLICA:
+            return False
+        return None
+
+
+class ReplicaChangelistMixin:
+    """ModelAdmin mixin serving the (read-only) changelist from the replica"""
+
+    def changelist_view(self, request, extra_context=None):
+        # Actions are POSTed to the changelist and write; keep those on the primary
+        if request.method not in SAFE_METHODS:
+            return super().changelist_view(request, extra_context)
+        with use_replica():
+            return super().changelist_view(request, extra_context)
+
+
+class ReplicaPinMiddleware:
+    """Pin a client to the primary for a while after it writes (read-your-writes)"""
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        if iscoroutinefunction(self.get_response):
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+        state, token = self.start(request)
+        try:
+            response = self.get_response(request)
+        finally:
+            _state.reset(token)
+        return self.finish(request, response, state)
+
+    async def __acall__(self, request):
+        state, token = self.start(request)
+        try:
+            response = await self.get_response(request)
+        finally:
+            _state.reset(token)
+        return self.finish(request, response, state)
+
+    def start(self, request):
+        try:
+            pinned = float(request.COOKIES.get(PIN_COOKIE, 0)) > time.time()
+        except ValueError:
+            pinned = False
+        state = RoutingState(pinned=pinned)
+        return state, _state.set(state)
+
+    def finish(self, request, response, state):
+        if replica_configured() and (state.wrote or request.method not in SAFE_METHODS):
+            seconds = settings.REPLICA_PIN_SECONDS
+            response.set_cookie(
+                PIN_COOKIE, str(time.time() + seconds), max_age=seconds, httponly=True, samesite='Lax',
+            )
+        return response
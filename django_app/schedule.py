@@ -0,0 +1,147 @@
+"""Weekly schedule slots and double-booking detection.
+
+Every ``Group.schedule`` entry of a group that is still running is a slot:
+an interval on the week's minute axis (Monday 00:00 = 0). Slots sharing a
+teacher, or the same location, are swept in start order per resource, so the
+whole studio is checked in O(n log n + conflicts).
+"""
+import heapq
+from collections import defaultdict, namedtuple
+from datetime import datetime, timedelta
+
+from django.utils import timezone
+
+from .models import Group, Teacher
+
+WEEKDAYS = {'mon': 0, 'tue': 1, 'wed': 2, 'thu': 3, 'fri': 4, 'sat': 5, 'sun': 6}
+MINUTES_PER_DAY = 24 * 60
+MINUTES_PER_WEEK = 7 * MINUTES_PER_DAY
+
+Slot = namedtuple('Slot', [
+    'group_id', 'group_name', 'day', 'time', 'start', 'end', 'teacher_ids', 'location', 'start_at', 'finished_at',
+])
+Conflict = namedtuple('Conflict', ['kind', 'resource', 'first', 'second'])
+
+
+def lesson_end(start_time, minutes):
+    """End time ('HH:MM') of a lesson starting at start_time ('HH:MM')"""
+    start = datetime.strptime(start_time, '%H:%M')
+    return f"{start + timedelta(minutes=minutes):%H:%M}"
+
+
+def location_key(location):
+    """Compare locations by their first line (the name), ignoring case and spacing"""
+    first_line = (location or '').strip().splitlines()[0] if (location or '').strip() else ''
+    return ' '.join(first_line.casefold().split())
+
+
+def group_slots(group_id, name, schedule, minutes, location, start_at, finished_at, teacher_ids):
+    """Slots for one group's schedule entries; malformed entries are skipped"""
+    slots = []
+    for entry in schedule or []:
+        weekday = WEEKDAYS.get(entry.get('day'))
+        try:
+            starts = datetime.strptime(entry.get('time', ''), '%H:%M')
+        except (TypeError, ValueError):
+            continue
+        if weekday is None:
+            continue
+        start = weekday * MINUTES_PER_DAY + starts.hour * 60 + starts.minute
+        slots.append(Slot(
+            group_id, name, entry['day'], entry['time'], start, start + minutes,
+            frozenset(teacher_ids), location_key(location), start_at, finished_at,
+        ))
+    return slots
+
+
+def active_slots(exclude_group_id=None):
+    """Slots of every group that has not finished, in two queries"""
+    groups = Group.objects.running_between(timezone.localdate())
+    if exclude_group_id is not None:
+        groups = groups.exclude(pk=exclude_group_id)
+    rows = list(groups.values_list(
+        'pk', 'name', 'schedule', 'duration_minutes', 'location', 'start_at', 'finished_at'
+    ))
+
+    teachers = defaultdict(set)
+    memberships = Group.teachers.through.objects.filter(group_id__in=[row[0] for row in rows])
+    for group_id, teacher_id in memberships.values_list('group_id', 'teacher_id'):
+        teachers[group_id].add(teacher_id)
+    return [slot for row in rows for slot in group_slots(*row, teachers[row[0]])]
+
+
+def _dates_overlap(a, b):
+    return (a.finished_at is None or b.start_at <= a.finished_at) and (
+        b.finished_at is None or a.start_at <= b.finished_at
+    )
+
+
+def _overlapping_pairs(intervals):
+    """Sweep (start, end, slot) intervals in start order, yielding overlapping slot pairs"""
+    intervals.sort(key=lambda interval: (interval[0], interval[1]))
+    active = []
+    for order, (start, end, slot) in enumerate(intervals):
+        while active and active[0][0] <= start:
+            heapq.heappop(active)
+        for _, _, other in active:
+            yield other, slot
+        heapq.heappush(active, (end, order, slot))
+
+
+def find_conflicts(slots):
+    """Pairs of slots of different groups that share a teacher or a location at the same time"""
+    resources = defaultdict(list)
+    for slot in slots:
+        # Lessons running past Sunday midnight wrap to the start of the week
+        pieces = [(slot.start, slot.end)]
+        if slot.end > MINUTES_PER_WEEK:
+            pieces = [(slot.start, MINUTES_PER_WEEK), (0, slot.end - MINUTES_PER_WEEK)]
+        keys = [('teacher', teacher_id) for teacher_id in slot.teacher_ids]
+        if slot.location:
+            keys.append(('location', slot.location))
+        for key in keys:
+            resources[key].extend((start, end, slot) for start, end in pieces)
+
+    conflicts = {}
+    for (kind, resource), intervals in resources.items():
+        for first, second in _overlapping_pairs(intervals):
+            if first.group_id == second.group_id or not _dates_overlap(first, second):
+                continue
+            first, second = sorted((first, second), key=lambda slot: (slot.start, str(slot.group_id)))
+            conflicts.setdefault((kind, resource, first, second), Conflict(kind, resource, first, second))
+    return sorted(conflicts.values(), key=lambda c: (c.first.start, c.kind, str(c.resource)))
+
+
+def studio_conflicts():
+    """Every double booking among running groups"""
+    return find_conflicts(active_slots())
+
+
+def conflicts_for(candidate_slots, exclude_group_id=None):
+    """Double bookings the candidate slots (a group being created or edited) would cause"""
+    candidates = set(candidate_slots)
+    return [
+        conflict for conflict in find_conflicts(active_slots(exclude_group_id) + list(candidate_slots))
+        if conflict.first in candidates or conflict.second in candidates
+    ]
+
+
+def _when(slot):
+    return f"{slot.day.capitalize()} {slot.time}"
+
+
+def describe(conflict, teacher_names, group_id=None):
+    """One-line explanation, naming the slot of group_id (if given) first"""
+    ours, theirs = conflict.first, conflict.second
+    if theirs.group_id == group_id:
+        ours, theirs = theirs, ours
+    clash = f"{ours.group_name} ({_when(ours)}) overlaps {theirs.group_name} ({_when(theirs)})"
+    if conflict.kind == 'teacher':
+        return f"{teacher_names.get(conflict.resource, 'A teacher')} is double-booked: {clash}"
+    return f"Location '{conflict.resource}' is double-booked: {clash}"
+
+
+def teacher_names(conflicts):
+    """Display names of the teachers involved in conflicts, in one query"""
+    ids = {conflict.resource for conflict in conflicts if conflict.kind == 'teacher'}
+    return {pk: str(teacher) for pk, teacher in Teacher.objects.select_related('user').in_bulk(ids).items()}
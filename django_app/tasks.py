@@ -0,0 +1,163 @@
+"""Lightweight database-backed task queue.
+
+Views enqueue follow-up work with ``enqueue()`` (or ``some_task.enqueue()``);
+``manage.py run_worker`` picks pending rows from the ``Task`` table and runs
+them. Enqueuing inside a transaction commits the task together with the data
+it refers to. Idle workers delete done tasks older than
+``TASK_RETENTION_DAYS``; failed ones stay for inspection.
+"""
+import logging
+import threading
+import time
+import traceback
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import IntegrityError, close_old_connections, transaction
+from django.db.models import Q
+from django.utils import timezone
+
+from .models import Task
+
+logger = logging.getLogger(__name__)
+
+_registry = {}
+
+
+def task(func=None, *, name=None, max_attempts=3):
+    """Register a function as a task that can be enqueued by name"""
+    def decorator(func):
+        task_name = name or f"{func.__module__}.{func.__name__}"
+        _registry[task_name] = (func, max_attempts)
+
+        def enqueue_task(idempotency_key=None, delay=None, **kwargs):
+            return enqueue(task_name, idempotency_key=idempotency_key, delay=delay, **kwargs)
+
+        func.task_name = task_name
+        func.enqueue = enqueue_task
+        return func
+
+    return decorator(func) if func is not None else decorator
+
+
+def enqueue(name, idempotency_key=None, delay=None, **kwargs):
+    """Add a task to the queue.
+
+    With an idempotency key, enqueuing the same key again returns the
+    existing task instead of creating a duplicate.
+    """
+    if name not in _registry:
+        raise KeyError(f"Unknown task: {name}")
+
+    defaults = {
+        'name': name,
+        'payload': kwargs,
+        'max_attempts': _registry[name][1],
+        'run_after': timezone.now() + (delay or timedelta()),
+    }
+    if idempotency_key is None:
+        return Task.objects.create(**defaults)
+
+    try:
+        task_obj, _ = Task.objects.get_or_create(idempotency_key=idempotency_key, defaults=defaults)
+    except IntegrityError:
+        task_obj = Task.objects.get(idempotency_key=idempotency_key)
+    return task_obj
+
+
+def claim_next_task(lease=None):
+    """Atomically claim the next runnable task, or return None.
+
+    A claim is a conditional UPDATE, so concurrent workers never run the same
+    task. Running tasks whose lease expired (crashed worker) are picked up again.
+    """
+    lease = lease or timedelta(seconds=getattr(settings, 'TASK_LEASE_SECONDS', 300))
+    now = timezone.now()
+    runnable = Task.objects.filter(
+        Q(status=Task.STATUS_PENDING, run_after__lte=now)
+        | Q(status=Task.STATUS_RUNNING, locked_until__lt=now)
+    )
+
+    for candidate in runnable.values('pk', 'status', 'locked_until')[:10]:
+        claimed = Task.objects.filter(
+            pk=candidate['pk'], status=candidate['status'], locked_until=candidate['locked_until']
+        ).update(status=Task.STATUS_RUNNING, locked_until=now + lease)
+        if claimed:
+            return Task.objects.get(pk=candidate['pk'])
+    return None
+
+
+def run_task(task_obj):
+    """Run a claimed task, recording success, retry or failure"""
+    task_obj.attempts += 1
+    try:
+        func, _ = _registry[task_obj.name]
+        with transaction.atomic():
+            func(**task_obj.payload)
+    except Exception:
+        task_obj.last_error = traceback.format_exc()
+        if task_obj.attempts < task_obj.max_attempts and task_obj.name in _registry:
+            # Exponential backoff: 2s, 4s, 8s, ...
+            task_obj.status = Task.STATUS_PENDING
+            task_obj.run_after = timezone.now() + timedelta(seconds=2 ** task_obj.attempts)
+        else:
+            task_obj.status = Task.STATUS_FAILED
+            task_obj.finished_at = timezone.now()
+        logger.warning("Task %s failed (attempt %s/%s)", task_obj, task_obj.attempts, task_obj.max_attempts)
+    else:
+        task_obj.status = Task.STATUS_DONE
+        task_obj.finished_at = timezone.now()
+        task_obj.last_error = ''
+
+    task_obj.locked_until = None
+    task_obj.save(update_fields=['attempts', 'status', 'run_after', 'locked_until', 'last_error', 'finished_at'])
+    return task_obj
+
+
+def purge_done_tasks(older_than=None, batch_size=1000):
+    """Delete tasks that finished successfully before the retention window, returning how many"""
+    older_than = older_than or timedelta(days=getattr(settings, 'TASK_RETENTION_DAYS', 7))
+    cutoff = timezone.now() - older_than
+    # A task finishes after it becomes runnable, so run_after lets the scan use the status index
+    done = Task.objects.filter(status=Task.STATUS_DONE, run_after__lt=cutoff, finished_at__lt=cutoff)
+    purged = 0
+    while True:
+        # Small batches keep each DELETE's locks short while workers claim tasks
+        batch = list(done.values_list('pk', flat=True)[:batch_size])
+        if not batch:
+            return purged
+        purged += Task.objects.filter(pk__in=batch).delete()[0]
+
+
+def work(once=False, poll_interval=1.0, stop_event=None):
+    """Claim and run tasks until stopped; with once=True, until the queue is drained"""
+    stop_event = stop_event or threading.Event()
+    processed = 0
+    next_purge = 0
+
+    while not stop_event.is_set():
+        close_old_connections()
+        task_obj = claim_next_task()
+        if task_obj is None:
+            if time.monotonic() >= next_purge:
+                purge_done_tasks()
+                next_purge = time.monotonic() + getattr(settings, 'TASK_PURGE_INTERVAL', 3600)
+            if once:
+                break
+            stop_event.wait(poll_interval)
+            continue
+        run_task(task_obj)
+        processed += 1
+
+    close_old_connections()
+    return processed
+
+
+def work_in_process(once, poll_interval):
+    """Entry point for worker processes started by run_worker"""
+    import django
+    django.setup()
+    try:
+        return work(once=once, poll_interval=poll_interval)
+    except KeyboardInterrupt:
+        return 0
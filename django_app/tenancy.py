@@ -0,0 +1,216 @@
+"""Studio tenancy: one deployment serving several studios.
+
+Every tenant table carries a ``studio`` foreign key. ``Group``, ``Pass``,
+``Teacher`` and ``Student`` get theirs from the current studio; rows hanging
+off them (visits, purchases, payment events, balances, archives) copy it
+from their parent (``studio_parent``) when saved or bulk-created, so they
+can be filtered, and indexed, by studio without a join.
+
+``TenantMiddleware`` resolves the request's host to a studio id with one
+query and keeps it in a context variable; every ``TenantManager`` filters on
+it, so views never see another studio's rows. Outside a request (management
+commands, the task worker) nothing is filtered unless the code opts in with
+``use_studio``.
+
+Hosts that match no studio belong to the default studio, whose id is fixed
+(``DEFAULT_STUDIO_ID``) and which ``ensure_default_studio`` recreates after
+every migrate or flush.
+
+Users belong to studios through ``Studio.members``: new users join the
+studio they are created in, and teachers and students join theirs. The auth
+backend (``accounts.StudioModelBackend``) only signs in, and only keeps
+signed in, users who belong to the request's studio (``is_member``).
+"""
+from contextlib import contextmanager
+from contextvars import ContextVar
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction
+from django.apps import apps
+from django.conf import settings
+from django.core.management.color import no_style
+from django.db import connections, models
+from django.db.models.signals import post_save
+
+_current_studio = ContextVar('current_studio', default=None)
+
+
+def current_studio_id():
+    """Id of the studio the current request (or use_studio block) belongs to; None outside one"""
+    return _current_studio.get()
+
+
+def default_studio_id():
+    """Default for studio foreign keys: the current studio, else the default studio"""
+    return current_studio_id() or settings.DEFAULT_STUDIO_ID
+
+
+@contextmanager
+def use_studio(studio):
+    """Scope queries and new rows to a studio (instance or id) for the duration of the block"""
+    token = _current_studio.set(getattr(studio, 'pk', studio))
+    try:
+        yield
+    finally:
+        _current_studio.reset(token)
+
+
+def cache_key(key, studio_id=None):
+    """Prefix a cache key with a studio (default: the current one) so studios never share cached data"""
+    return f'studio:{studio_id or default_studio_id()}:{key}'
+
+
+def inherit_studio(model, objs):
+    """Give new rows of a child model (one with ``studio_parent``) the studio of their parent row"""
+    parent = getattr(model, 'studio_parent', None)
+    if parent is None:
+        return
+    field = model._meta.get_field(parent)
+    missing = {getattr(obj, field.attname) for obj in objs if not field.is_cached(obj)}
+    # Parents are read unscoped: a command may write rows of any studio
+    studios = dict(
+        field.related_model._base_manager.filter(pk__in=missing).values_list('pk', 'studio_id')
+    ) if missing else {}
+    for obj in objs:
+        if field.is_cached(obj):
+            obj.studio_id = field.get_cached_value(obj).studio_id
+        else:
+            obj.studio_id = studios.get(getattr(obj, field.attname), obj.studio_id)
+
+
+class TenantQuerySet(models.QuerySet):
+    def for_studio(self, studio):
+        return self.filter(studio=studio)
+
+    def bulk_create(self, objs, *args, **kwargs):
+        objs = list(objs)
+        inherit_studio(self.model, objs)
+        return super().bulk_create(objs, *args, **kwargs)
+
+
+class TenantManager(models.Manager.from_queryset(TenantQuerySet)):
+    """Default manager that only returns rows of the current studio (all rows outside a request)"""
+
+    def get_queryset(self):
+        queryset = super().get_queryset()
+        studio_id = _current_studio.get()
+        return queryset if studio_id is None else queryset.for_studio(studio_id)
+
+
+class TenantModel(models.Model):
+    """Base for rows whose studio is copied from their parent row (named by ``studio_parent``)"""
+    studio_parent = None
+
+    class Meta:
+        abstract = True
+
+    def save(self, *args, **kwargs):
+        if self._state.adding:
+            inherit_studio(type(self), [self])
+        super().save(*args, **kwargs)
+
+
+def scoped(queryset):
+    """Scope a queryset built outside the request (e.g. form field choices) to the current studio"""
+    studio_id = _current_studio.get()
+    if studio_id is None or not isinstance(queryset, TenantQuerySet):
+        return queryset
+    return queryset.for_studio(studio_id)
+
+
+def _host(request):
+    return request.get_host().split(':', 1)[0].lower()
+
+
+def _studio_for_host(host):
+    Studio = apps.get_model('django_app', 'Studio')
+    return Studio.objects.filter(hostname=host).values_list('pk', flat=True)
+
+
+def _memberships(user, studio_id):
+    Studio = apps.get_model('django_app', 'Studio')
+    return Studio.members.through.objects.filter(user_id=user.pk, studio_id=studio_id)
+
+
+def is_member(user):
+    """Whether a user may use the current studio: superusers anywhere, others only in their studios"""
+    studio_id = _current_studio.get()
+    if studio_id is None or user.is_superuser:
+        return True
+    return _memberships(user, studio_id).exists()
+
+
+async def ais_member(user):
+    studio_id = _current_studio.get()
+    if studio_id is None or user.is_superuser:
+        return True
+    return await _memberships(user, studio_id).aexists()
+
+
+class TenantMiddleware:
+    """Scope the request to the studio serving its host (``request.studio_id``)"""
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        if iscoroutinefunction(self.get_response):
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+        token = self.start(request, _studio_for_host(_host(request)).first())
+        try:
+            return self.get_response(request)
+        finally:
+            _current_studio.reset(token)
+
+    async def __acall__(self, request):
+        token = self.start(request, await _studio_for_host(_host(request)).afirst())
+        try:
+            return await self.get_response(request)
+        finally:
+            _current_studio.reset(token)
+
+    def start(self, request, studio_id):
+        request.studio_id = studio_id or settings.DEFAULT_STUDIO_ID
+        return _current_studio.set(request.studio_id)
+
+
+def ensure_default_studio(using='default', apps=apps, **kwargs):
+    """Create the default studio if it is missing (post_migrate; also runs after test flushes)"""
+    try:
+        Studio = apps.get_model('django_app', 'Studio')
+    except LookupError:
+        # Migrated back to before Studio existed
+        return
+    _, created = Studio.objects.using(using).get_or_create(
+        pk=settings.DEFAULT_STUDIO_ID, defaults={'name': 'Main studio', 'slug': 'main'}
+    )
+    if created:
+        # An explicit id does not advance PostgreSQL's sequence
+        connection = connections[using]
+        with connection.cursor() as cursor:
+            for sql in connection.ops.sequence_reset_sql(no_style(), [Studio]):
+                cursor.execute(sql)
+
+
+def _user_created(sender, instance, created, raw=False, **kwargs):
+    if created and not raw:
+        instance.studios.add(default_studio_id())
+
+
+def _member_saved(sender, instance, created, raw=False, **kwargs):
+    # A teacher or student always belongs to their own studio
+    if created and not raw:
+        instance.user.studios.add(instance.studio_id)
+
+
+def install():
+    """Connect the studio membership signals (called from AppConfig.ready)"""
+    post_save.connect(_user_created, sender=settings.AUTH_USER_MODEL, dispatch_uid='tenancy_user_created')
+    for model_name in ('Teacher', 'Student'):
+        post_save.connect(
+            _member_saved, sender=apps.get_model('django_app', model_name),
+            dispatch_uid=f'tenancy_{model_name.lower()}_member',
+        )
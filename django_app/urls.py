@@ -15,8 +15,20 @@ urlpatterns = [
     path('students/', views.students, name='students'),
     path('students/add/', views.add_student, name='add_student'),
     path('students/<int:student_id>/', views.student_detail, name='student_detail'),
+    path('students/debtors/', views.debtors, name='debtors'),
 
     # Purchases
     path('students/<int:student_id>/add-purchase/', views.add_purchase, name='add_purchase'),
     path('purchases/<int:purchase_id>/mark-paid/', views.mark_purchase_paid, name='mark_purchase_paid'),
+    path('purchases/mark-paid/', views.mark_purchases_paid, name='mark_purchases_paid'),
+
+    # Reports
+    path('reports/payroll/', views.payroll_report, name='payroll_report'),
+
+    # Calendar feeds
+    path('calendar/teacher/<int:teacher_id>.ics', views.teacher_calendar, name='teacher_calendar'),
+    path('calendar/group/<int:group_id>.ics', views.group_calendar, name='group_calendar'),
+
+    # Monitoring
+    path('metrics', views.metrics_view, name='metrics'),
 ]
\ No newline at end of file
@@ -1,18 +1,30 @@
+import asyncio
+import uuid
 from datetime import datetime, timedelta
-from django.shortcuts import render, get_object_or_404, redirect
+from django.shortcuts import render, get_object_or_404, aget_object_or_404, redirect
 from django.contrib.auth.decorators import login_required
 from django.contrib.auth import authenticate, login, logout
 from django.contrib.auth.models import User
 from django.contrib import messages
+from django.core.paginator import Paginator
 from django.db.models import Q, Count, Prefetch
-from django.http import JsonResponse
+from django.http import (
+    Http404, HttpResponse, HttpResponseForbidden, HttpResponseNotModified, JsonResponse, StreamingHttpResponse,
+)
 from django.views.decorators.http import require_POST
 from django.views.decorators.csrf import csrf_exempt
 from django.utils import timezone
+from django.utils.cache import patch_cache_control
+from django.utils.http import parse_etags
+from django.conf import settings
+from django.urls import reverse
 from django.db import transaction
 from django.forms import modelformset_factory
 
-from .models import Group, Pass, Teacher, Student, StudentVisit, Purchase
+from .models import Group, Pass, Teacher, Student, StudentVisit, Purchase, build_active_passes
+from . import attendance, ical, metrics, payments, payroll, schedule
+from .roster import display_name, snapshot
+from .routers import replica_reads
 from .forms import (
     GroupForm, StudentForm, PurchaseForm, StudentVisitFormSet,
     StudentSelectionForm, NewStudentForm
@@ -38,20 +50,42 @@ def logout_view(request):
     return redirect('login')
 
 
+async def _alist(queryset):
+    """Evaluate a queryset with the async ORM"""
+    return [obj async for obj in queryset.aiterator(chunk_size=2000)]
+
+
+async def _aresolve_user(request):
+    """Load the user without sync DB access and pin it on the request for templates"""
+    user = await request.auser()
+    request.user = user
+    return user
+
+
 @login_required
-def dashboard(request):
+async def dashboard(request):
     """Dashboard showing upcoming lessons for teachers"""
-    today = timezone.now().date()
+    # Lesson times are local wall-clock times, so "today" must be the local date too
+    now = timezone.localtime()
+    today = now.date()
 
     # Get user's role
-    is_teacher = hasattr(request.user, 'teacher')
-    is_admin = request.user.is_staff or request.user.is_superuser
+    user = await _aresolve_user(request)
+    teacher = await Teacher.objects.filter(user=user).afirst()
+    is_teacher = teacher is not None
+    is_admin = user.is_staff or user.is_superuser
 
     if is_teacher:
-        teacher = request.user.teacher
         groups = teacher.groups.filter(finished_at__isnull=True)
     else:
         groups = Group.objects.filter(finished_at__isnull=True)
+    groups = groups.prefetch_related('teachers__user')
+
+    teacher_group_count = None
+    if is_teacher:
+        groups, teacher_group_count = await asyncio.gather(_alist(groups), teacher.groups.acount())
+    else:
+        groups = await _alist(groups)
 
     # Generate upcoming lessons based on schedule
     upcoming_lessons = []
@@ -60,18 +94,14 @@ def dashboard(request):
             # Calculate next occurrence of this lesson
             day_name = schedule_item['day']
             time_str = schedule_item['time']
+            target_weekday = schedule.WEEKDAYS.get(day_name, 0)
 
-            # Convert day name to weekday number
-            day_mapping = {
-                'mon': 0, 'tue': 1, 'wed': 2, 'thu': 3,
-                'fri': 4, 'sat': 5, 'sun': 6
-            }
-            target_weekday = day_mapping.get(day_name, 0)
-
-            # Find next occurrence
+            # Find next occurrence; a lesson stays upcoming until it has ended
             days_until = (target_weekday - today.weekday()) % 7
-            if days_until == 0 and timezone.now().time() > timezone.datetime.strptime(time_str, '%H:%M').time():
-                days_until = 7  # If today but time has passed, next week
+            starts = datetime.strptime(time_str, '%H:%M').time()
+            ends = datetime.combine(today, starts) + timedelta(minutes=group.duration_minutes)
+            if days_until == 0 and now.replace(tzinfo=None) >= ends:
+                days_until = 7  # If today but the lesson is over, next week
 
             lesson_date = today + timedelta(days=days_until)
 
@@ -81,6 +111,7 @@ def dashboard(request):
                     'group': group,
                     'date': lesson_date,
                     'time': time_str,
+                    'end_time': schedule.lesson_end(time_str, group.duration_minutes),
                     'day': day_name,
                 })
 
@@ -91,6 +122,10 @@ def dashboard(request):
         'upcoming_lessons': upcoming_lessons[:10],  # Show only next 10 lessons
         'is_teacher': is_teacher,
         'is_admin': is_admin,
+        'teacher_group_count': teacher_group_count,
+        'calendar_url': request.build_absolute_uri(
+            reverse('teacher_calendar', args=[teacher.id]) + f"?token={ical.feed_token('teacher', teacher.id)}"
+        ) if is_teacher else None,
     }
     return render(request, 'django_app/dashboard.html', context)
 
@@ -120,61 +155,78 @@ def lesson_detail(request, group_id, lesson_date):
     group = get_object_or_404(Group, id=group_id)
     lesson_date = datetime.strptime(lesson_date, '%Y-%m-%d').date()
 
-    # Check if user is teacher of this group or admin
-    is_teacher = hasattr(request.user, 'teacher') and group in request.user.teacher.groups.all()
+    # Check if user is admin or teacher of this group
     is_admin = request.user.is_staff or request.user.is_superuser
-
-    if not (is_teacher or is_admin):
+    if not (is_admin or group.teachers.filter(user_id=request.user.pk).exists()):
         messages.error(request, 'You do not have permission to mark attendance for this group.')
         return redirect('dashboard')
 
-    # Get existing visits for this lesson
-    existing_visits = StudentVisit.objects.filter(group=group, date=lesson_date)
-    existing_student_ids = set(existing_visits.values_list('student_id', flat=True))
-
-    # Get all students in this group
-    group_students = group.students.all()
-
     if request.method == 'POST':
         # Handle attendance marking
         student_ids = request.POST.getlist('students')
         skipped_ids = request.POST.getlist('skipped')
         new_student_id = request.POST.get('new_student')
 
-        with transaction.atomic():
-            # Clear existing visits for this lesson
-            existing_visits.delete()
-
-            # Add new student if provided
-            if new_student_id:
-                student = get_object_or_404(Student, id=new_student_id)
-                if student not in group_students:
-                    group.students.add(student)
-                student_ids.append(new_student_id)
-
-            # Create new visits
-            for student_id in student_ids:
-                student = get_object_or_404(Student, id=student_id)
-                is_skipped = student_id in skipped_ids
-                StudentVisit.objects.create(
-                    student=student,
-                    group=group,
-                    date=lesson_date,
-                    skipped=is_skipped
-                )
+        # Add new student if provided
+        if new_student_id:
+            student = get_object_or_404(Student.objects.only('id'), id=new_student_id)
+            if not group.students.filter(id=student.id).exists():
+                group.students.add(student)
+            student_ids.append(new_student_id)
+
+        submitted = attendance.attendance_state(student_ids, skipped_ids)
+        if Student.objects.filter(id__in=submitted).count() != len(submitted):
+            raise Http404('No Student matches the given query.')
+
+        # Forms rendered before versioning (or with a mangled version) carry no base state: their submission wins
+        base = version = None
+        try:
+            version = int(request.POST['version'])
+        except (KeyError, ValueError):
+            pass
+        else:
+            base = attendance.attendance_state(
+                request.POST.get('base_students', '').split(), request.POST.get('base_skipped', '').split()
+            )
+
+        result = attendance.save_attendance(group, lesson_date, submitted, base=base, version=version)
+        if result.changed:
+            payroll.attendance_changed(group, lesson_date, result.version)
+        transaction.on_commit(lambda: metrics.inc(metrics.ATTENDANCE_SAVES))
+
+        if result.conflicts:
+            names = ', '.join(str(student) for student in Student.objects.filter(id__in=result.conflicts))
+            messages.warning(
+                request,
+                f'Attendance was changed by someone else while you edited it. '
+                f'Other changes were saved; please review: {names}'
+            )
+            return redirect('lesson_detail', group_id=group.id, lesson_date=lesson_date.isoformat())
 
         messages.success(request, f'Attendance updated for {group.name} on {lesson_date}')
         return redirect('dashboard')
 
-    # Get all students for adding new ones
-    all_students = Student.objects.exclude(id__in=group_students.values_list('id', flat=True))
+    # Read the version before the visits, so a save in between is merged rather than overwritten
+    lesson_version = attendance.current_version(group, lesson_date)
+    visits = dict(StudentVisit.objects.filter(group=group, date=lesson_date).values_list('student_id', 'skipped'))
+    roster = snapshot(group)
+
+    # Students from other groups for the "add student" picker
+    other_students = [
+        (pk, display_name(first_name, last_name, username), email)
+        for pk, first_name, last_name, username, email in Student.objects.exclude(groups=group).order_by(
+            'user__first_name', 'user__last_name', 'pk'
+        ).values_list('pk', 'user__first_name', 'user__last_name', 'user__username', 'user__email')
+    ]
 
     context = {
         'group': group,
         'lesson_date': lesson_date,
-        'group_students': group_students,
-        'existing_visits': {v.student_id: v for v in existing_visits},
-        'all_students': all_students,
+        'roster': [(student, student.id in visits, visits.get(student.id, False)) for student in roster],
+        'all_students': other_students,
+        'lesson_version': lesson_version,
+        'base_students': ' '.join(str(student_id) for student_id in visits),
+        'base_skipped': ' '.join(str(student_id) for student_id, skipped in visits.items() if skipped),
     }
     return render(request, 'django_app/lesson_detail.html', context)
 
@@ -195,11 +247,21 @@ def add_student(request):
 
 
 @login_required
-def students(request):
+async def students(request):
     """List all students with their pass information"""
-    students = Student.objects.select_related('user').prefetch_related(
-        'purchases__pass_', 'groups'
-    ).all()
+    await _aresolve_user(request)
+    students, purchases = await asyncio.gather(
+        _alist(Student.objects.select_related('user', 'balance').prefetch_related('groups')),
+        _alist(Purchase.objects.filter(paid_at__isnull=False).unexpired().select_related(
+            'dance_pass__group'
+        ).with_visits_used()),
+    )
+
+    purchases_by_student = {}
+    for purchase in purchases:
+        purchases_by_student.setdefault(purchase.student_id, []).append(purchase)
+    for student in students:
+        student.active_passes = build_active_passes(purchases_by_student.get(student.id, []))
 
     context = {
         'students': students,
@@ -207,19 +269,77 @@ def students(request):
     return render(request, 'django_app/students.html', context)
 
 
+DEBTOR_SORTS = {
+    'owed': ('-total_owed', 'student_id'),
+    'oldest': ('oldest_unpaid', 'student_id'),
+    'name': ('student__user__first_name', 'student__user__last_name', 'student_id'),
+}
+
+
 @login_required
-def student_detail(request, student_id):
+@replica_reads
+def debtors(request):
+    """Students with unpaid purchases, with total owed, oldest unpaid date and their balance"""
+    sort = request.GET.get('sort', 'owed')
+    if sort not in DEBTOR_SORTS:
+        sort = 'owed'
+    rows = Purchase.objects.debtors().order_by(*DEBTOR_SORTS[sort])
+    page = Paginator(rows, 50).get_page(request.GET.get('page'))
+
+    context = {
+        'page': page,
+        'sort': sort,
+    }
+    return render(request, 'django_app/debtors.html', context)
+
+
+@login_required
+@replica_reads
+def payroll_report(request):
+    """Lessons taught and hours per teacher for one month (admin only); ?format=csv downloads it"""
+    if not (request.user.is_staff or request.user.is_superuser):
+        messages.error(request, 'Only administrators can view payroll.')
+        return redirect('dashboard')
+
+    last_month = timezone.localdate().replace(day=1) - timedelta(days=1)
+    try:
+        month = datetime.strptime(request.GET.get('month', ''), '%Y-%m').date()
+    except ValueError:
+        month = last_month.replace(day=1)
+    report = payroll.monthly_report(month.year, month.month)
+
+    if request.GET.get('format') == 'csv':
+        response = StreamingHttpResponse(payroll.csv_lines(report), content_type='text/csv; charset=utf-8')
+        response['Content-Disposition'] = f'attachment; filename="payroll-{month:%Y-%m}.csv"'
+        return response
+
+    context = {
+        'report': report,
+        'month': month,
+        'closed': payroll.is_closed(month.year, month.month),
+        'total_hours': sum(row.minutes for row in report) / 60,
+    }
+    return render(request, 'django_app/payroll.html', context)
+
+
+@login_required
+async def student_detail(request, student_id):
     """Show student details and manage purchases"""
-    student = get_object_or_404(Student, id=student_id)
-    active_passes = student.get_active_passes()
-    recent_visits = student.visits.select_related('group').order_by('-date')[:10]
-    purchases = student.purchases.select_related('dance_pass', 'cashier__user').order_by('-created_at')
+    await _aresolve_user(request)
+    student = await aget_object_or_404(Student.objects.select_related('user', 'balance'), id=student_id)
+    active_passes, recent_visits, purchases = await asyncio.gather(
+        student.aget_active_passes(),
+        _alist(student.visits.select_related('group').order_by('-date')[:10]),
+        _alist(student.purchases.select_related('dance_pass__group', 'cashier__user').order_by('-created_at')),
+    )
 
     context = {
         'student': student,
         'active_passes': active_passes,
         'recent_visits': recent_visits,
         'purchases': purchases,
+        # Lets a resubmitted "Mark Paid" form be recognised as a retry
+        'form_key': uuid.uuid4().hex,
     }
     return render(request, 'django_app/student_detail.html', context)
 
@@ -241,7 +361,12 @@ def add_purchase(request, student_id):
             if form.cleaned_data['payment_method']:
                 purchase.paid_at = timezone.now()
 
-            purchase.save()
+            with transaction.atomic():
+                purchase.save()
+                payments.record_purchase(purchase)
+                transaction.on_commit(lambda: metrics.inc(
+                    metrics.PURCHASES, paid='true' if purchase.paid_at else 'false'
+                ))
             messages.success(request, 'Purchase added successfully.')
             return redirect('student_detail', student_id=student.id)
     else:
@@ -257,14 +382,81 @@ def add_purchase(request, student_id):
 @require_POST
 def mark_purchase_paid(request, purchase_id):
     """Mark a purchase as paid"""
-    purchase = get_object_or_404(Purchase, id=purchase_id)
-
-    if not purchase.paid_at:
-        purchase.paid_at = timezone.now()
-        purchase.payment_method = request.POST.get('payment_method', '')
-        if hasattr(request.user, 'teacher'):
-            purchase.cashier = request.user.teacher
-        purchase.save()
+    purchase = get_object_or_404(Purchase.objects.only('id', 'student_id'), id=purchase_id)
+
+    report = payments.mark_paid(
+        [purchase.id],
+        request.POST.get('payment_method', ''),
+        cashier=getattr(request.user, 'teacher', None),
+        idempotency_key=payments.idempotency_key_for(request, f'mark-paid:{purchase.id}'),
+    )
+    if report['updated']:
         messages.success(request, 'Purchase marked as paid.')
+    elif not report['replayed']:
+        messages.info(request, 'Purchase was already paid.')
+
+    return redirect('student_detail', student_id=purchase.student_id)
 
-    return redirect('student_detail', student_id=purchase.student.id)
+
+@login_required
+@require_POST
+def mark_purchases_paid(request):
+    """Mark several purchases as paid in one statement and report what changed"""
+    try:
+        purchase_ids = [int(purchase_id) for purchase_id in request.POST.getlist('purchases')]
+    except ValueError:
+        return JsonResponse({'error': 'Invalid purchase id.'}, status=400)
+    payment_method = request.POST.get('payment_method', '')
+    if payment_method not in dict(Purchase.PAYMENT_METHODS):
+        return JsonResponse({'error': 'Choose a valid payment method.'}, status=400)
+
+    report = payments.mark_paid(
+        purchase_ids,
+        payment_method,
+        cashier=getattr(request.user, 'teacher', None),
+        idempotency_key=payments.idempotency_key_for(request, 'mark-paid-bulk'),
+    )
+    return JsonResponse(report)
+
+
+def _calendar_rows(groups):
+    return list(groups.order_by('pk').values(*ical.FEED_FIELDS))
+
+
+def _calendar_response(request, name, groups):
+    etag = ical.etag_for(name, groups)
+    if etag in parse_etags(request.headers.get('If-None-Match', '')):
+        response = HttpResponseNotModified()
+    else:
+        response = HttpResponse(ical.cached_render(name, groups, etag), content_type='text/calendar; charset=utf-8')
+    response['ETag'] = etag
+    patch_cache_control(response, private=True, max_age=300)
+    return response
+
+
+@replica_reads
+def teacher_calendar(request, teacher_id):
+    """iCal feed of a teacher's lessons (authorised by the signed token in the URL)"""
+    if not ical.check_token('teacher', teacher_id, request.GET.get('token')):
+        raise Http404('No calendar found.')
+    teacher = get_object_or_404(Teacher.objects.select_related('user'), id=teacher_id)
+    return _calendar_response(request, f'{teacher} - lessons', _calendar_rows(Group.objects.filter(teachers=teacher)))
+
+
+@replica_reads
+def group_calendar(request, group_id):
+    """iCal feed of one group's lessons (authorised by the signed token in the URL)"""
+    if not ical.check_token('group', group_id, request.GET.get('token')):
+        raise Http404('No calendar found.')
+    groups = _calendar_rows(Group.objects.filter(id=group_id))
+    if not groups:
+        raise Http404('No calendar found.')
+    return _calendar_response(request, groups[0]['name'], groups)
+
+
+def metrics_view(request):
+    """Prometheus scrape endpoint (allowed IPs or staff only)"""
+    allowed_ips = getattr(settings, 'METRICS_ALLOWED_IPS', [])
+    if request.META.get('REMOTE_ADDR') not in allowed_ips and not request.user.is_staff:
+        return HttpResponseForbidden('Forbidden')
+    return HttpResponse(metrics.render(), content_type='text/plain; version=0.0.4; charset=utf-8')
@@ -11,6 +11,7 @@ https://docs.djangoproject.com/en/5.2/ref/settings/
 """
 
 import os
+from importlib.util import find_spec
 from pathlib import Path
 import dj_database_url
 
@@ -47,10 +48,14 @@ INSTALLED_APPS = [
 
 MIDDLEWARE = [
     'django.middleware.security.SecurityMiddleware',
+    'django_app.middleware.RequestMetricsMiddleware',
+    'django_app.routers.ReplicaPinMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
+    'django_app.tenancy.TenantMiddleware',
     'django.middleware.csrf.CsrfViewMiddleware',
     'django.contrib.auth.middleware.AuthenticationMiddleware',
+    'django_app.middleware.ProfilingMiddleware',
     'django.contrib.messages.middleware.MessageMiddleware',
     'django.middleware.clickjacking.XFrameOptionsMiddleware',
 ]
@@ -59,7 +64,8 @@ ROOT_URLCONF = 'django_proj.urls'
 
 TEMPLATES = [
     {
-        'BACKEND': 'django.template.backends.django.DjangoTemplates',
+        # DjangoTemplates with per-request render timing (django_app.instrumentation)
+        'BACKEND': 'django_app.instrumentation.TimedDjangoTemplates',
         'DIRS': [],
         'APP_DIRS': True,
         'OPTIONS': {
@@ -83,9 +89,25 @@ DATABASES = {
     'default': dj_database_url.config() if os.environ.get('DATABASE_URL') else {
         'ENGINE': 'django.db.backends.sqlite3',
         'NAME': BASE_DIR / 'db.sqlite3',
+        'OPTIONS': {
+            # Take the write lock at BEGIN and wait for it, instead of failing mid-transaction
+            'transaction_mode': 'IMMEDIATE',
+            'timeout': 20,
+        },
     }
 }
 
+# Optional read replica for reports, exports and admin changelists (see django_app.routers).
+# Locally this can be a copy of the SQLite file, e.g. REPLICA_DATABASE_URL=sqlite:///replica.sqlite3
+if os.environ.get('REPLICA_DATABASE_URL'):
+    DATABASES['replica'] = {
+        **dj_database_url.parse(os.environ['REPLICA_DATABASE_URL']),
+        'TEST': {'MIRROR': 'default'},
+    }
+DATABASE_ROUTERS = ['django_app.routers.ReplicaRouter']
+# After a write, a client reads from the primary for this long so it sees its own changes
+REPLICA_PIN_SECONDS = int(os.environ.get('REPLICA_PIN_SECONDS', '10'))
+
 
 # Password validation
 # https://docs.djangoproject.com/en/5.2/ref/settings/#auth-password-validators
@@ -105,6 +127,53 @@ AUTH_PASSWORD_VALIDATORS = [
     },
 ]
 
+# Login performance profile (django_app.accounts). Argon2 needs the argon2-cffi package;
+# hashes from any listed hasher still verify and are upgraded on the next successful login.
+PASSWORD_HASH_ALGORITHM = os.environ.get('PASSWORD_HASH_ALGORITHM', 'argon2' if find_spec('argon2') else 'scrypt')
+PASSWORD_SCRYPT_WORK_FACTOR = int(os.environ.get('PASSWORD_SCRYPT_WORK_FACTOR', str(2 ** 15)))
+PASSWORD_SCRYPT_BLOCK_SIZE = int(os.environ.get('PASSWORD_SCRYPT_BLOCK_SIZE', '8'))
+PASSWORD_SCRYPT_PARALLELISM = int(os.environ.get('PASSWORD_SCRYPT_PARALLELISM', '1'))
+PASSWORD_ARGON2_TIME_COST = int(os.environ.get('PASSWORD_ARGON2_TIME_COST', '2'))
+PASSWORD_ARGON2_MEMORY_COST = int(os.environ.get('PASSWORD_ARGON2_MEMORY_COST', '19456'))  # KiB
+PASSWORD_ARGON2_PARALLELISM = int(os.environ.get('PASSWORD_ARGON2_PARALLELISM', '1'))
+_PASSWORD_HASHERS = {
+    'argon2': 'django_app.accounts.TunedArgon2PasswordHasher',
+    'scrypt': 'django_app.accounts.TunedScryptPasswordHasher',
+    'pbkdf2_sha256': 'django.contrib.auth.hashers.PBKDF2PasswordHasher',
+    'pbkdf2_sha1': 'django.contrib.auth.hashers.PBKDF2SHA1PasswordHasher',
+    'bcrypt_sha256': 'django.contrib.auth.hashers.BCryptSHA256PasswordHasher',
+}
+# The first hasher hashes new passwords, the rest only verify
+PASSWORD_HASHERS = [_PASSWORD_HASHERS.pop(PASSWORD_HASH_ALGORITHM), *_PASSWORD_HASHERS.values()]
+
+# Cache shared by every worker process (Redis or memcached). Without one each process has its own
+# LocMem cache, which must not hold sessions, users or anything else another process may invalidate.
+if os.environ.get('REDIS_URL'):
+    CACHES = {'default': {
+        'BACKEND': 'django.core.cache.backends.redis.RedisCache', 'LOCATION': os.environ['REDIS_URL'],
+    }}
+elif os.environ.get('MEMCACHED_LOCATION'):
+    CACHES = {'default': {
+        'BACKEND': 'django.core.cache.backends.memcached.PyMemcacheCache',
+        'LOCATION': os.environ['MEMCACHED_LOCATION'].split(','),
+    }}
+else:
+    CACHES = {'default': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache'}}
+SHARED_CACHE = CACHES['default']['BACKEND'] != 'django.core.cache.backends.locmem.LocMemCache'
+
+# With a shared cache, sessions are read from it and written through to the database
+SESSION_ENGINE = os.environ.get(
+    'SESSION_ENGINE',
+    'django.contrib.sessions.backends.cached_db' if SHARED_CACHE else 'django.contrib.sessions.backends.db',
+)
+# The logged-in user is cached too (0 turns that off); saving or deleting the user drops it
+AUTHENTICATION_BACKENDS = ['django_app.accounts.CachedModelBackend']
+AUTH_USER_CACHE_SECONDS = int(os.environ.get('AUTH_USER_CACHE_SECONDS', '300' if SHARED_CACHE else '0'))
+# Form model choices are served from the cache for this long (0 turns that off)
+CHOICES_CACHE_SECONDS = int(os.environ.get('CHOICES_CACHE_SECONDS', '3600' if SHARED_CACHE else '0'))
+# Late attendance edits of a closed month queue a rebuild of its cached payroll report for the worker
+PAYROLL_WARM_CACHE = os.environ.get('PAYROLL_WARM_CACHE', '1' if SHARED_CACHE else '0') == '1'
+
 
 # Internationalization
 # https://docs.djangoproject.com/en/5.2/topics/i18n/
@@ -130,6 +199,63 @@ LOGIN_REDIRECT_URL = '/'
 LOGOUT_REDIRECT_URL = '/login/'
 LOGIN_URL = '/login/'
 
+# Background task worker (manage.py run_worker)
+TASK_WORKER_POOL = os.environ.get('TASK_WORKER_POOL', 'thread')
+TASK_WORKER_CONCURRENCY = int(os.environ.get('TASK_WORKER_CONCURRENCY', '1'))
+TASK_POLL_INTERVAL = float(os.environ.get('TASK_POLL_INTERVAL', '1.0'))
+TASK_LEASE_SECONDS = int(os.environ.get('TASK_LEASE_SECONDS', '300'))
+# Done tasks are deleted after this many days; idle workers purge at most every TASK_PURGE_INTERVAL seconds
+TASK_RETENTION_DAYS = int(os.environ.get('TASK_RETENTION_DAYS', '7'))
+TASK_PURGE_INTERVAL = int(os.environ.get('TASK_PURGE_INTERVAL', '3600'))
+
+# Request instrumentation (django_app.middleware.RequestMetricsMiddleware)
+REQUEST_METRICS_SLOW_MS = int(os.environ.get('REQUEST_METRICS_SLOW_MS', '500'))
+REQUEST_METRICS_MAX_QUERIES = int(os.environ.get('REQUEST_METRICS_MAX_QUERIES', '50'))
+REQUEST_METRICS_TOP_QUERIES = int(os.environ.get('REQUEST_METRICS_TOP_QUERIES', '5'))
+# Server-Timing headers go to staff users only (or everyone with DEBUG on)
+REQUEST_METRICS_SERVER_TIMING = os.environ.get('REQUEST_METRICS_SERVER_TIMING', '1') == '1'
+
+# Slow-query sampler: the worker EXPLAINs the slowest statements of requests over REQUEST_METRICS_SLOW_MS
+SLOW_QUERY_EXPLAIN = os.environ.get('SLOW_QUERY_EXPLAIN', '1') == '1'
+SLOW_QUERY_EXPLAIN_COUNT = int(os.environ.get('SLOW_QUERY_EXPLAIN_COUNT', '3'))
+SLOW_QUERY_PLANS_MAX = int(os.environ.get('SLOW_QUERY_PLANS_MAX', '500'))
+
+# Sampling profiler (django_app.middleware.ProfilingMiddleware)
+PROFILING_BACKEND = os.environ.get('PROFILING_BACKEND', 'cprofile')
+PROFILING_SAMPLE_RATE = float(os.environ.get('PROFILING_SAMPLE_RATE', '0'))
+PROFILING_TOKEN = os.environ.get('PROFILING_TOKEN', '')
+PROFILING_DIR = os.environ.get('PROFILING_DIR', BASE_DIR / 'profiles')
+PROFILING_MAX_FILES = int(os.environ.get('PROFILING_MAX_FILES', '200'))
+
+# Prometheus metrics shared by all worker processes, served at /metrics
+METRICS_ENABLED = os.environ.get('METRICS_ENABLED', '1') == '1'
+METRICS_DB_PATH = os.environ.get('METRICS_DB_PATH', BASE_DIR / 'metrics.sqlite3')
+# Each process keeps counts in memory and writes them to the file this often (and when scraped)
+METRICS_FLUSH_SECONDS = float(os.environ.get('METRICS_FLUSH_SECONDS', '10'))
+METRICS_ALLOWED_IPS = os.environ.get('METRICS_ALLOWED_IPS', '127.0.0.1,::1').split(',')
+
+# Studio tenancy (django_app.tenancy): requests from hosts that match no Studio.hostname use this studio
+DEFAULT_STUDIO_ID = int(os.environ.get('DEFAULT_STUDIO_ID', '1'))
+
+# History archiving (manage.py archive_history): groups finished this many days ago move to archive tables
+ARCHIVE_AFTER_DAYS = int(os.environ.get('ARCHIVE_AFTER_DAYS', '365'))
+
+LOGGING = {
+    'version': 1,
+    'disable_existing_loggers': False,
+    'handlers': {
+        'console': {
+            'class': 'logging.StreamHandler',
+        },
+    },
+    'loggers': {
+        'django_app': {
+            'handlers': ['console'],
+            'level': os.environ.get('DJANGO_APP_LOG_LEVEL', 'INFO'),
+        },
+    },
+}
+
 # Default primary key field type
 # https://docs.djangoproject.com/en/5.2/ref/settings/#default-auto-field
 
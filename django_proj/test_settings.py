@@ -0,0 +1,27 @@
+"""Settings for the test suite (see [tool.pytest.ini_options] in pyproject.toml).
+
+The app's settings with cheap password hashing and per-worker scratch files
+(including the SQLite test database), so ``pytest -n auto`` (pytest-xdist)
+workers do not share state on disk.
+"""
+import os
+import tempfile
+from pathlib import Path
+
+from .settings import *  # noqa: F401,F403
+from .settings import PASSWORD_HASHERS
+
+# Hashing cost only slows tests down; tests of the production hashers override PASSWORD_HASHERS
+PASSWORD_HASHERS = ['django.contrib.auth.hashers.MD5PasswordHasher', *PASSWORD_HASHERS]
+
+_WORKER = os.environ.get('PYTEST_XDIST_WORKER', 'main')
+_SCRATCH = Path(tempfile.gettempdir()) / f'dancelog-tests-{_WORKER}'
+METRICS_DB_PATH = _SCRATCH / 'metrics.sqlite3'
+# A file rather than in-memory SQLite, so live-server threads get their own connections
+if DATABASES['default']['ENGINE'] == 'django.db.backends.sqlite3':  # noqa: F405
+    DATABASES['default']['TEST'] = {'NAME': str(_SCRATCH / 'test.sqlite3')}  # noqa: F405
+PROFILING_DIR = _SCRATCH / 'profiles'
+_SCRATCH.mkdir(exist_ok=True)
+# A request slowed down by a busy machine or parallel workers would queue plan captures and change query
+# counts; the query plan tests turn the sampler on
+SLOW_QUERY_EXPLAIN = False
@@ -0,0 +1,76 @@
+"""Test data builders that create many rows with a handful of bulk_create calls.
+
+Usernames are numbered from a module-wide counter, so factories can be called
+repeatedly (and from setUpTestData) without clashing.
+"""
+from datetime import date
+from itertools import count
+
+from django.contrib.auth.models import User
+from django.utils import timezone
+
+from django_app import payments, tenancy
+from django_app.models import Group, Pass, Purchase, Student, StudentVisit, Studio
+
+_numbers = count(1)
+
+
+def make_users(n, prefix='user', **fields):
+    """n users without passwords (tests that log in with a password use create_user)"""
+    fields = {'first_name': prefix.title(), **fields}
+    users = User.objects.bulk_create([
+        User(username=f'{prefix}{number}', last_name=str(number), **fields)
+        for number in (next(_numbers) for _ in range(n))
+    ])
+    # bulk_create skips the signal that makes new users members of the current studio
+    Membership = Studio.members.through
+    Membership.objects.bulk_create([Membership(studio_id=tenancy.default_studio_id(), user=user) for user in users])
+    return users
+
+
+def make_group(**fields):
+    # Group.save() derives duration_minutes, so groups are created one at a time
+    fields = {
+        'name': f'Group {next(_numbers)}',
+        'schedule': [{'day': 'tue', 'time': '19:30'}],
+        'duration': '1hr',
+        'start_at': date.today(),
+        **fields,
+    }
+    return Group.objects.create(**fields)
+
+
+def make_pass(group, **fields):
+    fields = {'name': f'{group.name} pass', 'price': 100, 'lessons_included': 10, **fields}
+    return Pass.objects.create(group=group, **fields)
+
+
+def make_students(n, groups=(), **fields):
+    """n students (and their users), enrolled in groups"""
+    students = Student.objects.bulk_create([Student(user=user, **fields) for user in make_users(n, 'student')])
+    for group in groups:
+        group.students.add(*students)
+    return students
+
+
+def make_visits(students, group, dates, skipped=False):
+    return StudentVisit.objects.bulk_create([
+        StudentVisit(student=student, group=group, date=day, skipped=skipped)
+        for day in dates for student in students
+    ])
+
+
+def make_purchases(students, dance_pass, paid=False, payment_method='CASH'):
+    """One purchase per student, logged to the payment events and balances like the views do"""
+    now = timezone.now()
+    # bulk_create skips Purchase.save(), which sets the expiry and amount the same way
+    expires_at = dance_pass.expiry(now)
+    purchases = Purchase.objects.bulk_create([
+        Purchase(
+            student=student, dance_pass=dance_pass, amount=dance_pass.price, expires_at=expires_at,
+            paid_at=now if paid else None, payment_method=payment_method if paid else '',
+        )
+        for student in students
+    ])
+    payments.record_events([event for purchase in purchases for event in payments.purchase_events(purchase)])
+    return purchases
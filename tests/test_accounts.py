@@ -0,0 +1,90 @@
+import pytest
+from django.conf import settings
+from django.contrib.auth.hashers import make_password
+from django.core.cache import cache
+from django.db import connection
+from django.test import TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+from django.contrib.auth.models import User
+from django_app import accounts
+from django_proj import settings as production_settings
+
+
+class TestLoginProfile(TestCase):
+    """Tests for tuned password hashing and the cached per-request user lookup"""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user(username='anna', password='secret-pass-1')
+
+    @pytest.mark.timeout(30)
+    @override_settings(PASSWORD_HASHERS=production_settings.PASSWORD_HASHERS)
+    def test_new_users_get_the_configured_hasher(self):
+        """Test new passwords are hashed with PASSWORD_HASH_ALGORITHM, not the cheap hasher tests run with"""
+        # kind: unit_tests, original method: django_app.accounts.TunedScryptPasswordHasher.encode
+        user = User.objects.create_user(username='ben', password='secret-pass-2')
+        self.assertTrue(user.password.startswith(f'{settings.PASSWORD_HASH_ALGORITHM}$'))
+        self.assertTrue(user.check_password('secret-pass-2'))
+
+    @pytest.mark.timeout(30)
+    @override_settings(PASSWORD_HASHERS=[
+        'django_app.accounts.TunedScryptPasswordHasher', 'django.contrib.auth.hashers.PBKDF2PasswordHasher',
+    ])
+    def test_old_hashes_are_upgraded_on_login(self):
+        """Test a PBKDF2 hash still logs in and is rehashed with the tuned hasher"""
+        # kind: endpoint_tests, original method: django_app.accounts.TunedScryptPasswordHasher.must_update
+        User.objects.filter(pk=self.user.pk).update(password=make_password('secret-pass-1', hasher='pbkdf2_sha256'))
+
+        response = self.client.post(reverse('login'), {'username': 'anna', 'password': 'secret-pass-1'})
+        self.assertRedirects(response, reverse('dashboard'), fetch_redirect_response=False)
+        self.user.refresh_from_db()
+        self.assertTrue(self.user.password.startswith(f'scrypt${settings.PASSWORD_SCRYPT_WORK_FACTOR}$'))
+
+    @pytest.mark.timeout(30)
+    @override_settings(AUTH_USER_CACHE_SECONDS=300)
+    def test_user_lookup_is_cached_until_saved(self):
+        """Test authenticated requests reuse the cached user and see changes once it is saved"""
+        # kind: endpoint_tests, original method: django_app.accounts.CachedModelBackend.get_user
+        self.client.force_login(self.user)
+        cache.delete(accounts.user_cache_key(self.user.pk))
+        with CaptureQueriesContext(connection) as queries:
+            self.client.get(reverse('students'))
+        self.assertTrue([q for q in queries.captured_queries if 'FROM "auth_user" WHERE' in q['sql']])
+        with CaptureQueriesContext(connection) as queries:
+            self.client.get(reverse('students'))
+        self.assertFalse([q for q in queries.captured_queries if 'FROM "auth_user" WHERE' in q['sql']])
+
+        self.user.is_active = False
+        self.user.save()
+        response = self.client.get(reverse('students'))
+        self.assertEqual(response.status_code, 302)
+
+    @pytest.mark.timeout(30)
+    def test_user_lookup_uncached_without_shared_cache(self):
+        """Test the user is read from the database on every request when the cache is per-process"""
+        # kind: endpoint_tests, original method: django_app.accounts.CachedModelBackend.get_user
+        self.assertFalse(settings.SHARED_CACHE)
+        self.assertEqual(settings.AUTH_USER_CACHE_SECONDS, 0)
+        self.client.force_login(self.user)
+        for _ in range(2):
+            with CaptureQueriesContext(connection) as queries:
+                self.client.get(reverse('students'))
+            self.assertTrue([q for q in queries.captured_queries if 'FROM "auth_user" WHERE' in q['sql']])
+
+    @pytest.mark.timeout(30)
+    @override_settings(
+        SESSION_ENGINE='django.contrib.sessions.backends.cached_db', AUTH_USER_CACHE_SECONDS=300,
+    )
+    def test_logout_invalidates_session(self):
+        """Test a session cookie stops working after logout, also when sessions and users are cached"""
+        # kind: endpoint_tests, original method: django_app.views.logout_view
+        self.client.post(reverse('login'), {'username': 'anna', 'password': 'secret-pass-1'})
+        session_key = self.client.cookies[settings.SESSION_COOKIE_NAME].value
+        self.assertEqual(self.client.get(reverse('students')).status_code, 200)
+
+        self.client.get(reverse('logout'))
+        self.client.cookies[settings.SESSION_COOKIE_NAME] = session_key
+        response = self.client.get(reverse('students'))
+        self.assertEqual(response.status_code, 302)
+        self.assertTrue(response['Location'].startswith(reverse('login')))
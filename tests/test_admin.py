@@ -0,0 +1,332 @@
+import pytest
+from datetime import date, timedelta
+from django.test import TestCase, Client
+from django.urls import reverse
+from django.contrib.auth.models import User
+from django.db import connection
+from django.test.utils import CaptureQueriesContext
+from django.utils import timezone
+from django_app import payments
+from django_app.models import Group, Pass, Teacher, Student, StudentVisit, Purchase, PaymentEvent, Lesson
+from django_app.pagination import EstimatedCountPaginator
+
+
+class TestAdminChangelistQueries(TestCase):
+    """Query-count tests for admin changelists"""
+
+    def setUp(self):
+        self.client = Client()
+        self.admin_user = User.objects.create_user(
+            username='admin',
+            is_staff=True,
+            is_superuser=True
+        )
+        self.client.force_login(self.admin_user)
+        self.counter = 0
+
+    def add_rows(self, count):
+        """Create `count` teachers, groups, passes, students, visits and purchases"""
+        for _ in range(count):
+            self.counter += 1
+            n = self.counter
+            teacher = Teacher.objects.create(
+                user=User.objects.create_user(username=f'teacher{n}', first_name='T', last_name=str(n))
+            )
+            student = Student.objects.create(
+                user=User.objects.create_user(username=f'student{n}', first_name='S', last_name=str(n))
+            )
+            group = Group.objects.create(
+                name=f'Group {n}',
+                schedule=[{"day": "tue", "time": "19:30"}],
+                duration='1hr',
+                start_at=date(2024, 1, 1),
+                location='Studio'
+            )
+            group.teachers.add(teacher)
+            student.groups.add(group)
+            pass_obj = Pass.objects.create(name=f'Pass {n}', price=100, group=group, lessons_included=10)
+            StudentVisit.objects.create(student=student, group=group, date=date(2024, 1, 1) + timedelta(days=n))
+            Purchase.objects.create(student=student, dance_pass=pass_obj, cashier=teacher, paid_at=timezone.now())
+
+    def count_changelist_queries(self, model_name):
+        url = reverse(f'admin:django_app_{model_name}_changelist')
+        with CaptureQueriesContext(connection) as ctx:
+            response = self.client.get(url)
+        self.assertEqual(response.status_code, 200)
+        return len(ctx.captured_queries)
+
+    def assert_constant_queries(self, model_name):
+        self.add_rows(2)
+        small = self.count_changelist_queries(model_name)
+        self.add_rows(5)
+        large = self.count_changelist_queries(model_name)
+        self.assertEqual(small, large)
+
+    @pytest.mark.timeout(30)
+    def test_group_changelist_constant_queries(self):
+        """Test GroupAdmin changelist does not query teachers per row"""
+        # kind: endpoint_tests, original method: django_app.admin.GroupAdmin.get_teachers
+        self.assert_constant_queries('group')
+
+    @pytest.mark.timeout(30)
+    def test_pass_changelist_constant_queries(self):
+        """Test PassAdmin changelist selects groups with passes"""
+        # kind: endpoint_tests, original method: django_app.admin.PassAdmin
+        self.assert_constant_queries('pass')
+
+    @pytest.mark.timeout(30)
+    def test_teacher_changelist_constant_queries(self):
+        """Test TeacherAdmin changelist does not query groups per row"""
+        # kind: endpoint_tests, original method: django_app.admin.TeacherAdmin.get_groups
+        self.assert_constant_queries('teacher')
+
+    @pytest.mark.timeout(30)
+    def test_student_changelist_constant_queries(self):
+        """Test StudentAdmin changelist does not query groups per row"""
+        # kind: endpoint_tests, original method: django_app.admin.StudentAdmin.get_groups
+        self.assert_constant_queries('student')
+
+    @pytest.mark.timeout(30)
+    def test_studentvisit_changelist_constant_queries(self):
+        """Test StudentVisitAdmin changelist selects students and groups"""
+        # kind: endpoint_tests, original method: django_app.admin.StudentVisitAdmin
+        self.assert_constant_queries('studentvisit')
+
+    @pytest.mark.timeout(30)
+    def test_purchase_changelist_constant_queries(self):
+        """Test PurchaseAdmin changelist and cashier filter are query-constant"""
+        # kind: endpoint_tests, original method: django_app.admin.PurchaseAdmin.get_queryset
+        self.assert_constant_queries('purchase')
+
+    @pytest.mark.timeout(30)
+    def test_group_changelist_shows_teachers(self):
+        """Test GroupAdmin changelist still renders teacher names"""
+        # kind: endpoint_tests, original method: django_app.admin.GroupAdmin.get_teachers
+        self.add_rows(1)
+        response = self.client.get(reverse('admin:django_app_group_changelist'))
+        self.assertContains(response, 'T 1')
+
+
+class TestEstimatedCountPaginator(TestCase):
+    """Unit tests for EstimatedCountPaginator"""
+
+    @pytest.mark.timeout(30)
+    def test_count_without_statistics_is_exact(self):
+        """Test EstimatedCountPaginator.count falls back to COUNT(*)"""
+        # kind: unit_tests, original method: django_app.pagination.EstimatedCountPaginator.count
+        Group.objects.create(
+            name='Group', schedule=[], duration='1hr', start_at=date(2024, 1, 1), location='Studio'
+        )
+        paginator = EstimatedCountPaginator(Group.objects.all(), 10)
+        self.assertEqual(paginator.count, 1)
+
+    @pytest.mark.timeout(30)
+    def test_count_uses_estimate_for_large_tables(self):
+        """Test EstimatedCountPaginator.count trusts table statistics above the threshold"""
+        # kind: unit_tests, original method: django_app.pagination.EstimatedCountPaginator.count
+        paginator = EstimatedCountPaginator(Group.objects.all(), 10)
+        paginator.estimate_threshold = 0
+        with connection.cursor() as cursor:
+            cursor.execute("ANALYZE")
+            cursor.execute("DELETE FROM sqlite_stat1 WHERE tbl = %s", [Group._meta.db_table])
+            cursor.execute(
+                "INSERT INTO sqlite_stat1 (tbl, idx, stat) VALUES (%s, NULL, %s)",
+                [Group._meta.db_table, '50000']
+            )
+        self.assertEqual(paginator.count, 50000)
+
+    @pytest.mark.timeout(30)
+    def test_count_filtered_queryset_is_exact(self):
+        """Test EstimatedCountPaginator.count counts filtered querysets exactly"""
+        # kind: unit_tests, original method: django_app.pagination.EstimatedCountPaginator.count
+        paginator = EstimatedCountPaginator(Group.objects.filter(name='missing'), 10)
+        paginator.estimate_threshold = 0
+        self.assertEqual(paginator.count, 0)
+
+
+class TestAdminBulkActions(TestCase):
+    """Endpoint tests for admin bulk actions"""
+
+    def setUp(self):
+        self.client = Client()
+        self.admin_user = User.objects.create_user(username='admin', is_staff=True, is_superuser=True)
+        self.client.force_login(self.admin_user)
+
+        self.teacher = Teacher.objects.create(user=User.objects.create_user(username='teacher'))
+        self.student = Student.objects.create(user=User.objects.create_user(username='student'))
+        self.other_student = Student.objects.create(user=User.objects.create_user(username='other'))
+        self.group = Group.objects.create(
+            name='Group', schedule=[], duration='1hr', start_at=date(2024, 1, 1), location='Studio'
+        )
+        self.other_group = Group.objects.create(
+            name='Other Group', schedule=[], duration='1hr', start_at=date(2024, 1, 1), location='Studio'
+        )
+        self.pass_obj = Pass.objects.create(name='Pass', price=100, group=self.group, lessons_included=10)
+
+    def post_action(self, model_name, action, ids, **extra):
+        data = {'action': action, '_selected_action': [str(pk) for pk in ids], **extra}
+        with CaptureQueriesContext(connection) as ctx:
+            response = self.client.post(reverse(f'admin:django_app_{model_name}_changelist'), data)
+        self.assertEqual(response.status_code, 302)
+        return ctx
+
+    def update_statements(self, ctx, table):
+        return [q for q in ctx.captured_queries if q['sql'].startswith(f'UPDATE "{table}"')]
+
+    @pytest.mark.timeout(30)
+    def test_mark_paid_single_update(self):
+        """Test PurchaseAdmin.mark_paid updates the selection in one statement"""
+        # kind: endpoint_tests, original method: django_app.admin.PurchaseAdmin.mark_paid
+        purchases = [Purchase.objects.create(student=self.student, dance_pass=self.pass_obj) for _ in range(3)]
+        ctx = self.post_action(
+            'purchase', 'mark_paid', [p.id for p in purchases],
+            payment_method='BOG', cashier=str(self.teacher.id)
+        )
+        self.assertEqual(len(self.update_statements(ctx, Purchase._meta.db_table)), 1)
+        for purchase in purchases:
+            purchase.refresh_from_db()
+            self.assertIsNotNone(purchase.paid_at)
+            self.assertEqual(purchase.payment_method, 'BOG')
+            self.assertEqual(purchase.cashier, self.teacher)
+
+    @pytest.mark.timeout(30)
+    def test_mark_paid_keeps_paid_purchases(self):
+        """Test PurchaseAdmin.mark_paid leaves already paid purchases untouched"""
+        # kind: endpoint_tests, original method: django_app.admin.PurchaseAdmin.mark_paid
+        paid_at = timezone.now() - timedelta(days=3)
+        purchase = Purchase.objects.create(
+            student=self.student, dance_pass=self.pass_obj, paid_at=paid_at, payment_method='CASH'
+        )
+        self.post_action('purchase', 'mark_paid', [purchase.id], payment_method='TBC')
+        purchase.refresh_from_db()
+        self.assertEqual(purchase.paid_at, paid_at)
+        self.assertEqual(purchase.payment_method, 'CASH')
+
+    @pytest.mark.timeout(30)
+    def test_mark_paid_requires_payment_method(self):
+        """Test PurchaseAdmin.mark_paid without a payment method does nothing"""
+        # kind: endpoint_tests, original method: django_app.admin.PurchaseAdmin.mark_paid
+        purchase = Purchase.objects.create(student=self.student, dance_pass=self.pass_obj)
+        self.post_action('purchase', 'mark_paid', [purchase.id])
+        purchase.refresh_from_db()
+        self.assertIsNone(purchase.paid_at)
+
+    @pytest.mark.timeout(30)
+    def test_toggle_skipped_single_update(self):
+        """Test StudentVisitAdmin.toggle_skipped flips the flag in one statement"""
+        # kind: endpoint_tests, original method: django_app.admin.StudentVisitAdmin.toggle_skipped
+        attended = StudentVisit.objects.create(student=self.student, group=self.group, date=date(2024, 1, 2))
+        skipped = StudentVisit.objects.create(
+            student=self.other_student, group=self.group, date=date(2024, 1, 2), skipped=True
+        )
+        ctx = self.post_action('studentvisit', 'toggle_skipped', [attended.id, skipped.id])
+        self.assertEqual(len(self.update_statements(ctx, StudentVisit._meta.db_table)), 1)
+        attended.refresh_from_db()
+        skipped.refresh_from_db()
+        self.assertTrue(attended.skipped)
+        self.assertFalse(skipped.skipped)
+
+    @pytest.mark.timeout(30)
+    def test_move_to_lesson_skips_conflicts(self):
+        """Test StudentVisitAdmin.move_to_lesson moves visits except ones that would collide"""
+        # kind: endpoint_tests, original method: django_app.admin.StudentVisitAdmin.move_to_lesson
+        visit = StudentVisit.objects.create(student=self.student, group=self.group, date=date(2024, 1, 2))
+        blocked = StudentVisit.objects.create(student=self.other_student, group=self.group, date=date(2024, 1, 2))
+        StudentVisit.objects.create(student=self.other_student, group=self.other_group, date=date(2024, 1, 4))
+
+        ctx = self.post_action(
+            'studentvisit', 'move_to_lesson', [visit.id, blocked.id],
+            target_group=str(self.other_group.id), target_date='2024-01-04'
+        )
+        self.assertEqual(len(self.update_statements(ctx, StudentVisit._meta.db_table)), 1)
+        visit.refresh_from_db()
+        blocked.refresh_from_db()
+        self.assertEqual((visit.group, visit.date), (self.other_group, date(2024, 1, 4)))
+        self.assertEqual((blocked.group, blocked.date), (self.group, date(2024, 1, 2)))
+
+    @pytest.mark.timeout(30)
+    def test_bulk_visit_actions_bump_lesson_versions(self):
+        """Test toggling and moving visits bump the versions of every lesson they touch"""
+        # kind: endpoint_tests, original method: django_app.models.StudentVisitQuerySet.move_to
+        visit = StudentVisit.objects.create(student=self.student, group=self.group, date=date(2024, 1, 2))
+        # Creating the visit made its lesson
+        Lesson.objects.filter(group=self.group, date=date(2024, 1, 2)).update(version=3)
+
+        self.post_action('studentvisit', 'toggle_skipped', [visit.id])
+        self.assertEqual(Lesson.objects.get(group=self.group, date=date(2024, 1, 2)).version, 4)
+
+        self.post_action(
+            'studentvisit', 'move_to_lesson', [visit.id],
+            target_group=str(self.other_group.id), target_date='2024-01-04'
+        )
+        self.assertEqual(Lesson.objects.get(group=self.group, date=date(2024, 1, 2)).version, 5)
+        self.assertEqual(Lesson.objects.get(group=self.other_group, date=date(2024, 1, 4)).version, 1)
+
+
+class TestPurchaseAdminEvents(TestCase):
+    """Endpoint tests for the payment events of purchases edited or deleted in the admin"""
+
+    def setUp(self):
+        self.client = Client()
+        self.client.force_login(User.objects.create_user(username='admin', is_staff=True, is_superuser=True))
+        self.student = Student.objects.create(user=User.objects.create_user(username='student'))
+        self.other_student = Student.objects.create(user=User.objects.create_user(username='other'))
+        group = Group.objects.create(
+            name='Group', schedule=[], duration='1hr', start_at=date(2024, 1, 1), location='Studio'
+        )
+        self.pass_obj = Pass.objects.create(name='Pass', price=100, group=group, lessons_included=10)
+        self.big_pass = Pass.objects.create(name='Big pass', price=180, group=group, lessons_included=20)
+        self.purchase = Purchase.objects.create(student=self.student, dance_pass=self.pass_obj)
+        payments.record_purchase(self.purchase)
+
+    def change(self, **fields):
+        data = {
+            'student': self.purchase.student_id, 'dance_pass': self.purchase.dance_pass_id,
+            'paid_at_0': '', 'paid_at_1': '', 'payment_method': '', 'cashier': '', 'notes': '', **fields,
+        }
+        response = self.client.post(reverse('admin:django_app_purchase_change', args=[self.purchase.pk]), data)
+        self.assertEqual(response.status_code, 302)
+
+    def balances(self):
+        return {
+            student.pk: Student.objects.get(pk=student.pk).outstanding_balance
+            for student in (self.student, self.other_student)
+        }
+
+    @pytest.mark.timeout(30)
+    def test_paying_and_unpaying_logs_events(self):
+        """Test setting and clearing paid_at in the admin logs a payment and its reversal"""
+        # kind: endpoint_tests, original method: django_app.admin.PurchaseAdmin.save_model
+        self.change(paid_at_0='2024-01-05', paid_at_1='10:00', payment_method='CASH')
+        self.assertEqual(self.balances()[self.student.pk], 0)
+        self.change(paid_at_0='2024-01-06', paid_at_1='10:00', payment_method='CASH')
+        self.change()
+        self.assertEqual(self.balances()[self.student.pk], 100)
+        self.assertEqual(
+            list(PaymentEvent.objects.values_list('kind', 'amount')),
+            [('created', 100), ('paid', -100), ('adjusted', 0), ('adjusted', 100)],
+        )
+        self.assertEqual(payments.balance_drift(), {})
+
+    @pytest.mark.timeout(30)
+    def test_changing_pass_and_student_moves_the_charge(self):
+        """Test changing the pass and student voids the old charge and charges the new one"""
+        # kind: endpoint_tests, original method: django_app.admin.PurchaseAdmin.save_model
+        self.change(student=self.other_student.pk, dance_pass=self.big_pass.pk)
+        self.assertEqual(self.balances(), {self.student.pk: 0, self.other_student.pk: 180})
+        self.assertEqual(payments.balance_drift(), {})
+
+    @pytest.mark.timeout(30)
+    def test_deleting_voids_the_charge(self):
+        """Test deleting purchases, singly or in bulk, voids what they still added to balances"""
+        # kind: endpoint_tests, original method: django_app.admin.PurchaseAdmin.delete_queryset
+        other = Purchase.objects.create(student=self.other_student, dance_pass=self.big_pass)
+        payments.record_purchase(other)
+        self.client.post(reverse('admin:django_app_purchase_delete', args=[self.purchase.pk]), {'post': 'yes'})
+        self.client.post(reverse('admin:django_app_purchase_changelist'), {
+            'action': 'delete_selected', '_selected_action': [str(other.pk)], 'post': 'yes',
+        })
+        self.assertFalse(Purchase.objects.exists())
+        self.assertEqual(self.balances(), {self.student.pk: 0, self.other_student.pk: 0})
+        self.assertEqual(PaymentEvent.objects.filter(kind=PaymentEvent.KIND_VOIDED).count(), 2)
+        self.assertEqual(payments.balance_drift(), {})
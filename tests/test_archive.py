@@ -0,0 +1,82 @@
+import pytest
+from datetime import date
+from io import StringIO
+from django.core.management import call_command
+from django.test import TestCase, override_settings
+from django.contrib.auth.models import User
+from django.utils import timezone
+from freezegun import freeze_time
+from django_app import archive, payroll
+from django_app.models import (
+    Group, Pass, Teacher, Student, StudentVisit, Purchase, PaymentEvent, ArchivedVisit, ArchivedPurchase,
+)
+
+
+@freeze_time("2026-06-01")
+@override_settings(ARCHIVE_AFTER_DAYS=365)
+class TestArchive(TestCase):
+    """Tests for moving finished groups' history into archive tables"""
+
+    def setUp(self):
+        self.teacher = Teacher.objects.create(user=User.objects.create_user(username='nino'))
+        self.anna = Student.objects.create(user=User.objects.create_user(username='anna'))
+        self.old = self.group('Salsa 2024', date(2024, 1, 1), date(2024, 12, 20))
+        self.recent = self.group('Salsa 2025', date(2025, 1, 1), date(2025, 12, 20))
+        self.old_pass = Pass.objects.create(name='10 lessons', price=100, group=self.old, lessons_included=10)
+        self.paid = Purchase.objects.create(student=self.anna, dance_pass=self.old_pass, paid_at=timezone.now())
+        self.unpaid = Purchase.objects.create(student=self.anna, dance_pass=self.old_pass)
+        PaymentEvent.objects.create(student=self.anna, purchase=self.paid, kind=PaymentEvent.KIND_CREATED, amount=100)
+        for group, day in [(self.old, date(2024, 3, 5)), (self.old, date(2024, 3, 12)), (self.recent, date(2025, 3, 4))]:
+            StudentVisit.objects.create(student=self.anna, group=group, date=day)
+
+    def group(self, name, start_at, finished_at):
+        group = Group.objects.create(
+            name=name, schedule=[{"day": "tue", "time": "19:30"}], duration='1hr',
+            start_at=start_at, finished_at=finished_at,
+        )
+        group.teachers.add(self.teacher)
+        return group
+
+    @pytest.mark.timeout(30)
+    def test_archive_history_moves_old_groups(self):
+        """Test visits and paid purchases of groups finished before the cutoff move with their ids"""
+        # kind: unit_tests, original method: django_app.archive.archive_history
+        self.assertEqual(list(archive.archivable_groups()), [self.old])
+        visit_ids = set(StudentVisit.objects.filter(group=self.old).values_list('pk', flat=True))
+
+        self.assertEqual(archive.archive_history(), (1, 2, 1))
+        self.assertEqual(set(ArchivedVisit.objects.values_list('pk', flat=True)), visit_ids)
+        self.assertEqual(list(ArchivedPurchase.objects.values_list('pk', flat=True)), [self.paid.pk])
+        self.assertEqual(list(StudentVisit.objects.values_list('group', flat=True)), [self.recent.pk])
+        # Debts stay in the hot table; the payment log keeps its amounts
+        self.assertEqual(list(Purchase.objects.all()), [self.unpaid])
+        event = PaymentEvent.objects.get()
+        self.assertEqual((event.amount, event.purchase_id), (100, None))
+        self.assertEqual(event.archived_purchase, ArchivedPurchase.objects.get(pk=self.paid.pk))
+
+        # Nothing left to do on the next run
+        self.assertEqual(list(archive.archivable_groups()), [])
+        self.assertEqual(archive.archive_history(), (0, 0, 0))
+
+    @pytest.mark.timeout(30)
+    def test_reports_read_archived_visits(self):
+        """Test payroll counts lessons the same before and after archiving"""
+        # kind: unit_tests, original method: django_app.payroll.teacher_hours
+        before = payroll.teacher_hours(date(2024, 1, 1), date(2025, 12, 31))
+        archive.archive_group(self.old.pk)
+        self.assertEqual(payroll.teacher_hours(date(2024, 1, 1), date(2025, 12, 31)), before)
+        self.assertEqual(before[0].lessons, 3)
+
+    @pytest.mark.timeout(30)
+    def test_archive_history_command(self):
+        """Test the command lists groups on a dry run and archives them incrementally"""
+        # kind: unit_tests, original method: django_app.management.commands.archive_history.Command.handle
+        out = StringIO()
+        call_command('archive_history', '--before', '2026-01-01', '--dry-run', stdout=out)
+        self.assertIn('2 group(s) to archive.', out.getvalue())
+        self.assertEqual(ArchivedVisit.objects.count(), 0)
+
+        out = StringIO()
+        call_command('archive_history', '--before', '2026-01-01', '--limit', '1', stdout=out)
+        self.assertIn('Archived 1 group(s): 2 visit(s), 1 purchase(s).', out.getvalue())
+        self.assertEqual(list(archive.archivable_groups(date(2026, 1, 1))), [self.recent])
@@ -1,10 +1,13 @@
 import json
 import pytest
-from django.test import TestCase
-from django.contrib.auth.models import User
+from django.db import connection
+from django.test import TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.contrib.auth.models import User, update_last_login
 from django.forms import ValidationError
-from django_app.forms import GroupForm, StudentForm, PurchaseForm, StudentVisitForm, NewStudentForm
+from django_app.forms import GroupForm, StudentForm, PurchaseForm, StudentVisitForm, NewStudentForm, StudentSelectionForm
 from django_app.models import Group, Student, Teacher, Pass, StudentVisit
+from factories import make_group, make_pass, make_students
 
 
 class TestGroupForm(TestCase):
@@ -243,6 +246,67 @@ class TestPurchaseForm(TestCase):
         self.assertNotIn(self.pass_obj, form.fields['dance_pass'].queryset)
 
 
+class TestChoiceRendering(TestCase):
+    """Query counts of rendering model choices, and their cache invalidation"""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.groups = [make_group() for _ in range(3)]
+        cls.passes = [make_pass(group) for group in cls.groups]
+        cls.students = make_students(20, groups=cls.groups[:1])
+
+    def render_queries(self, form_class):
+        with CaptureQueriesContext(connection) as queries:
+            html = str(form_class())
+        return len(queries.captured_queries), html
+
+    @pytest.mark.timeout(30)
+    def test_choices_render_in_one_query(self):
+        """Test each choice field renders with one query, however many options it has"""
+        # kind: unit_tests, original method: django_app.choices.label_queryset
+        self.assertEqual(self.render_queries(PurchaseForm)[0], 1)
+        self.assertEqual(self.render_queries(StudentSelectionForm)[0], 1)
+        # groups is the only choice field of StudentForm
+        self.assertEqual(self.render_queries(StudentForm)[0], 1)
+
+    @pytest.mark.timeout(30)
+    def test_choices_uncached_without_shared_cache(self):
+        """Test choices are queried on every render when the cache is per-process"""
+        # kind: unit_tests, original method: django_app.choices.cached_choices
+        self.render_queries(PurchaseForm)
+        self.assertEqual(self.render_queries(PurchaseForm)[0], 1)
+
+    @pytest.mark.timeout(30)
+    @override_settings(CHOICES_CACHE_SECONDS=3600)
+    def test_cached_choices_follow_label_changes(self):
+        """Test cached choices render without queries until a model the labels read is saved"""
+        # kind: unit_tests, original method: django_app.choices.cached_choices
+        self.render_queries(PurchaseForm)
+        count, html = self.render_queries(PurchaseForm)
+        self.assertEqual(count, 0)
+        self.assertIn(f'{self.passes[0].name} - {self.groups[0].name} ($100.00)', html)
+
+        self.groups[0].name = 'Bachata'
+        self.groups[0].save()
+        count, html = self.render_queries(PurchaseForm)
+        self.assertEqual(count, 1)
+        self.assertIn('Bachata', html)
+
+        user = self.students[0].user
+        user.first_name = 'Zelda'
+        user.save()
+        self.assertIn('Zelda ', self.render_queries(StudentSelectionForm)[1])
+
+    @pytest.mark.timeout(30)
+    @override_settings(CHOICES_CACHE_SECONDS=3600)
+    def test_login_keeps_cached_choices(self):
+        """Test saving only last_login on a user does not drop the cached student choices"""
+        # kind: unit_tests, original method: django_app.choices._label_model_changed
+        self.render_queries(StudentSelectionForm)
+        update_last_login(None, self.students[0].user)
+        self.assertEqual(self.render_queries(StudentSelectionForm)[0], 0)
+
+
 class TestStudentVisitForm(TestCase):
     """Unit tests for StudentVisitForm"""
 
@@ -0,0 +1,130 @@
+import pytest
+from datetime import date
+from django.core.cache import cache
+from django.test import TestCase, Client, override_settings
+from django.urls import reverse
+from django.contrib.auth.models import User
+from freezegun import freeze_time
+from django_app import ical
+from django_app.models import Group, Teacher
+
+
+class TestICalFeeds(TestCase):
+    """Tests for the per-teacher and per-group iCal feeds"""
+
+    def setUp(self):
+        cache.clear()
+        self.client = Client()
+        self.teacher = Teacher.objects.create(user=User.objects.create_user(username='teacher', first_name='Nino', last_name='K'))
+        self.group = Group.objects.create(
+            name='Salsa, beginners',
+            schedule=[{"day": "tue", "time": "19:30"}, {"day": "thu", "time": "20:00"}],
+            duration='90min',
+            start_at=date(2024, 1, 1),
+            finished_at=date(2024, 6, 30),
+            location='Studio 1\nRustaveli Ave',
+        )
+        self.group.teachers.add(self.teacher)
+
+    def feed_url(self, kind, pk, token=None):
+        token = ical.feed_token(kind, pk) if token is None else token
+        return reverse(f'{kind}_calendar', args=[pk]) + f'?token={token}'
+
+    @pytest.mark.timeout(30)
+    def test_render_uses_recurrence_rules(self):
+        """Test each schedule entry becomes one weekly RRULE bounded by start_at and finished_at"""
+        # kind: unit_tests, original method: django_app.ical.render
+        rows = list(Group.objects.values(*ical.FEED_FIELDS))
+        body = ical.render('Lessons', rows)
+        self.assertEqual(body.count('BEGIN:VEVENT'), 2)
+        self.assertIn('DTSTART;TZID=UTC:20240102T193000\r\n', body)
+        self.assertIn('DTEND;TZID=UTC:20240102T210000\r\n', body)
+        self.assertIn('RRULE:FREQ=WEEKLY;BYDAY=TU;UNTIL=20240630T235959Z\r\n', body)
+        self.assertIn('DTSTART;TZID=UTC:20240104T200000\r\n', body)
+        self.assertIn('SUMMARY:Salsa\\, beginners\r\n', body)
+        self.assertIn('LOCATION:Studio 1\\nRustaveli Ave\r\n', body)
+
+    @pytest.mark.timeout(30)
+    def test_long_lines_are_folded(self):
+        """Test content lines are folded at 75 octets"""
+        # kind: unit_tests, original method: django_app.ical.render
+        self.group.location = 'x' * 200
+        self.group.save()
+        body = ical.render('Lessons', list(Group.objects.values(*ical.FEED_FIELDS)))
+        self.assertTrue(all(len(line.encode()) <= 75 for line in body.split('\r\n')))
+
+    @pytest.mark.timeout(30)
+    def test_teacher_feed_etag(self):
+        """Test the teacher feed is served with an ETag and revalidates to 304"""
+        # kind: endpoint_tests, original method: django_app.views.teacher_calendar
+        url = self.feed_url('teacher', self.teacher.id)
+        response = self.client.get(url)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response['Content-Type'], 'text/calendar; charset=utf-8')
+        self.assertIn('X-WR-CALNAME:Nino K - lessons', response.content.decode())
+
+        # The request's studio, the teacher and the groups' columns; no feed is built
+        with self.assertNumQueries(3):
+            cached = self.client.get(url, HTTP_IF_NONE_MATCH=response['ETag'])
+        self.assertEqual(cached.status_code, 304)
+
+        self.group.name = 'Bachata'
+        self.group.save()
+        changed = self.client.get(url, HTTP_IF_NONE_MATCH=response['ETag'])
+        self.assertEqual(changed.status_code, 200)
+        self.assertNotEqual(changed['ETag'], response['ETag'])
+
+    @pytest.mark.timeout(30)
+    def test_group_feed_requires_token(self):
+        """Test feeds without a valid token are not found"""
+        # kind: endpoint_tests, original method: django_app.views.group_calendar
+        self.assertEqual(self.client.get(self.feed_url('group', self.group.id, token='forged')).status_code, 404)
+        self.assertEqual(self.client.get(self.feed_url('group', self.group.id)).status_code, 200)
+        # A teacher token does not open a group feed with the same id
+        token = ical.feed_token('teacher', self.group.id)
+        self.assertEqual(self.client.get(self.feed_url('group', self.group.id, token=token)).status_code, 404)
+
+    @pytest.mark.timeout(30)
+    @override_settings(TIME_ZONE='Asia/Tbilisi')
+    def test_until_is_utc(self):
+        """Test UNTIL is converted to UTC when lessons use a local time zone"""
+        # kind: unit_tests, original method: django_app.ical.render
+        body = ical.render('Lessons', list(Group.objects.values(*ical.FEED_FIELDS)))
+        self.assertIn('DTSTART;TZID=Asia/Tbilisi:20240102T193000', body)
+        self.assertIn('UNTIL=20240630T195959Z', body)
+
+    @pytest.mark.timeout(30)
+    @override_settings(TIME_ZONE='Europe/Berlin')
+    def test_feed_describes_its_time_zone(self):
+        """Test the TZID used by the events is defined by a VTIMEZONE following daylight saving time"""
+        # kind: unit_tests, original method: django_app.ical.render
+        body = ical.render('Lessons', list(Group.objects.values(*ical.FEED_FIELDS)))
+        self.assertIn('BEGIN:VTIMEZONE\r\nTZID:Europe/Berlin\r\n', body)
+        self.assertIn(
+            'BEGIN:DAYLIGHT\r\nDTSTART:19700329T020000\r\nRRULE:FREQ=YEARLY;BYMONTH=3;BYDAY=-1SU\r\n'
+            'TZOFFSETFROM:+0100\r\nTZOFFSETTO:+0200\r\nTZNAME:CEST\r\nEND:DAYLIGHT\r\n', body
+        )
+        self.assertIn(
+            'BEGIN:STANDARD\r\nDTSTART:19701025T030000\r\nRRULE:FREQ=YEARLY;BYMONTH=10;BYDAY=-1SU\r\n'
+            'TZOFFSETFROM:+0200\r\nTZOFFSETTO:+0100\r\nTZNAME:CET\r\nEND:STANDARD\r\n', body
+        )
+        self.assertLess(body.index('END:VTIMEZONE'), body.index('BEGIN:VEVENT'))
+
+    @pytest.mark.timeout(30)
+    @freeze_time("2024-05-01 12:00:05")
+    def test_dtstamp_is_generation_time(self):
+        """Test events are stamped with the time the feed was generated; the ETag is what stays stable"""
+        # kind: unit_tests, original method: django_app.ical.render
+        body = ical.render('Lessons', list(Group.objects.values(*ical.FEED_FIELDS)))
+        self.assertEqual(body.count('DTSTAMP:20240501T120005Z\r\n'), 2)
+
+    @pytest.mark.timeout(30)
+    @override_settings(TIME_ZONE='Asia/Tbilisi')
+    def test_zone_without_daylight_saving_time(self):
+        """Test a zone with a fixed offset gets a single STANDARD observance"""
+        # kind: unit_tests, original method: django_app.ical.render
+        body = ical.render('Lessons', list(Group.objects.values(*ical.FEED_FIELDS)))
+        self.assertIn(
+            'BEGIN:STANDARD\r\nDTSTART:19700101T000000\r\nTZOFFSETFROM:+0400\r\nTZOFFSETTO:+0400\r\n', body
+        )
+        self.assertNotIn('BEGIN:DAYLIGHT', body)
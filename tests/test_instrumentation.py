@@ -0,0 +1,128 @@
+import json
+import pytest
+from datetime import date
+from django.test import TestCase, Client, override_settings
+from django.urls import reverse
+from django.contrib.auth.models import User
+from django.template import engines
+from django.template.base import Template as BaseTemplate
+from django_app.instrumentation import RequestMetrics, TimedDjangoTemplates, current_metrics, normalize_sql
+from django_app.models import Group, Student
+
+
+class TestNormalizeSql(TestCase):
+    """Unit tests for normalize_sql"""
+
+    @pytest.mark.timeout(30)
+    def test_normalize_sql_collapses_literals_and_in_lists(self):
+        """Test normalize_sql replaces parameters, literals and IN lists"""
+        # kind: unit_tests, original method: django_app.instrumentation.normalize_sql
+        sql = 'SELECT *  FROM "t" WHERE "a" = %s AND "b" IN (%s, %s, %s) AND "c" = \'x\' LIMIT 21'
+        self.assertEqual(
+            normalize_sql(sql),
+            'SELECT * FROM "t" WHERE "a" = ? AND "b" IN (...) AND "c" = ? LIMIT ?'
+        )
+
+    @pytest.mark.timeout(30)
+    def test_slowest_queries_keeps_top_n(self):
+        """Test RequestMetrics keeps only the slowest statements"""
+        # kind: unit_tests, original method: django_app.instrumentation.RequestMetrics.record_query
+        metrics = RequestMetrics(top_queries=2)
+        for n, duration in enumerate([0.001, 0.005, 0.003]):
+            metrics.record_query('default', f'SELECT {n}', (), duration)
+        self.assertEqual(metrics.query_count, 3)
+        self.assertEqual([q['duration_ms'] for q in metrics.slowest_queries()], [5.0, 3.0])
+
+
+class TestRequestMetricsMiddleware(TestCase):
+    """Endpoint tests for RequestMetricsMiddleware"""
+
+    def setUp(self):
+        self.client = Client()
+        self.user = User.objects.create_user(username='admin', is_staff=True)
+        Student.objects.create(user=User.objects.create_user(username='student'))
+        Group.objects.create(
+            name='Test Group',
+            schedule=[{"day": "tue", "time": "19:30"}],
+            duration='1hr',
+            start_at=date.today(),
+            location='Test Location'
+        )
+        self.client.force_login(self.user)
+
+    @pytest.mark.timeout(30)
+    def test_server_timing_header(self):
+        """Test responses carry a Server-Timing header with query count"""
+        # kind: endpoint_tests, original method: django_app.middleware.RequestMetricsMiddleware.finish
+        response = self.client.get(reverse('add_group'))
+        header = response['Server-Timing']
+        self.assertRegex(header, r'db;dur=[\d.]+;desc="\d+ queries"')
+        self.assertIn('tpl;dur=', header)
+        self.assertIn('total;dur=', header)
+
+    @pytest.mark.timeout(30)
+    def test_server_timing_only_for_staff(self):
+        """Test regular users only get a Server-Timing header with DEBUG on"""
+        # kind: endpoint_tests, original method: django_app.middleware.RequestMetricsMiddleware.shows_timing
+        self.client.force_login(User.objects.create_user(username='teacher'))
+        self.assertFalse(self.client.get(reverse('add_group')).has_header('Server-Timing'))
+        with override_settings(DEBUG=True):
+            self.assertTrue(self.client.get(reverse('add_group')).has_header('Server-Timing'))
+
+    @pytest.mark.timeout(30)
+    def test_template_time_from_backend(self):
+        """Test template renders are timed by the template backend without patching Template.render"""
+        # kind: unit_tests, original method: django_app.instrumentation.TimedTemplate.render
+        self.assertEqual(BaseTemplate.render.__module__, 'django.template.base')
+        engine = engines.all()[0]
+        self.assertIsInstance(engine, TimedDjangoTemplates)
+        metrics = RequestMetrics()
+        token = current_metrics.set(metrics)
+        try:
+            engine.from_string('{% for i in items %}{{ i }}{% endfor %}').render({'items': range(100)})
+        finally:
+            current_metrics.reset(token)
+        self.assertGreater(metrics.template_time, 0)
+        self.assertEqual(metrics.template_depth, 0)
+
+    @pytest.mark.timeout(30)
+    def test_async_view_queries_are_counted(self):
+        """Test queries issued through the async ORM are attributed to the request"""
+        # kind: endpoint_tests, original method: django_app.middleware.RequestMetricsMiddleware.__call__
+        response = self.client.get(reverse('students'))
+        metrics = response.wsgi_request.metrics
+        self.assertGreaterEqual(metrics.query_count, 3)
+        self.assertEqual(metrics.view_name, 'students')
+        self.assertGreater(metrics.template_time, 0)
+        self.assertEqual(metrics.response_size, len(response.content))
+
+    @pytest.mark.timeout(30)
+    async def test_asgi_request_queries_are_counted(self):
+        """Test the middleware runs natively under ASGI and still sees ORM queries"""
+        # kind: endpoint_tests, original method: django_app.middleware.RequestMetricsMiddleware.__acall__
+        await self.async_client.aforce_login(self.user)
+        response = await self.async_client.get(reverse('students'))
+        self.assertGreaterEqual(response.asgi_request.metrics.query_count, 3)
+        self.assertIn('Server-Timing', response)
+
+    @pytest.mark.timeout(30)
+    @override_settings(REQUEST_METRICS_MAX_QUERIES=0)
+    def test_logs_json_when_threshold_exceeded(self):
+        """Test a structured JSON log line is emitted for requests over the thresholds"""
+        # kind: endpoint_tests, original method: django_app.middleware.RequestMetricsMiddleware.finish
+        with self.assertLogs('django_app.instrumentation', level='WARNING') as logs:
+            self.client.get(reverse('dashboard'))
+        record = json.loads(logs.records[0].getMessage())
+        self.assertEqual(record['event'], 'slow_request')
+        self.assertEqual(record['view'], 'dashboard')
+        self.assertEqual(record['path'], '/')
+        self.assertGreater(record['query_count'], 0)
+        self.assertTrue(record['slowest_queries'])
+
+    @pytest.mark.timeout(30)
+    @override_settings(REQUEST_METRICS_SERVER_TIMING=False)
+    def test_server_timing_can_be_disabled(self):
+        """Test the Server-Timing header can be switched off"""
+        # kind: endpoint_tests, original method: django_app.middleware.RequestMetricsMiddleware.finish
+        response = self.client.get(reverse('dashboard'))
+        self.assertFalse(response.has_header('Server-Timing'))
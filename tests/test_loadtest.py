@@ -0,0 +1,94 @@
+import pytest
+from datetime import date
+from io import StringIO
+from django.core.management import call_command
+from django.test import TestCase, LiveServerTestCase
+from django_app import loadtest
+from django_app.models import Group, Teacher, StudentVisit
+
+
+class TestLoadTestReport(TestCase):
+    """Unit tests for load-test reporting"""
+
+    @pytest.mark.timeout(30)
+    def test_percentile_nearest_rank(self):
+        """Test percentile uses the nearest-rank method"""
+        # kind: unit_tests, original method: django_app.loadtest.percentile
+        values = list(range(1, 101))
+        self.assertEqual(loadtest.percentile(values, 50), 50)
+        self.assertEqual(loadtest.percentile(values, 95), 95)
+        self.assertEqual(loadtest.percentile(values, 99), 99)
+        self.assertEqual(loadtest.percentile([], 99), 0.0)
+
+    @pytest.mark.timeout(30)
+    def test_results_summary_counts_errors(self):
+        """Test Results.summary reports errors, server errors and percentiles per step"""
+        # kind: unit_tests, original method: django_app.loadtest.Results.summary
+        results = loadtest.Results()
+        results.record('save_attendance', 0.1, 302)
+        results.record('save_attendance', 0.3, 500)
+        summary = results.summary()
+        self.assertEqual(summary['requests'], 2)
+        self.assertEqual(summary['errors'], 1)
+        self.assertEqual(summary['server_errors'], 1)
+        self.assertEqual(summary['steps']['save_attendance']['p99_ms'], 300.0)
+
+    @pytest.mark.timeout(30)
+    def test_results_classify_errors(self):
+        """Test every 5xx is a server error and a failed check counts as an error despite its status"""
+        # kind: unit_tests, original method: django_app.loadtest.Results.record
+        results = loadtest.Results()
+        results.record('login', 0.1, 200, failed=True)
+        results.record('dashboard', 0.1, 503)
+        results.record('dashboard', 0.1, 599)
+        results.record('dashboard', 0.1, 404)
+        summary = results.summary()
+        self.assertEqual(summary['errors'], 4)
+        self.assertEqual(summary['server_errors'], 2)
+        self.assertEqual(summary['steps']['login']['errors'], 1)
+
+    @pytest.mark.timeout(30)
+    def test_seed_load_test_is_idempotent(self):
+        """Test seed_load_test creates teachers with groups and tops up students"""
+        # kind: unit_tests, original method: django_app.management.commands.seed_load_test.Command.handle
+        call_command('seed_load_test', '--teachers', '2', '--students-per-group', '3', stdout=StringIO())
+        call_command('seed_load_test', '--teachers', '2', '--students-per-group', '4', stdout=StringIO())
+        self.assertEqual(Teacher.objects.count(), 2)
+        for group in Group.objects.all():
+            self.assertEqual(group.students.count(), 4)
+            self.assertEqual(group.teachers.count(), 1)
+
+
+class TestLoadTestRun(LiveServerTestCase):
+    """End-to-end run of the class-change scenario against a live server"""
+
+    @pytest.mark.timeout(120)
+    def test_class_change_scenario(self):
+        """Test the scenario logs in, opens attendance and saves it for every teacher"""
+        # kind: endpoint_tests, original method: django_app.loadtest.run
+        # Two teachers save at the same moment; the file-backed test database gives each
+        # live-server thread its own connection (see test_settings)
+        call_command('seed_load_test', '--teachers', '2', '--students-per-group', '3', stdout=StringIO())
+        out = StringIO()
+        call_command('load_test', '--base-url', self.live_server_url, '--users', '2', '--iterations', '2', stdout=out)
+        self.assertIn(" 0 error(s)", out.getvalue())
+        self.assertEqual(StudentVisit.objects.filter(date=date.today()).count(), 6)
+
+    @pytest.mark.timeout(120)
+    def test_login_scenario(self):
+        """Test the login scenario logs in from a fresh session and makes authenticated requests"""
+        # kind: endpoint_tests, original method: django_app.loadtest.run_login
+        call_command('seed_load_test', '--teachers', '1', '--students-per-group', '1', stdout=StringIO())
+        summary = loadtest.run_login(self.live_server_url, [1], iterations=2, requests=3)
+        self.assertEqual(summary['errors'], 0)
+        self.assertEqual(summary['steps']['login']['requests'], 2)
+        self.assertEqual(summary['steps']['authenticated']['requests'], 6)
+
+    @pytest.mark.timeout(120)
+    def test_rejected_login_is_an_error(self):
+        """Test a login that re-renders the form counts as an error"""
+        # kind: endpoint_tests, original method: django_app.loadtest.log_in
+        call_command('seed_load_test', '--teachers', '1', '--students-per-group', '1', stdout=StringIO())
+        summary = loadtest.run_login(self.live_server_url, [1], requests=0, password='wrong')
+        self.assertEqual(summary['steps']['login']['errors'], 1)
+        self.assertEqual(summary['server_errors'], 0)
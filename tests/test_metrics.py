@@ -0,0 +1,145 @@
+import multiprocessing
+import os
+import shutil
+import tempfile
+import pytest
+from datetime import date
+from unittest import mock
+from django.db import OperationalError
+from django.test import TestCase, Client, override_settings
+from django.urls import reverse
+from django.contrib.auth.models import User
+from django_app import attendance, metrics
+from django_app.models import Group, Pass, Teacher, Student
+
+
+def _increment_in_child():
+    metrics.inc(metrics.ATTENDANCE_SAVES, 3)
+    # A forked multiprocessing child skips atexit, where a worker would flush
+    metrics.flush()
+
+
+class TestMetrics(TestCase):
+    """Tests for the Prometheus metrics store and endpoint"""
+
+    def setUp(self):
+        self.tmpdir = tempfile.mkdtemp()
+        self.settings_override = override_settings(METRICS_DB_PATH=os.path.join(self.tmpdir, 'metrics.sqlite3'))
+        self.settings_override.enable()
+        self.client = Client()
+        self.teacher_user = User.objects.create_user(username='teacher')
+        self.teacher = Teacher.objects.create(user=self.teacher_user)
+        self.student = Student.objects.create(user=User.objects.create_user(username='student'))
+        self.group = Group.objects.create(
+            name='Test Group', schedule=[], duration='1hr', start_at=date.today(), location='Studio'
+        )
+        self.group.teachers.add(self.teacher)
+        self.pass_obj = Pass.objects.create(name='Pass', price=100, group=self.group, lessons_included=10)
+        self.client.force_login(self.teacher_user)
+
+    def tearDown(self):
+        self.settings_override.disable()
+        shutil.rmtree(self.tmpdir)
+
+    @pytest.mark.timeout(30)
+    def test_request_histograms_per_view(self):
+        """Test requests are recorded in per-view latency and query histograms"""
+        # kind: endpoint_tests, original method: django_app.metrics.observe_request
+        self.client.get(reverse('dashboard'))
+        self.client.get(reverse('dashboard'))
+        body = self.client.get(reverse('metrics')).content.decode()
+        self.assertIn('# TYPE dancelog_request_duration_seconds histogram', body)
+        self.assertIn('dancelog_request_duration_seconds_count{view="dashboard"} 2', body)
+        self.assertIn('dancelog_request_duration_seconds_bucket{le="+Inf",view="dashboard"} 2', body)
+        self.assertIn('dancelog_request_queries_count{view="dashboard"} 2', body)
+
+    @pytest.mark.timeout(30)
+    def test_buckets_are_cumulative_and_ordered(self):
+        """Test histogram buckets count every observation at or below their bound, in order"""
+        # kind: unit_tests, original method: django_app.metrics.render
+        metrics.observe_request('students', 0.02, 3)
+        metrics.observe_request('students', 0.3, 30)
+        lines = [line for line in metrics.render().splitlines()
+                 if line.startswith('dancelog_request_queries_bucket')]
+        self.assertEqual(lines[0], 'dancelog_request_queries_bucket{le="1",view="students"} 0')
+        self.assertIn('dancelog_request_queries_bucket{le="5",view="students"} 1', lines)
+        self.assertIn('dancelog_request_queries_bucket{le="50",view="students"} 2', lines)
+        self.assertEqual(lines[-1], 'dancelog_request_queries_bucket{le="+Inf",view="students"} 2')
+
+    @pytest.mark.timeout(30)
+    def test_purchase_and_attendance_counters(self):
+        """Test purchases and attendance saves increment their counters after commit"""
+        # kind: endpoint_tests, original method: django_app.views.add_purchase
+        with self.captureOnCommitCallbacks(execute=True):
+            self.client.post(reverse('add_purchase', kwargs={'student_id': self.student.id}), {
+                'dance_pass': self.pass_obj.id,
+                'payment_method': 'CASH',
+            })
+        with self.captureOnCommitCallbacks(execute=True):
+            self.client.post(reverse('lesson_detail', kwargs={
+                'group_id': self.group.id, 'lesson_date': '2024-01-15'
+            }), {'students': [str(self.student.id)]})
+        body = metrics.render()
+        self.assertIn('dancelog_purchases_total{paid="true"} 1', body)
+        self.assertIn('dancelog_attendance_saves_total 1', body)
+
+    @pytest.mark.timeout(30)
+    def test_cache_access_counter(self):
+        """Test cache hits and misses are counted per cache"""
+        # kind: unit_tests, original method: django_app.metrics.record_cache_access
+        metrics.record_cache_access('roster', True)
+        metrics.record_cache_access('roster', True)
+        metrics.record_cache_access('roster', False)
+        body = metrics.render()
+        self.assertIn('dancelog_cache_requests_total{cache="roster",result="hit"} 2', body)
+        self.assertIn('dancelog_cache_requests_total{cache="roster",result="miss"} 1', body)
+
+    @pytest.mark.timeout(30)
+    def test_lock_error_counter(self):
+        """Test lock errors are counted when a save retries and when the request fails on one"""
+        # kind: endpoint_tests, original method: django_app.middleware.RequestMetricsMiddleware.process_exception
+        client = Client(raise_request_exception=False)
+        client.force_login(self.teacher_user)
+        locked = mock.patch.object(attendance, '_save_attendance', side_effect=OperationalError('database is locked'))
+        with locked, mock.patch.object(attendance.time, 'sleep'):
+            response = client.post(reverse('lesson_detail', kwargs={
+                'group_id': self.group.id, 'lesson_date': '2024-01-15'
+            }), {'students': [str(self.student.id)]})
+        self.assertEqual(response.status_code, 500)
+        body = metrics.render()
+        self.assertIn('dancelog_db_lock_errors_total{outcome="retried",view="save_attendance"} 3', body)
+        self.assertIn('dancelog_db_lock_errors_total{outcome="failed",view="lesson_detail"} 1', body)
+
+    @pytest.mark.timeout(30)
+    def test_counts_are_buffered_until_flushed(self):
+        """Test increments stay in memory until the flush interval passes"""
+        # kind: unit_tests, original method: django_app.metrics.flush
+        path = os.path.join(self.tmpdir, 'metrics.sqlite3')
+        metrics.reset()
+        with override_settings(METRICS_FLUSH_SECONDS=3600):
+            metrics.inc(metrics.ATTENDANCE_SAVES)
+            metrics.inc(metrics.ATTENDANCE_SAVES)
+            self.assertEqual(metrics._connection(path).execute("SELECT COUNT(*) FROM samples").fetchone()[0], 0)
+        with override_settings(METRICS_FLUSH_SECONDS=0):
+            metrics.inc(metrics.ATTENDANCE_SAVES)
+            rows = metrics._connection(path).execute("SELECT value FROM samples").fetchall()
+        self.assertEqual(rows, [(3.0,)])
+
+    @pytest.mark.timeout(30)
+    def test_aggregates_across_processes(self):
+        """Test samples written by another process are included in the totals"""
+        # kind: unit_tests, original method: django_app.metrics.inc
+        metrics.inc(metrics.ATTENDANCE_SAVES)
+        child = multiprocessing.get_context('fork').Process(target=_increment_in_child)
+        child.start()
+        child.join(10)
+        self.assertEqual(child.exitcode, 0)
+        self.assertIn('dancelog_attendance_saves_total 4', metrics.render())
+
+    @pytest.mark.timeout(30)
+    def test_metrics_forbidden_for_other_hosts(self):
+        """Test /metrics refuses anonymous scrapes from addresses not in METRICS_ALLOWED_IPS"""
+        # kind: endpoint_tests, original method: django_app.views.metrics_view
+        response = Client(REMOTE_ADDR='10.0.0.5').get(reverse('metrics'))
+        self.assertEqual(response.status_code, 403)
+        self.assertEqual(Client().get(reverse('metrics')).status_code, 200)
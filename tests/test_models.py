@@ -1,8 +1,9 @@
 import pytest
-from datetime import date, datetime
+from datetime import date, datetime, timedelta
 from django.test import TestCase
 from django.contrib.auth.models import User
 from django.utils import timezone
+from freezegun import freeze_time
 from django_app.models import Group, Pass, Teacher, Student, StudentVisit, Purchase
 
 
@@ -261,4 +262,39 @@ class TestPurchase(TestCase):
             dance_pass=self.pass_obj
         )
         expected = f"{self.student} - Test Pass (Unpaid)"
-        self.assertEqual(str(purchase), expected)
\ No newline at end of file
+        self.assertEqual(str(purchase), expected)
+
+    @pytest.mark.timeout(30)
+    def test_expires_at_from_pass_validity(self):
+        """Test a purchase's expiry is set from its pass's valid_days when it is made"""
+        # kind: unit_tests, original method: django_app.models.Purchase.save
+        self.assertIsNone(Purchase.objects.create(student=self.student, dance_pass=self.pass_obj).expires_at)
+
+        self.pass_obj.valid_days = 30
+        self.pass_obj.save()
+        with freeze_time("2024-01-10 12:00"):
+            purchase = Purchase.objects.create(student=self.student, dance_pass=self.pass_obj)
+        self.assertEqual(purchase.expires_at, purchase.created_at + timedelta(days=30))
+
+        # Changing the pass later does not move existing expiry dates
+        self.pass_obj.valid_days = 60
+        self.pass_obj.save()
+        purchase.save()
+        purchase.refresh_from_db()
+        self.assertEqual(purchase.expires_at, purchase.created_at + timedelta(days=30))
+
+    @pytest.mark.timeout(30)
+    def test_expired_purchases_are_not_active(self):
+        """Test expired purchases drop out of active passes while open-ended ones stay"""
+        # kind: unit_tests, original method: django_app.models.PurchaseQuerySet.unexpired
+        monthly = Pass.objects.create(name='Monthly', price=50, group=self.group, lessons_included=8, valid_days=30)
+        with freeze_time(timezone.now() - timedelta(days=31)):
+            expired = Purchase.objects.create(student=self.student, dance_pass=monthly, paid_at=timezone.now())
+        current = Purchase.objects.create(student=self.student, dance_pass=monthly, paid_at=timezone.now())
+        open_ended = Purchase.objects.create(student=self.student, dance_pass=self.pass_obj, paid_at=timezone.now())
+
+        self.assertEqual(set(Purchase.objects.unexpired()), {current, open_ended})
+        self.assertEqual(set(Purchase.objects.unexpired(at=expired.created_at)), {expired, current, open_ended})
+        self.assertEqual(
+            {entry['purchase'] for entry in self.student.get_active_passes()}, {current, open_ended}
+        )
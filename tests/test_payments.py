@@ -0,0 +1,301 @@
+import pytest
+from datetime import date, timedelta
+from decimal import Decimal
+from io import StringIO
+from unittest import mock
+from django.conf import settings
+from django.core.management import call_command, CommandError
+from django.test import TestCase, Client
+from django.urls import reverse
+from django.contrib.auth.models import User
+from django.test.utils import CaptureQueriesContext
+from django.db import connection
+from django.db.models import ProtectedError
+from django.utils import timezone
+from django_app import payments
+from django_app.models import (
+    Group, Pass, Teacher, Student, Purchase, IdempotencyKey, PaymentEvent, StudentBalance
+)
+
+
+class TestMarkPaid(TestCase):
+    """Tests for conditional, idempotent payment updates"""
+
+    def setUp(self):
+        self.client = Client()
+        self.teacher_user = User.objects.create_user(username='teacher')
+        self.teacher = Teacher.objects.create(user=self.teacher_user)
+        self.student = Student.objects.create(user=User.objects.create_user(username='student'))
+        group = Group.objects.create(
+            name='Salsa', schedule=[{"day": "tue", "time": "19:30"}], duration='1hr', start_at=date.today()
+        )
+        self.pass_obj = Pass.objects.create(name='Monthly', price=100, group=group, lessons_included=8)
+        self.purchases = [Purchase.objects.create(student=self.student, dance_pass=self.pass_obj) for _ in range(3)]
+        self.client.force_login(self.teacher_user)
+
+    @pytest.mark.timeout(30)
+    def test_mark_paid_reports_changed_rows(self):
+        """Test mark_paid only updates unpaid purchases and reports the counts"""
+        # kind: unit_tests, original method: django_app.payments.mark_paid
+        paid_at = timezone.now()
+        Purchase.objects.filter(pk=self.purchases[0].pk).update(paid_at=paid_at, payment_method='CASH')
+
+        report = payments.mark_paid([p.pk for p in self.purchases], 'TBC', cashier=self.teacher)
+        self.assertEqual(report, {'requested': 3, 'updated': 2, 'unchanged': 1, 'replayed': False})
+        first = Purchase.objects.get(pk=self.purchases[0].pk)
+        self.assertEqual((first.paid_at, first.payment_method), (paid_at, 'CASH'))
+
+    @pytest.mark.timeout(30)
+    def test_mark_paid_single_conditional_update(self):
+        """Test mark_paid writes with one UPDATE guarded by paid_at IS NULL"""
+        # kind: unit_tests, original method: django_app.payments.mark_paid
+        with CaptureQueriesContext(connection) as queries:
+            payments.mark_paid([self.purchases[0].pk], 'TBC')
+        table = Purchase._meta.db_table
+        updates = [q['sql'] for q in queries.captured_queries if q['sql'].startswith(f'UPDATE "{table}"')]
+        self.assertEqual(len(updates), 1)
+        self.assertIn('"paid_at" IS NULL', updates[0])
+        self.assertNotIn('"notes"', updates[0])
+
+    @pytest.mark.timeout(30)
+    def test_mark_paid_replays_idempotency_key(self):
+        """Test a repeated idempotency key returns the stored report without updating"""
+        # kind: unit_tests, original method: django_app.payments.mark_paid
+        ids = [p.pk for p in self.purchases]
+        payments.mark_paid(ids, 'TBC', idempotency_key='k1')
+        Purchase.objects.update(paid_at=None)
+
+        report = payments.mark_paid(ids, 'TBC', idempotency_key='k1')
+        self.assertTrue(report['replayed'])
+        self.assertEqual(report['updated'], 3)
+        self.assertFalse(Purchase.objects.filter(paid_at__isnull=False).exists())
+
+    @pytest.mark.timeout(30)
+    def test_retried_post_is_not_reapplied(self):
+        """Test resubmitting the same mark-paid form does not change the payment"""
+        # kind: endpoint_tests, original method: django_app.views.mark_purchase_paid
+        purchase = self.purchases[0]
+        url = reverse('mark_purchase_paid', kwargs={'purchase_id': purchase.id})
+        self.client.post(url, {'payment_method': 'TBC', 'idempotency_key': 'form-1'})
+        response = self.client.post(url, {'payment_method': 'CASH', 'idempotency_key': 'form-1'})
+        self.assertRedirects(response, reverse('student_detail', kwargs={'student_id': self.student.id}))
+
+        purchase.refresh_from_db()
+        self.assertEqual(purchase.payment_method, 'TBC')
+        self.assertEqual(purchase.cashier, self.teacher)
+        self.assertEqual(IdempotencyKey.objects.count(), 1)
+
+    @pytest.mark.timeout(30)
+    def test_bulk_endpoint_reports_changes(self):
+        """Test the bulk endpoint returns how many purchases were marked paid"""
+        # kind: endpoint_tests, original method: django_app.views.mark_purchases_paid
+        Purchase.objects.filter(pk=self.purchases[0].pk).update(paid_at=timezone.now())
+        response = self.client.post(
+            reverse('mark_purchases_paid'),
+            {'purchases': [p.pk for p in self.purchases], 'payment_method': 'BOG'},
+            HTTP_IDEMPOTENCY_KEY='batch-1',
+        )
+        self.assertEqual(response.json(), {'requested': 3, 'updated': 2, 'unchanged': 1, 'replayed': False})
+
+    @pytest.mark.timeout(30)
+    def test_bulk_endpoint_rejects_invalid_method(self):
+        """Test the bulk endpoint rejects unknown payment methods"""
+        # kind: endpoint_tests, original method: django_app.views.mark_purchases_paid
+        response = self.client.post(reverse('mark_purchases_paid'), {
+            'purchases': [self.purchases[0].pk], 'payment_method': 'GOLD'
+        })
+        self.assertEqual(response.status_code, 400)
+        self.assertFalse(Purchase.objects.filter(paid_at__isnull=False).exists())
+
+
+class TestPaymentLog(TestCase):
+    """Tests for the payment event log and its balance projection"""
+
+    def setUp(self):
+        self.client = Client()
+        self.teacher_user = User.objects.create_user(username='teacher')
+        self.teacher = Teacher.objects.create(user=self.teacher_user)
+        self.student = Student.objects.create(user=User.objects.create_user(username='student'))
+        group = Group.objects.create(
+            name='Salsa', schedule=[{"day": "tue", "time": "19:30"}], duration='1hr', start_at=date.today()
+        )
+        self.pass_obj = Pass.objects.create(name='Monthly', price=100, group=group, lessons_included=8)
+        self.client.force_login(self.teacher_user)
+
+    def buy(self, **fields):
+        purchase = Purchase.objects.create(student=self.student, dance_pass=self.pass_obj, **fields)
+        payments.record_purchase(purchase)
+        return purchase
+
+    @pytest.mark.timeout(30)
+    def test_balance_follows_events(self):
+        """Test purchases, payments and adjustments keep the projected balance current"""
+        # kind: unit_tests, original method: django_app.payments.record_events
+        first = self.buy()
+        self.buy(paid_at=timezone.now(), payment_method='CASH')
+        self.assertEqual(Student.objects.get(pk=self.student.pk).outstanding_balance, Decimal('100'))
+
+        payments.mark_paid([first.pk], 'TBC')
+        payments.record_event(self.student, PaymentEvent.KIND_ADJUSTED, Decimal('-15.50'), note='Discount')
+        balance = StudentBalance.objects.get(student=self.student)
+        self.assertEqual(balance.outstanding, Decimal('-15.50'))
+        self.assertEqual(balance.last_event_id, PaymentEvent.objects.latest('pk').pk)
+        self.assertEqual(
+            list(PaymentEvent.objects.values_list('kind', flat=True)),
+            ['created', 'created', 'paid', 'paid', 'adjusted'],
+        )
+
+    @pytest.mark.timeout(30)
+    def test_price_change_keeps_charged_amount(self):
+        """Test a purchase is paid and voided at the amount charged, not at the pass's later price"""
+        # kind: unit_tests, original method: django_app.payments.mark_paid
+        first = self.buy()
+        second = self.buy()
+        Pass.objects.filter(pk=self.pass_obj.pk).update(price=120)
+
+        payments.mark_paid([first.pk], 'CASH')
+        payments.void_purchases([Purchase.objects.select_related('dance_pass').get(pk=second.pk)])
+        self.assertEqual(
+            list(PaymentEvent.objects.values_list('kind', 'amount')),
+            [('created', Decimal('100')), ('created', Decimal('100')), ('paid', Decimal('-100')),
+             ('voided', Decimal('-100'))],
+        )
+        self.assertEqual(StudentBalance.objects.get(student=self.student).outstanding, 0)
+        self.pass_obj.refresh_from_db()
+        self.assertEqual(self.buy().amount, Decimal('120'))
+
+    @pytest.mark.timeout(30)
+    def test_events_are_append_only(self):
+        """Test saving or deleting an existing event is refused"""
+        # kind: unit_tests, original method: django_app.models.PaymentEvent.save
+        event = payments.record_event(self.student, PaymentEvent.KIND_ADJUSTED, Decimal('5'))
+        event.amount = Decimal('0')
+        with self.assertRaises(ValueError):
+            event.save()
+        with self.assertRaises(ValueError):
+            event.delete()
+
+    @pytest.mark.timeout(30)
+    def test_add_purchase_logs_events(self):
+        """Test logging a paid purchase records both the sale and the payment"""
+        # kind: endpoint_tests, original method: django_app.views.add_purchase
+        self.client.post(reverse('add_purchase', kwargs={'student_id': self.student.id}), {
+            'dance_pass': self.pass_obj.id, 'payment_method': 'BOG', 'notes': '',
+        })
+        self.assertEqual(
+            list(PaymentEvent.objects.values_list('kind', 'amount')),
+            [('created', Decimal('100')), ('paid', Decimal('-100'))],
+        )
+        self.assertEqual(StudentBalance.objects.get(student=self.student).outstanding, 0)
+
+    @pytest.mark.timeout(30)
+    def test_rebuild_balances_command(self):
+        """Test rebuild_balances restores projections from the log and --check reports drift"""
+        # kind: unit_tests, original method: django_app.management.commands.rebuild_balances.Command.handle
+        self.buy()
+        self.buy()
+        StudentBalance.objects.update(outstanding=0)
+        with self.assertRaises(CommandError):
+            call_command('rebuild_balances', '--check', stdout=StringIO())
+
+        out = StringIO()
+        call_command('rebuild_balances', stdout=out)
+        self.assertIn('Rebuilt 1 balance(s) from 2 event(s).', out.getvalue())
+        self.assertEqual(StudentBalance.objects.get(student=self.student).outstanding, Decimal('200'))
+        call_command('rebuild_balances', '--check', stdout=StringIO())
+
+    @pytest.mark.timeout(30)
+    def test_check_reads_primary(self):
+        """Test rebuild_balances --check compares against the primary even when a replica is configured"""
+        # kind: unit_tests, original method: django_app.management.commands.rebuild_balances.Command.handle
+        self.buy()
+        StudentBalance.objects.update(outstanding=0)
+        replica = {'replica': {**settings.DATABASES['default'], 'NAME': 'replica.sqlite3'}}
+        with mock.patch.dict(settings.DATABASES, replica), self.assertRaises(CommandError):
+            call_command('rebuild_balances', '--check', stdout=StringIO())
+
+    @pytest.mark.timeout(30)
+    def test_pass_with_purchases_cannot_be_deleted(self):
+        """Test deleting a pass or group refuses to drop purchases that were never voided in the log"""
+        # kind: unit_tests, original method: django_app.models.Purchase
+        purchase = self.buy()
+        with self.assertRaises(ProtectedError):
+            self.pass_obj.delete()
+        with self.assertRaises(ProtectedError):
+            self.pass_obj.group.delete()
+
+        payments.void_purchases([purchase])
+        purchase.delete()
+        self.pass_obj.group.delete()
+        self.assertEqual(StudentBalance.objects.get(student=self.student).outstanding, 0)
+        self.assertEqual(PaymentEvent.objects.count(), 2)
+
+    @pytest.mark.timeout(30)
+    def test_student_detail_shows_balance(self):
+        """Test the student page shows the outstanding balance from the projection"""
+        # kind: endpoint_tests, original method: django_app.views.student_detail
+        self.buy()
+        response = self.client.get(reverse('student_detail', kwargs={'student_id': self.student.id}))
+        self.assertContains(response, 'Outstanding balance')
+        self.assertContains(response, '$100.00')
+
+
+class TestDebtors(TestCase):
+    """Tests for the debtors list"""
+
+    def setUp(self):
+        self.client = Client()
+        self.client.force_login(User.objects.create_user(username='teacher'))
+        group = Group.objects.create(
+            name='Salsa', schedule=[{"day": "tue", "time": "19:30"}], duration='1hr', start_at=date.today()
+        )
+        cheap = Pass.objects.create(name='Single', price=20, group=group, lessons_included=1)
+        monthly = Pass.objects.create(name='Monthly', price=100, group=group, lessons_included=8)
+        self.alice = Student.objects.create(user=User.objects.create_user(username='alice', first_name='Alice'))
+        self.bob = Student.objects.create(user=User.objects.create_user(username='bob', first_name='Bob'))
+        paid = Student.objects.create(user=User.objects.create_user(username='carol', first_name='Carol'))
+        for student, dance_pass in [(self.alice, cheap), (self.alice, cheap), (self.bob, monthly)]:
+            payments.record_purchase(Purchase.objects.create(student=student, dance_pass=dance_pass))
+        payments.record_purchase(Purchase.objects.create(student=paid, dance_pass=monthly, paid_at=timezone.now()))
+        Purchase.objects.filter(student=self.alice).update(created_at=timezone.now() - timedelta(days=30))
+
+    @pytest.mark.timeout(30)
+    def test_debtors_aggregate(self):
+        """Test debtors() groups unpaid purchases per student and carries the balance along"""
+        # kind: unit_tests, original method: django_app.models.PurchaseQuerySet.debtors
+        rows = {row['student_id']: row for row in Purchase.objects.debtors()}
+        self.assertEqual(set(rows), {self.alice.id, self.bob.id})
+        self.assertEqual(rows[self.alice.id]['total_owed'], Decimal('40'))
+        self.assertEqual(rows[self.alice.id]['unpaid_count'], 2)
+        self.assertEqual(rows[self.alice.id]['student__balance__outstanding'], Decimal('40'))
+        self.assertEqual(rows[self.bob.id]['total_owed'], Decimal('100'))
+
+    @pytest.mark.timeout(30)
+    def test_debtors_with_credit_are_listed(self):
+        """Test students with unpaid purchases stay listed when a credit nets their balance out"""
+        # kind: unit_tests, original method: django_app.models.PurchaseQuerySet.debtors
+        payments.record_event(self.bob, PaymentEvent.KIND_ADJUSTED, Decimal('-150'), note='Prepaid credit')
+        carol = Student.objects.get(user__username='carol')
+        payments.record_event(carol, PaymentEvent.KIND_ADJUSTED, Decimal('30'), note='Late fee')
+        rows = {row['student_id']: row for row in Purchase.objects.debtors()}
+        self.assertEqual(set(rows), {self.alice.id, self.bob.id})
+        self.assertEqual(rows[self.bob.id]['total_owed'], Decimal('100'))
+        self.assertEqual(rows[self.bob.id]['student__balance__outstanding'], Decimal('-50'))
+
+    @pytest.mark.timeout(30)
+    def test_debtors_view_sorts_in_one_aggregate(self):
+        """Test the debtors page sorts by the requested column without per-student queries"""
+        # kind: endpoint_tests, original method: django_app.views.debtors
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get(reverse('debtors'))
+        rows = list(response.context['page'].object_list)
+        self.assertEqual([row['student_id'] for row in rows], [self.bob.id, self.alice.id])
+        # The page count and the page itself; no per-student queries
+        table = Purchase._meta.db_table
+        self.assertEqual(len([q for q in queries.captured_queries if table in q['sql']]), 2)
+
+        response = self.client.get(reverse('debtors'), {'sort': 'oldest'})
+        rows = list(response.context['page'].object_list)
+        self.assertEqual([row['student_id'] for row in rows], [self.alice.id, self.bob.id])
+        self.assertContains(response, 'Alice')
+        self.assertNotContains(response, 'Carol')
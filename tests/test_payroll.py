@@ -0,0 +1,160 @@
+import pytest
+from datetime import date
+from django.core.cache import cache
+from django.db import connection
+from django.test import TestCase, TransactionTestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+from django.contrib.auth.models import User
+from freezegun import freeze_time
+from django_app import attendance, payroll, tasks, tenancy
+from django_app.models import Group, Teacher, Student, StudentVisit, Task
+
+
+class TestPayrollReport(TestCase):
+    """Tests for teacher hours aggregated from attendance"""
+
+    def setUp(self):
+        cache.clear()
+        self.nino = Teacher.objects.create(user=User.objects.create_user(username='nino', first_name='Nino', last_name='K'))
+        self.levan = Teacher.objects.create(user=User.objects.create_user(username='levan'))
+        self.salsa = Group.objects.create(
+            name='Salsa', schedule=[{"day": "tue", "time": "19:30"}], duration='90min', start_at=date(2024, 1, 1)
+        )
+        self.tango = Group.objects.create(
+            name='Tango', schedule=[{"day": "tue", "time": "19:30"}], duration='1hr', start_at=date(2024, 1, 1)
+        )
+        self.salsa.teachers.add(self.nino, self.levan)
+        self.tango.teachers.add(self.nino)
+        self.anna = Student.objects.create(user=User.objects.create_user(username='anna'))
+        self.ben = Student.objects.create(user=User.objects.create_user(username='ben'))
+
+    def visit(self, student, group, day, skipped=False):
+        return StudentVisit.objects.create(student=student, group=group, date=day, skipped=skipped)
+
+    @pytest.mark.timeout(30)
+    def test_teacher_hours(self):
+        """Test distinct attended lessons are counted per teacher and weighted by duration, in one query"""
+        # kind: unit_tests, original method: django_app.payroll.teacher_hours
+        # Two students at one Salsa lesson is still one lesson
+        self.visit(self.anna, self.salsa, date(2024, 1, 9))
+        self.visit(self.ben, self.salsa, date(2024, 1, 9))
+        # Tango on the same date is a separate lesson
+        self.visit(self.anna, self.tango, date(2024, 1, 9))
+        self.visit(self.anna, self.salsa, date(2024, 1, 16))
+        # Nobody came: not taught
+        self.visit(self.ben, self.salsa, date(2024, 1, 23), skipped=True)
+        # Outside the period
+        self.visit(self.anna, self.salsa, date(2024, 2, 6))
+
+        with CaptureQueriesContext(connection) as queries:
+            report = payroll.teacher_hours(date(2024, 1, 1), date(2024, 1, 31))
+        self.assertEqual(len(queries), 1)
+        self.assertEqual(report, [
+            payroll.PayrollRow(self.levan.id, 'levan', 2, 180),
+            payroll.PayrollRow(self.nino.id, 'Nino K', 3, 240),
+        ])
+        self.assertEqual(report[1].hours, 4)
+
+    @pytest.mark.timeout(30)
+    @freeze_time("2024-02-10")
+    def test_closed_months_are_cached(self):
+        """Test a closed month is computed once while the current month is always fresh"""
+        # kind: unit_tests, original method: django_app.payroll.monthly_report
+        self.visit(self.anna, self.tango, date(2024, 1, 9))
+        self.assertEqual(payroll.monthly_report(2024, 1)[0].lessons, 1)
+        # Only the attendance stamp is read
+        with CaptureQueriesContext(connection) as queries:
+            self.assertEqual(payroll.monthly_report(2024, 1)[0].lessons, 1)
+        self.assertEqual(len(queries), 1)
+
+        self.visit(self.anna, self.tango, date(2024, 2, 6))
+        self.assertEqual(payroll.monthly_report(2024, 2)[0].lessons, 1)
+        self.visit(self.anna, self.tango, date(2024, 2, 8))
+        self.assertEqual(payroll.monthly_report(2024, 2)[0].lessons, 2)
+
+    @pytest.mark.timeout(30)
+    @freeze_time("2024-02-10")
+    def test_closed_month_cache_follows_attendance_changes(self):
+        """Test late attendance edits, bulk actions and deletes in a closed month show up in its report"""
+        # kind: unit_tests, original method: django_app.payroll.attendance_stamp
+        first = self.visit(self.anna, self.tango, date(2024, 1, 9))
+        self.assertEqual(payroll.monthly_report(2024, 1)[0].lessons, 1)
+
+        second = self.visit(self.anna, self.tango, date(2024, 1, 16))
+        self.assertEqual(payroll.monthly_report(2024, 1)[0].lessons, 2)
+
+        StudentVisit.objects.filter(pk=second.pk).toggle_skipped()
+        self.assertEqual(payroll.monthly_report(2024, 1)[0].lessons, 1)
+
+        attendance.save_attendance(self.tango, date(2024, 1, 23), {self.ben.pk: False})
+        self.assertEqual(payroll.monthly_report(2024, 1)[0].lessons, 2)
+
+        first.delete()
+        self.assertEqual(payroll.monthly_report(2024, 1)[0].lessons, 1)
+
+    @pytest.mark.timeout(30)
+    @freeze_time("2024-02-10")
+    def test_payroll_view_and_csv(self):
+        """Test the payroll page defaults to last month and streams CSV for admins only"""
+        # kind: endpoint_tests, original method: django_app.views.payroll_report
+        self.visit(self.anna, self.salsa, date(2024, 1, 9))
+        User.objects.create_user(username='staff', password='testpass123', is_staff=True)
+        self.assertRedirects(self.client.get(reverse('payroll_report')), reverse('login') + '?next=/reports/payroll/')
+
+        self.client.force_login(self.nino.user)
+        self.assertRedirects(self.client.get(reverse('payroll_report')), reverse('dashboard'), fetch_redirect_response=False)
+
+        self.client.login(username='staff', password='testpass123')
+        response = self.client.get(reverse('payroll_report'))
+        self.assertEqual(response.context['month'], date(2024, 1, 1))
+        self.assertTrue(response.context['closed'])
+        self.assertContains(response, 'Nino K')
+
+        response = self.client.get(reverse('payroll_report'), {'month': '2024-01', 'format': 'csv'})
+        self.assertTrue(response.streaming)
+        self.assertEqual(response['Content-Disposition'], 'attachment; filename="payroll-2024-01.csv"')
+        self.assertEqual(b''.join(response.streaming_content).decode().splitlines(), [
+            'Teacher ID,Teacher,Lessons,Hours',
+            f'{self.levan.id},levan,1,1.50',
+            f'{self.nino.id},Nino K,1,1.50',
+        ])
+
+
+@override_settings(PAYROLL_WARM_CACHE=True)
+class TestPayrollWarmup(TransactionTestCase):
+    """Tests for rebuilding cached closed-month reports in the worker, which commits like a real worker"""
+
+    def setUp(self):
+        self.nino = Teacher.objects.create(user=User.objects.create_user(username='nino'))
+        self.tango = Group.objects.create(
+            name='Tango', schedule=[{"day": "tue", "time": "19:30"}], duration='1hr', start_at=date(2024, 1, 1)
+        )
+        self.tango.teachers.add(self.nino)
+        self.anna = Student.objects.create(user=User.objects.create_user(username='anna'))
+        self.client.force_login(self.nino.user)
+
+    def save_attendance(self, lesson_date):
+        url = reverse('lesson_detail', kwargs={'group_id': self.tango.id, 'lesson_date': lesson_date})
+        self.client.post(url, {'students': [self.anna.id]})
+
+    @pytest.mark.timeout(30)
+    @freeze_time("2024-02-10")
+    def test_late_attendance_rebuilds_closed_month(self):
+        """Test saving attendance of a closed month queues a report rebuild that the worker caches"""
+        # kind: endpoint_tests, original method: django_app.payroll.warm_monthly_report
+        self.save_attendance('2024-01-16')
+        self.assertEqual(list(Task.objects.values_list('name', 'payload')), [
+            ('payroll.warm_monthly_report', {'studio_id': self.tango.studio_id, 'year': 2024, 'month': 1}),
+        ])
+        # Saving the same attendance again changes nothing and queues nothing
+        self.save_attendance('2024-01-16')
+        # The current month is never cached, so there is nothing to rebuild
+        self.save_attendance('2024-02-06')
+        self.assertEqual(Task.objects.count(), 1)
+
+        self.assertEqual(tasks.work(once=True), 1)
+        self.assertEqual(Task.objects.get().status, Task.STATUS_DONE)
+        start, end = payroll.month_bounds(2024, 1)
+        key = tenancy.cache_key(f'payroll:2024-01:{payroll.attendance_stamp(start, end)}', self.tango.studio_id)
+        self.assertEqual(cache.get(key), [payroll.PayrollRow(self.nino.id, 'nino', 1, 60)])
@@ -0,0 +1,94 @@
+import shutil
+import tempfile
+import pytest
+from pathlib import Path
+from django.test import TestCase, Client, override_settings
+from django.urls import reverse
+from django.contrib.auth.models import User
+from django_app.models import ProfileTrace
+
+
+class TestProfilingMiddleware(TestCase):
+    """Tests for the sampling request profiler"""
+
+    def setUp(self):
+        self.tmpdir = tempfile.mkdtemp()
+        self.settings_override = override_settings(PROFILING_DIR=Path(self.tmpdir), PROFILING_TOKEN='secret')
+        self.settings_override.enable()
+        self.client = Client()
+        self.staff_user = User.objects.create_user(username='admin', is_staff=True, is_superuser=True)
+        self.teacher_user = User.objects.create_user(username='teacher')
+
+    def tearDown(self):
+        self.settings_override.disable()
+        shutil.rmtree(self.tmpdir)
+
+    @pytest.mark.timeout(30)
+    def test_not_profiled_by_default(self):
+        """Test ordinary requests are not profiled"""
+        # kind: endpoint_tests, original method: django_app.middleware.ProfilingMiddleware.__call__
+        self.client.force_login(self.staff_user)
+        self.client.get(reverse('dashboard'))
+        self.assertFalse(ProfileTrace.objects.exists())
+
+    @pytest.mark.timeout(30)
+    def test_staff_query_param(self):
+        """Test ?profile=1 profiles the request for staff and writes a trace file"""
+        # kind: endpoint_tests, original method: django_app.middleware.ProfilingMiddleware.__call__
+        self.client.force_login(self.staff_user)
+        response = self.client.get(reverse('dashboard'), {'profile': '1'})
+        self.assertEqual(response.status_code, 200)
+        trace = ProfileTrace.objects.get()
+        self.assertEqual((trace.view_name, trace.trigger, trace.backend), ('dashboard', 'param', 'cprofile'))
+        self.assertTrue((Path(self.tmpdir) / trace.file_name).exists())
+
+    @pytest.mark.timeout(30)
+    async def test_staff_query_param_async(self):
+        """Test profiling works for requests served through the ASGI handler"""
+        # kind: endpoint_tests, original method: django_app.middleware.ProfilingMiddleware.__acall__
+        await self.async_client.aforce_login(self.staff_user)
+        response = await self.async_client.get(reverse('students'), {'profile': '1'})
+        self.assertEqual(response.status_code, 200)
+        trace = await ProfileTrace.objects.aget()
+        self.assertEqual(trace.view_name, 'students')
+
+    @pytest.mark.timeout(30)
+    def test_query_param_ignored_for_non_staff(self):
+        """Test ?profile=1 is ignored for non-staff users"""
+        # kind: endpoint_tests, original method: django_app.profiling.trigger_for
+        self.client.force_login(self.teacher_user)
+        self.client.get(reverse('dashboard'), {'profile': '1'})
+        self.assertFalse(ProfileTrace.objects.exists())
+
+    @pytest.mark.timeout(30)
+    def test_header_token(self):
+        """Test the X-Profile header with the configured token profiles the request"""
+        # kind: endpoint_tests, original method: django_app.profiling.trigger_for
+        self.client.get(reverse('login'), headers={'X-Profile': 'wrong'})
+        self.assertFalse(ProfileTrace.objects.exists())
+        self.client.get(reverse('login'), headers={'X-Profile': 'secret'})
+        self.assertEqual(ProfileTrace.objects.get().trigger, 'header')
+
+    @pytest.mark.timeout(30)
+    @override_settings(PROFILING_SAMPLE_RATE=1.0, PROFILING_MAX_FILES=2)
+    def test_sampling_and_rotation(self):
+        """Test sampled traces are rotated to PROFILING_MAX_FILES"""
+        # kind: unit_tests, original method: django_app.profiling.rotate
+        for _ in range(3):
+            self.client.get(reverse('login'))
+        self.assertEqual(ProfileTrace.objects.count(), 2)
+        files = {path.name for path in Path(self.tmpdir).iterdir()}
+        self.assertEqual(files, set(ProfileTrace.objects.values_list('file_name', flat=True)))
+
+    @pytest.mark.timeout(30)
+    def test_admin_shows_report_and_download(self):
+        """Test traces are viewable and downloadable from the admin"""
+        # kind: endpoint_tests, original method: django_app.admin.ProfileTraceAdmin.get_report
+        self.client.force_login(self.staff_user)
+        self.client.get(reverse('students'), {'profile': '1'})
+        trace = ProfileTrace.objects.get()
+        response = self.client.get(reverse('admin:django_app_profiletrace_change', args=[trace.pk]))
+        self.assertContains(response, 'cumulative')
+        response = self.client.get(reverse('admin:django_app_profiletrace_download', args=[trace.pk]))
+        self.assertEqual(response.status_code, 200)
+        self.assertIn('attachment', response['Content-Disposition'])
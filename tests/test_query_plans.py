@@ -0,0 +1,115 @@
+import pytest
+from datetime import date
+from django.core.cache import cache
+from django.test import TestCase, TransactionTestCase, Client, override_settings
+from django.urls import reverse
+from django.contrib.auth.models import User
+from django_app import tasks
+from django_app.instrumentation import normalize_sql
+from django_app.models import Group, Student, StudentVisit, QueryPlan, Task
+from django_app.query_plans import explain, params_fingerprint, store_plan
+
+
+class TestQueryPlans(TestCase):
+    """Tests for slow-query plan capture"""
+
+    def setUp(self):
+        self.client = Client()
+        self.admin_user = User.objects.create_user(username='admin', is_staff=True, is_superuser=True)
+        self.student = Student.objects.create(user=User.objects.create_user(username='student'))
+        self.group = Group.objects.create(
+            name='Test Group', schedule=[], duration='1hr', start_at=date.today(), location='Studio'
+        )
+        self.client.force_login(self.admin_user)
+
+    @pytest.mark.timeout(30)
+    def test_explain_sqlite_plan(self):
+        """Test explain plans a parametrized statement without its parameters"""
+        # kind: unit_tests, original method: django_app.query_plans.explain
+        sql, _ = StudentVisit.objects.filter(group=self.group, notes__contains='%').query.sql_with_params()
+        plan = explain(sql)
+        self.assertRegex(plan, r'(SCAN|SEARCH)')
+
+    @pytest.mark.timeout(30)
+    def test_params_fingerprint_accepts_binary(self):
+        """Test parameters of any type are fingerprinted, binary ones by content"""
+        # kind: unit_tests, original method: django_app.query_plans.params_fingerprint
+        fingerprint = params_fingerprint([b'\\x00', 1, date(2024, 1, 1)])
+        self.assertEqual(params_fingerprint([memoryview(b'\\x00'), 1, date(2024, 1, 1)]), fingerprint)
+        self.assertNotEqual(params_fingerprint([b'\\x01', 1, date(2024, 1, 1)]), fingerprint)
+
+    @pytest.mark.timeout(30)
+    @override_settings(SLOW_QUERY_PLANS_MAX=2)
+    def test_store_plan_is_capped(self):
+        """Test store_plan keeps only the newest SLOW_QUERY_PLANS_MAX plans"""
+        # kind: unit_tests, original method: django_app.query_plans.store_plan
+        sql, params = Student.objects.filter(phone='1').query.sql_with_params()
+        for duration in (1.0, 2.0, 3.0):
+            store_plan('students', sql, params_fingerprint(params), duration)
+        self.assertEqual(
+            sorted(QueryPlan.objects.values_list('duration_ms', flat=True)), [2.0, 3.0]
+        )
+        plan = QueryPlan.objects.first()
+        self.assertIn('?', plan.sql)
+        self.assertEqual(len(plan.params_fingerprint), 40)
+
+    @pytest.mark.timeout(30)
+    @override_settings(SLOW_QUERY_EXPLAIN=True, REQUEST_METRICS_SLOW_MS=-1, SLOW_QUERY_EXPLAIN_COUNT=10)
+    def test_slow_request_queues_plan_captures(self):
+        """Test a slow request only queues captures, once per statement shape, without raw parameters"""
+        # kind: endpoint_tests, original method: django_app.query_plans.sample_slow_queries
+        self.client.get(reverse('students'))
+        self.assertTrue(Task.objects.filter(name='query_plans.capture').exists())
+        self.assertFalse(QueryPlan.objects.exists())
+
+        # The same statement shapes are not queued again the same day
+        self.client.get(reverse('students'))
+        queued = list(Task.objects.values_list('payload', flat=True))
+        shapes = [normalize_sql(payload['sql']) for payload in queued]
+        self.assertEqual(len(shapes), len(set(shapes)))
+        for payload in queued:
+            self.assertNotIn(self.client.session.session_key, str(payload))
+            self.assertNotIn('params', payload)
+
+    @pytest.mark.timeout(30)
+    def test_query_plan_admin(self):
+        """Test captured plans are browsable in the admin"""
+        # kind: endpoint_tests, original method: django_app.admin.QueryPlanAdmin
+        sql, params = Student.objects.filter(phone='1').query.sql_with_params()
+        plan = store_plan('students', sql, params_fingerprint(params), 12.5)
+        response = self.client.get(reverse('admin:django_app_queryplan_changelist'))
+        self.assertContains(response, 'students')
+        response = self.client.get(reverse('admin:django_app_queryplan_change', args=[plan.pk]))
+        self.assertContains(response, plan.plan.splitlines()[0])
+
+
+class TestQueryPlanWorker(TransactionTestCase):
+    """Tests for plan captures run by the worker, which commits like a real worker"""
+
+    def setUp(self):
+        self.admin_user = User.objects.create_user(username='admin', is_staff=True, is_superuser=True)
+        self.client.force_login(self.admin_user)
+
+    @pytest.mark.timeout(30)
+    @override_settings(SLOW_QUERY_EXPLAIN=True, REQUEST_METRICS_SLOW_MS=-1, SLOW_QUERY_EXPLAIN_COUNT=2)
+    def test_worker_stores_plans_once_per_shape(self):
+        """Test the worker explains queued statements and skips shapes already captured today"""
+        # kind: unit_tests, original method: django_app.query_plans.capture_query_plan
+        self.client.get(reverse('students'))
+        processed = tasks.work(once=True)
+        self.assertGreaterEqual(processed, 1)
+        self.assertFalse(Task.objects.exclude(status=Task.STATUS_DONE).exists())
+        plans = QueryPlan.objects.filter(view_name='students')
+        self.assertEqual(plans.count(), processed)
+        for plan in plans:
+            self.assertRegex(plan.plan, r'(SCAN|SEARCH)')
+
+        # Another process whose cache did not see the captured shapes still queues none of them again
+        captured = set(plans.values_list('sql', flat=True))
+        cache.clear()
+        self.client.get(reverse('students'))
+        for payload in Task.objects.filter(status=Task.STATUS_PENDING).values_list('payload', flat=True):
+            self.assertNotIn(normalize_sql(payload['sql']), captured)
+        tasks.work(once=True)
+        shapes = list(plans.values_list('sql', flat=True))
+        self.assertEqual(len(shapes), len(set(shapes)))
@@ -0,0 +1,104 @@
+import pytest
+from datetime import date
+from decimal import Decimal
+from django.core.cache import cache
+from django.db import connection
+from django.test import TestCase, Client
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+from django.contrib.auth.models import User
+from django_app import payments, roster
+from django_app.models import Group, Teacher, Student, PaymentEvent
+
+
+class TestRosterSnapshot(TestCase):
+    """Tests for the cached per-group roster"""
+
+    def setUp(self):
+        cache.clear()
+        self.group = Group.objects.create(
+            name='Salsa', schedule=[{"day": "tue", "time": "19:30"}], duration='1hr', start_at=date(2024, 1, 1)
+        )
+        self.anna = Student.objects.create(
+            user=User.objects.create_user(username='anna', first_name='Anna', last_name='Z'), phone='555'
+        )
+        self.ben = Student.objects.create(user=User.objects.create_user(username='ben'))
+        self.group.students.add(self.anna, self.ben)
+
+    def version(self):
+        return Group.objects.values_list('roster_version', flat=True).get(pk=self.group.pk)
+
+    @pytest.mark.timeout(30)
+    def test_snapshot_rows_and_balance_overlay(self):
+        """Test the snapshot lists members with display name, phone and current balance"""
+        # kind: unit_tests, original method: django_app.roster.snapshot
+        payments.record_event(self.anna, PaymentEvent.KIND_ADJUSTED, Decimal('30'))
+        group = Group.objects.get(pk=self.group.pk)
+        self.assertEqual(roster.snapshot(group), [
+            roster.RosterEntry(self.anna.id, 'Anna Z', '555', Decimal('30')),
+            roster.RosterEntry(self.ben.id, 'ben', '', 0),
+        ])
+
+    @pytest.mark.timeout(30)
+    def test_snapshot_is_cached_per_version(self):
+        """Test a second read only queries balances, and a membership change rebuilds it"""
+        # kind: unit_tests, original method: django_app.roster.snapshot
+        group = Group.objects.get(pk=self.group.pk)
+        roster.snapshot(group)
+        with CaptureQueriesContext(connection) as queries:
+            roster.snapshot(group)
+        self.assertEqual(len(queries.captured_queries), 1)
+
+        self.group.students.remove(self.ben)
+        group = Group.objects.get(pk=self.group.pk)
+        self.assertEqual([entry.id for entry in roster.snapshot(group)], [self.anna.id])
+
+    @pytest.mark.timeout(30)
+    def test_version_bumps(self):
+        """Test membership, profile and rename changes bump the roster version, logins do not"""
+        # kind: unit_tests, original method: django_app.roster.install
+        start = self.version()
+        self.anna.groups.clear()
+        self.assertEqual(self.version(), start + 1)
+
+        self.group.students.add(self.anna)
+        self.ben.phone = '777'
+        self.ben.save()
+        self.anna.user.first_name = 'Hanna'
+        self.anna.user.save()
+        self.assertEqual(self.version(), start + 4)
+
+        self.client.force_login(self.anna.user)
+        self.assertEqual(self.version(), start + 4)
+
+
+class TestLessonDetailRoster(TestCase):
+    """Endpoint tests for the narrow attendance screen"""
+
+    def setUp(self):
+        cache.clear()
+        self.client = Client()
+        self.teacher_user = User.objects.create_user(username='teacher')
+        teacher = Teacher.objects.create(user=self.teacher_user)
+        self.group = Group.objects.create(
+            name='Salsa', schedule=[{"day": "tue", "time": "19:30"}], duration='1hr', start_at=date(2024, 1, 1)
+        )
+        teacher.groups.add(self.group)
+        for number in range(10):
+            self.group.students.add(Student.objects.create(user=User.objects.create_user(username=f's{number}')))
+        Student.objects.create(user=User.objects.create_user(username='outsider', email='out@test.com'))
+        self.url = reverse('lesson_detail', kwargs={'group_id': self.group.id, 'lesson_date': '2024-01-16'})
+        self.client.force_login(self.teacher_user)
+
+    @pytest.mark.timeout(30)
+    def test_query_count_does_not_grow_with_roster(self):
+        """Test a cached attendance screen is a handful of queries regardless of group size"""
+        # kind: endpoint_tests, original method: django_app.views.lesson_detail
+        self.client.get(self.url)
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get(self.url)
+        self.assertEqual(len(response.context['roster']), 10)
+        self.assertContains(response, 'out@test.com')
+        # studio, session, user, studio membership, group, membership check, lesson version, visits,
+        # balances, other students (session and user come from the database without a shared cache)
+        self.assertLessEqual(len(queries.captured_queries), 10)
@@ -0,0 +1,65 @@
+import pytest
+from datetime import date
+from unittest import mock
+from django.conf import settings
+from django.db import router
+from django.test import TestCase
+from django.urls import reverse
+from django.contrib.auth.models import User
+from django_app import routers
+from django_app.models import Group, Pass, Student, Purchase
+
+
+class TestReplicaRouting(TestCase):
+    """Tests for sending opted-in reads to the replica with read-your-writes stickiness"""
+
+    def setUp(self):
+        # A fully configured alias; these tests never send a query to it
+        self.replica = {'replica': {**settings.DATABASES['default'], 'NAME': 'replica.sqlite3'}}
+        group = Group.objects.create(name='Salsa', schedule=[], duration='1hr', start_at=date(2024, 1, 1))
+        self.student = Student.objects.create(user=User.objects.create_user(username='anna'))
+        self.purchase = Purchase.objects.create(
+            student=self.student, dance_pass=Pass.objects.create(name='Pass', price=100, group=group, lessons_included=10)
+        )
+        self.admin = User.objects.create_superuser(username='admin', password='testpass123')
+
+    @pytest.mark.timeout(30)
+    def test_reads_opt_in_until_a_write(self):
+        """Test only reads inside use_replica go to the replica, and only until something is written"""
+        # kind: unit_tests, original method: django_app.routers.ReplicaRouter.db_for_read
+        self.assertEqual(Purchase.objects.all().db, 'default')
+        with mock.patch.dict(settings.DATABASES, self.replica):
+            self.assertEqual(Purchase.objects.all().db, 'default')
+            with routers.use_replica():
+                self.assertEqual(Purchase.objects.all().db, 'replica')
+                self.assertEqual(router.db_for_write(Purchase), 'default')
+                self.assertEqual(Purchase.objects.all().db, 'default')
+            with routers.use_replica():
+                self.assertEqual(Purchase.objects.all().db, 'replica')
+        # Without a configured replica nothing changes
+        with routers.use_replica():
+            self.assertEqual(Purchase.objects.all().db, 'default')
+        self.assertFalse(router.allow_migrate('replica', 'django_app'))
+
+    @pytest.mark.timeout(30)
+    def test_client_pinned_after_write(self):
+        """Test a write pins the client to the primary with a cookie that replica views honour"""
+        # kind: endpoint_tests, original method: django_app.routers.ReplicaPinMiddleware.finish
+        self.client.force_login(self.admin)
+        with mock.patch.dict(settings.DATABASES, self.replica):
+            response = self.client.post(
+                reverse('mark_purchases_paid'), {'purchases': [self.purchase.pk], 'payment_method': 'CASH'}
+            )
+            self.assertEqual(response.json()['updated'], 1)
+            cookie = response.cookies[routers.PIN_COOKIE]
+            self.assertEqual(cookie['max-age'], settings.REPLICA_PIN_SECONDS)
+
+            # Pinned: the replica-enabled view reads the primary and sees the payment
+            response = self.client.get(reverse('debtors'))
+            self.assertEqual(response.status_code, 200)
+            self.assertEqual(list(response.context['page'].object_list), [])
+            self.assertNotIn(routers.PIN_COOKIE, response.cookies)
+
+        # Without a replica, writes do not set the cookie
+        response = self.client.post(reverse('mark_purchases_paid'), {'payment_method': 'CASH'})
+        self.assertNotIn(routers.PIN_COOKIE, response.cookies)
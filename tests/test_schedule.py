@@ -0,0 +1,214 @@
+import pytest
+from datetime import date
+from io import StringIO
+from django.core.exceptions import ValidationError
+from django.core.management import call_command, CommandError
+from django.test import TestCase
+from django.urls import reverse
+from freezegun import freeze_time
+from django.contrib.auth.models import User
+from django_app import schedule
+from django_app.forms import GroupForm
+from django_app.models import Group, Teacher, parse_duration_minutes
+
+
+class TestScheduleConflicts(TestCase):
+    """Tests for double-booking detection"""
+
+    def setUp(self):
+        self.nino = Teacher.objects.create(user=User.objects.create_user(username='nino', first_name='Nino', last_name='K'))
+        self.levan = Teacher.objects.create(user=User.objects.create_user(username='levan', first_name='Levan', last_name='M'))
+        self.salsa = self.group('Salsa', [{"day": "tue", "time": "19:30"}], '90min', 'Studio A\nhttps://maps', self.nino)
+
+    def group(self, name, entries, duration, location, *teachers, **dates):
+        group = Group.objects.create(
+            name=name, schedule=entries, duration=duration, location=location,
+            start_at=dates.get('start_at', date(2024, 1, 1)), finished_at=dates.get('finished_at'),
+        )
+        group.teachers.add(*teachers)
+        return group
+
+    def form(self, **overrides):
+        data = {
+            'name': 'Bachata', 'schedule': '[{"day": "tue", "time": "20:30"}]', 'duration': '1hr',
+            'start_at': '2024-02-01', 'location': 'Studio B', 'teachers': [self.nino.pk],
+        }
+        data.update(overrides)
+        return GroupForm(data=data)
+
+    @pytest.mark.timeout(30)
+    def test_parse_duration_minutes(self):
+        """Test free-form durations are parsed into minutes"""
+        # kind: unit_tests, original method: django_app.models.parse_duration_minutes
+        cases = {
+            '1hr': 60, '90min': 90, '1h30': 90, '1 h 30 min': 90, '1.5 hours': 90, '1:30': 90, '45': 45,
+            '': 60, 'soon': 60,
+        }
+        for text, minutes in cases.items():
+            self.assertEqual(parse_duration_minutes(text), minutes, text)
+
+    @pytest.mark.timeout(30)
+    def test_teacher_and_location_overlaps(self):
+        """Test overlapping slots sharing a teacher or a location are reported once per resource"""
+        # kind: unit_tests, original method: django_app.schedule.find_conflicts
+        self.group('Bachata', [{"day": "tue", "time": "20:30"}], '1hr', 'studio a', self.nino)
+        # Back-to-back lessons are not a conflict
+        self.group('Kizomba', [{"day": "tue", "time": "21:00"}], '1hr', 'Studio A', self.levan)
+        # Different day
+        self.group('Tango', [{"day": "wed", "time": "19:30"}], '2h', 'Studio A', self.nino)
+
+        conflicts = schedule.studio_conflicts()
+        self.assertEqual({(c.kind, c.first.group_name, c.second.group_name) for c in conflicts}, {
+            ('teacher', 'Salsa', 'Bachata'),
+            ('location', 'Salsa', 'Bachata'),
+            ('location', 'Bachata', 'Kizomba'),
+        })
+
+    @pytest.mark.timeout(30)
+    def test_finished_and_non_overlapping_dates_ignored(self):
+        """Test finished groups and groups whose date ranges do not overlap are not conflicts"""
+        # kind: unit_tests, original method: django_app.schedule.find_conflicts
+        tuesday = [{"day": "tue", "time": "19:30"}]
+        winter = schedule.group_slots(1, 'Winter', tuesday, 60, 'Hall', date(2024, 1, 1), date(2024, 3, 1), [])
+        spring = schedule.group_slots(2, 'Spring', tuesday, 60, 'Hall', date(2024, 3, 5), None, [])
+        self.assertEqual(schedule.find_conflicts(winter + spring), [])
+
+        self.salsa.finished_at = date(2024, 3, 1)
+        self.salsa.save()
+        self.group('Bachata', tuesday, '1hr', 'Studio A', self.nino)
+        self.assertEqual(schedule.studio_conflicts(), [])
+
+    @pytest.mark.timeout(30)
+    def test_week_wraparound(self):
+        """Test a late Sunday lesson running past midnight clashes with an early Monday one"""
+        # kind: unit_tests, original method: django_app.schedule.find_conflicts
+        start = date(2024, 1, 1)
+        late = schedule.group_slots(1, 'Late', [{"day": "sun", "time": "23:30"}], 60, 'Hall', start, None, [])
+        early = schedule.group_slots(2, 'Early', [{"day": "mon", "time": "00:00"}], 60, 'Hall', start, None, [])
+        slots = late + early
+        self.assertEqual(len(schedule.find_conflicts(slots)), 1)
+
+    @pytest.mark.timeout(30)
+    def test_group_form_rejects_double_booking(self):
+        """Test GroupForm reports conflicts and accepts them when explicitly allowed"""
+        # kind: unit_tests, original method: django_app.forms.GroupForm.clean
+        form = self.form()
+        self.assertFalse(form.is_valid())
+        self.assertIn('Nino K is double-booked: Bachata (Tue 20:30) overlaps Salsa (Tue 19:30)',
+                      form.non_field_errors())
+
+        self.assertTrue(self.form(allow_conflicts='on').is_valid())
+        self.assertTrue(self.form(schedule='[{"day": "tue", "time": "21:00"}]').is_valid())
+
+    @pytest.mark.timeout(30)
+    def test_editing_group_ignores_itself(self):
+        """Test re-saving an existing group does not conflict with its own slots"""
+        # kind: unit_tests, original method: django_app.forms.GroupForm.clean
+        form = GroupForm(instance=self.salsa, data={
+            'name': 'Salsa', 'schedule': '[{"day": "tue", "time": "19:45"}]', 'duration': '90min',
+            'start_at': '2024-01-01', 'location': 'Studio A', 'teachers': [self.nino.pk],
+        })
+        self.assertTrue(form.is_valid(), form.errors)
+
+    @pytest.mark.timeout(30)
+    def test_check_schedule_command(self):
+        """Test check_schedule lists conflicts and fails when there are any"""
+        # kind: unit_tests, original method: django_app.management.commands.check_schedule.Command.handle
+        out = StringIO()
+        call_command('check_schedule', stdout=out)
+        self.assertIn('No schedule conflicts.', out.getvalue())
+
+        self.group('Bachata', [{"day": "tue", "time": "20:00"}], '1hr', 'Elsewhere', self.nino)
+        out = StringIO()
+        with self.assertRaises(CommandError):
+            call_command('check_schedule', stdout=out)
+        self.assertIn('double-booked', out.getvalue())
+
+
+class TestGroupDuration(TestCase):
+    """Tests for the typed lesson length derived from Group.duration"""
+
+    def setUp(self):
+        self.group = Group.objects.create(
+            name='Salsa', schedule=[{"day": "tue", "time": "19:30"}], duration='1h30',
+            start_at=date(2024, 1, 3), finished_at=date(2024, 1, 31),
+        )
+
+    @pytest.mark.timeout(30)
+    def test_save_keeps_minutes_in_sync(self):
+        """Test duration_minutes follows duration, including saves limited by update_fields"""
+        # kind: unit_tests, original method: django_app.models.Group.save
+        self.assertEqual(self.group.duration_minutes, 90)
+
+        self.group.duration = '45min'
+        self.group.save(update_fields=['duration'])
+        self.group.refresh_from_db()
+        self.assertEqual(self.group.duration_minutes, 45)
+
+    @pytest.mark.timeout(30)
+    def test_clean_rejects_unreadable_duration(self):
+        """Test Group.clean refuses durations the parser cannot read instead of keeping the old minutes"""
+        # kind: unit_tests, original method: django_app.models.Group.clean
+        self.group.duration = 'a while'
+        with self.assertRaises(ValidationError) as caught:
+            self.group.full_clean()
+        self.assertIn('duration', caught.exception.message_dict)
+
+    @pytest.mark.timeout(30)
+    def test_form_rejects_unreadable_duration(self):
+        """Test GroupForm refuses durations the parser cannot read"""
+        # kind: unit_tests, original method: django_app.models.Group.clean
+        form = GroupForm(data={
+            'name': 'Bachata', 'schedule': '[{"day": "wed", "time": "20:30"}]', 'duration': 'a while',
+            'start_at': '2024-02-01', 'location': 'Studio B',
+        })
+        self.assertFalse(form.is_valid())
+        self.assertIn('duration', form.errors)
+
+    @pytest.mark.timeout(30)
+    def test_lesson_end_wraps_midnight(self):
+        """Test lesson end times are wall-clock times that wrap past midnight"""
+        # kind: unit_tests, original method: django_app.schedule.lesson_end
+        self.assertEqual(schedule.lesson_end('19:30', 90), '21:00')
+        self.assertEqual(schedule.lesson_end('23:30', 90), '01:00')
+
+    @pytest.mark.timeout(30)
+    def test_running_between(self):
+        """Test groups are selected by overlap of their running dates with a range"""
+        # kind: unit_tests, original method: django_app.models.GroupQuerySet.running_between
+        self.assertTrue(Group.objects.running_between(date(2024, 1, 31)).exists())
+        self.assertFalse(Group.objects.running_between(date(2024, 2, 1)).exists())
+        self.assertFalse(Group.objects.running_between(date(2023, 12, 1), date(2024, 1, 2)).exists())
+        self.assertTrue(Group.objects.running_between(date(2023, 12, 1), date(2024, 1, 3)).exists())
+
+    @pytest.mark.timeout(30)
+    @freeze_time("2024-01-16 20:00")  # Tuesday, halfway through the lesson
+    def test_dashboard_shows_running_lesson_with_end_time(self):
+        """Test a lesson still in progress stays on the dashboard with its end time"""
+        # kind: endpoint_tests, original method: django_app.views.dashboard
+        self.group.finished_at = None
+        self.group.save()
+        User.objects.create_superuser(username='admin', password='testpass123')
+        self.client.login(username='admin', password='testpass123')
+
+        response = self.client.get(reverse('dashboard'))
+        lesson = response.context['upcoming_lessons'][0]
+        self.assertEqual((lesson['date'], lesson['end_time']), (date(2024, 1, 16), '21:00'))
+        self.assertContains(response, '19:30–21:00')
+
+    @pytest.mark.timeout(30)
+    @freeze_time("2024-01-15 22:30")  # Monday in UTC, already Tuesday 02:30 in Tbilisi
+    def test_dashboard_uses_the_local_date(self):
+        """Test the dashboard decides which lessons are over by local date and time alike"""
+        # kind: endpoint_tests, original method: django_app.views.dashboard
+        self.group.schedule = [{"day": "tue", "time": "01:00"}]
+        self.group.duration = '1hr'
+        self.group.finished_at = None
+        self.group.save()
+        User.objects.create_superuser(username='admin', password='testpass123')
+        self.client.login(username='admin', password='testpass123')
+
+        with self.settings(TIME_ZONE='Asia/Tbilisi'):
+            response = self.client.get(reverse('dashboard'))
+        # Tonight's 01:00 lesson is over; the next one is a week later
+        self.assertEqual(response.context['upcoming_lessons'][0]['date'], date(2024, 1, 23))
@@ -0,0 +1,135 @@
+import pytest
+from datetime import timedelta
+from io import StringIO
+from django.core.management import call_command
+from django.test import TestCase, TransactionTestCase
+from django.utils import timezone
+from django_app import tasks
+from django_app.models import Task
+
+calls = []
+
+
+@tasks.task(name='tests.record', max_attempts=2)
+def record(value):
+    calls.append(value)
+
+
+@tasks.task(name='tests.explode', max_attempts=2)
+def explode():
+    raise RuntimeError('boom')
+
+
+class TestTaskQueue(TestCase):
+    """Unit tests for the task queue"""
+
+    def setUp(self):
+        calls.clear()
+
+    @pytest.mark.timeout(30)
+    def test_enqueue_idempotency_key(self):
+        """Test enqueue returns the existing task for a repeated idempotency key"""
+        # kind: unit_tests, original method: django_app.tasks.enqueue
+        first = record.enqueue(idempotency_key='k1', value=1)
+        second = record.enqueue(idempotency_key='k1', value=2)
+        self.assertEqual(first.pk, second.pk)
+        self.assertEqual(Task.objects.count(), 1)
+        self.assertEqual(second.payload, {'value': 1})
+
+    @pytest.mark.timeout(30)
+    def test_enqueue_unknown_task(self):
+        """Test enqueue rejects unregistered task names"""
+        # kind: unit_tests, original method: django_app.tasks.enqueue
+        with self.assertRaises(KeyError):
+            tasks.enqueue('tests.missing')
+
+    @pytest.mark.timeout(30)
+    def test_claim_skips_delayed_tasks(self):
+        """Test claim_next_task ignores tasks scheduled in the future"""
+        # kind: unit_tests, original method: django_app.tasks.claim_next_task
+        record.enqueue(delay=timedelta(hours=1), value=1)
+        self.assertIsNone(tasks.claim_next_task())
+
+    @pytest.mark.timeout(30)
+    def test_claim_is_exclusive(self):
+        """Test a claimed task is not claimed twice until its lease expires"""
+        # kind: unit_tests, original method: django_app.tasks.claim_next_task
+        queued = record.enqueue(value=1)
+        claimed = tasks.claim_next_task()
+        self.assertEqual(claimed.pk, queued.pk)
+        self.assertEqual(claimed.status, Task.STATUS_RUNNING)
+        self.assertIsNone(tasks.claim_next_task())
+
+        Task.objects.filter(pk=queued.pk).update(locked_until=timezone.now() - timedelta(seconds=1))
+        self.assertEqual(tasks.claim_next_task().pk, queued.pk)
+
+    @pytest.mark.timeout(30)
+    def test_run_task_success(self):
+        """Test run_task runs the function and marks the task done"""
+        # kind: unit_tests, original method: django_app.tasks.run_task
+        record.enqueue(value=42)
+        task_obj = tasks.run_task(tasks.claim_next_task())
+        self.assertEqual(calls, [42])
+        self.assertEqual(task_obj.status, Task.STATUS_DONE)
+        self.assertEqual(task_obj.attempts, 1)
+
+    @pytest.mark.timeout(30)
+    def test_run_task_retries_then_fails(self):
+        """Test run_task reschedules a failing task and fails it after max_attempts"""
+        # kind: unit_tests, original method: django_app.tasks.run_task
+        explode.enqueue()
+        task_obj = tasks.run_task(tasks.claim_next_task())
+        self.assertEqual(task_obj.status, Task.STATUS_PENDING)
+        self.assertGreater(task_obj.run_after, timezone.now())
+        self.assertIn('boom', task_obj.last_error)
+
+        Task.objects.filter(pk=task_obj.pk).update(run_after=timezone.now())
+        task_obj = tasks.run_task(tasks.claim_next_task())
+        self.assertEqual(task_obj.status, Task.STATUS_FAILED)
+        self.assertEqual(task_obj.attempts, 2)
+
+    @pytest.mark.timeout(30)
+    def test_purge_done_tasks(self):
+        """Test only done tasks older than the retention window are purged"""
+        # kind: unit_tests, original method: django_app.tasks.purge_done_tasks
+        old = timezone.now() - timedelta(days=8)
+        stale = [
+            Task.objects.create(name='tests.record', status=Task.STATUS_DONE, run_after=old, finished_at=old)
+            for _ in range(3)
+        ]
+        recent = Task.objects.create(name='tests.record', status=Task.STATUS_DONE, finished_at=timezone.now())
+        failed = Task.objects.create(name='tests.explode', status=Task.STATUS_FAILED, run_after=old, finished_at=old)
+
+        self.assertEqual(tasks.purge_done_tasks(batch_size=2), 3)
+        self.assertFalse(Task.objects.filter(pk__in=[task_obj.pk for task_obj in stale]).exists())
+        self.assertEqual(set(Task.objects.values_list('pk', flat=True)), {recent.pk, failed.pk})
+
+
+class TestWorker(TransactionTestCase):
+    """Tests for the worker loop, which closes stale connections the way a long-running worker must"""
+
+    def setUp(self):
+        calls.clear()
+
+    @pytest.mark.timeout(30)
+    def test_idle_worker_purges_done_tasks(self):
+        """Test a worker that drains the queue also purges old done tasks"""
+        # kind: unit_tests, original method: django_app.tasks.work
+        old = timezone.now() - timedelta(days=30)
+        Task.objects.create(name='tests.record', status=Task.STATUS_DONE, run_after=old, finished_at=old)
+        record.enqueue(value=1)
+        self.assertEqual(tasks.work(once=True), 1)
+        self.assertEqual(list(Task.objects.values_list('status', flat=True)), [Task.STATUS_DONE])
+
+    @pytest.mark.timeout(30)
+    def test_run_worker_once(self):
+        """Test run_worker --once drains the queue and exits"""
+        # kind: unit_tests, original method: django_app.management.commands.run_worker.Command.handle
+        record.enqueue(value=1)
+        record.enqueue(value=2)
+        out = StringIO()
+        call_command('run_worker', '--once', '--concurrency', '1', stdout=out)
+        self.assertEqual(sorted(calls), [1, 2])
+        self.assertIn('Processed 2 task(s)', out.getvalue())
+        self.assertFalse(Task.objects.exclude(status=Task.STATUS_DONE).exists())
+
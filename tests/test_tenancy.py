@@ -0,0 +1,164 @@
+import pytest
+from datetime import date
+from django.conf import settings
+from django.db import connection
+from django.test import TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+from django.contrib.auth.models import Permission, User
+from django_app import payments, roster, tenancy
+from django_app.forms import StudentSelectionForm
+from django_app.models import (
+    Studio, Group, Student, Teacher, Pass, Purchase, PaymentEvent, StudentBalance, StudentVisit,
+)
+
+
+@override_settings(ALLOWED_HOSTS=['testserver', 'salsa.example.com'])
+class TestTenancy(TestCase):
+    """Tests for per-studio scoping of queries, new rows and cache keys"""
+
+    def setUp(self):
+        self.salsa = Studio.objects.create(name='Salsa Club', slug='salsa', hostname='Salsa.Example.com')
+        self.anna = Student.objects.create(user=User.objects.create_user(username='anna'))
+        with tenancy.use_studio(self.salsa):
+            self.group = Group.objects.create(
+                name='Salsa', schedule=[{"day": "tue", "time": "19:30"}], duration='1hr', start_at=date(2024, 1, 1)
+            )
+            self.ben = Student.objects.create(user=User.objects.create_user(username='ben'))
+        self.admin = User.objects.create_superuser(username='admin', password='testpass123')
+
+    @pytest.mark.timeout(30)
+    def test_new_rows_belong_to_current_studio(self):
+        """Test rows created inside use_studio get that studio and others get the default one"""
+        # kind: unit_tests, original method: django_app.tenancy.default_studio_id
+        self.assertEqual(self.salsa.hostname, 'salsa.example.com')
+        self.assertEqual(self.ben.studio_id, self.salsa.pk)
+        self.assertEqual(self.anna.studio_id, settings.DEFAULT_STUDIO_ID)
+
+        # Child rows take their parent's studio, also when bulk-created outside the studio
+        dance_pass = Pass.objects.create(name='Pass', price=100, group=self.group, lessons_included=10)
+        purchase = Purchase.objects.create(student=Student.objects.get(pk=self.ben.pk), dance_pass=dance_pass)
+        visit, = StudentVisit.objects.bulk_create([
+            StudentVisit(student_id=self.ben.pk, group_id=self.group.pk, date=date(2024, 1, 2))
+        ])
+        self.assertEqual(purchase.studio_id, self.salsa.pk)
+        self.assertEqual(visit.studio_id, self.salsa.pk)
+        self.assertEqual(PaymentEvent.objects.filter(studio=self.salsa).count(), 0)
+        payments.record_purchase(purchase)
+        self.assertEqual(StudentBalance.objects.get(student=self.ben).studio_id, self.salsa.pk)
+        self.assertEqual(PaymentEvent.objects.filter(studio=self.salsa).count(), 1)
+
+    @pytest.mark.timeout(30)
+    def test_managers_scope_to_current_studio(self):
+        """Test default managers and form choices only see the current studio"""
+        # kind: unit_tests, original method: django_app.tenancy.TenantManager.get_queryset
+        self.assertEqual(Student.objects.count(), 2)
+        with tenancy.use_studio(self.salsa):
+            self.assertEqual(list(Student.objects.all()), [self.ben])
+            self.assertEqual(list(StudentSelectionForm().fields['student'].queryset), [self.ben])
+            self.assertEqual(tenancy.cache_key('payroll:2024-01'), f'studio:{self.salsa.pk}:payroll:2024-01')
+        with tenancy.use_studio(settings.DEFAULT_STUDIO_ID):
+            self.assertEqual(list(Student.objects.all()), [self.anna])
+            self.assertEqual(list(Group.objects.all()), [])
+        self.assertEqual(roster.cache_key(self.group), f'studio:{self.salsa.pk}:roster:{self.group.pk}:0')
+
+    @pytest.mark.timeout(30)
+    def test_request_host_selects_studio(self):
+        """Test the request host picks the studio, unknown hosts get the default one, and reads add no query"""
+        # kind: endpoint_tests, original method: django_app.tenancy.TenantMiddleware.start
+        self.client.force_login(self.admin)
+        with CaptureQueriesContext(connection) as salsa_queries:
+            response = self.client.get(reverse('students'), HTTP_HOST='salsa.example.com:8000')
+        self.assertEqual(list(response.context['students']), [self.ben])
+        with CaptureQueriesContext(connection) as default_queries:
+            response = self.client.get(reverse('students'))
+        self.assertEqual(list(response.context['students']), [self.anna])
+        self.assertEqual(len(salsa_queries.captured_queries), len(default_queries.captured_queries))
+
+        other = self.client.get(reverse('student_detail', args=[self.anna.pk]), HTTP_HOST='salsa.example.com')
+        self.assertEqual(other.status_code, 404)
+
+    @pytest.mark.timeout(30)
+    def test_users_only_sign_in_to_their_studio(self):
+        """Test a user of one studio can neither log in on nor keep using another studio's host"""
+        # kind: endpoint_tests, original method: django_app.accounts.StudioModelBackend.user_can_authenticate
+        Teacher.objects.create(user=User.objects.create_user(username='tom', password='testpass123'))
+        with tenancy.use_studio(self.salsa):
+            Teacher.objects.create(user=User.objects.create_user(username='carla', password='testpass123'))
+        self.assertEqual(list(self.ben.user.studios.all()), [self.salsa])
+        credentials = {'username': 'tom', 'password': 'testpass123'}
+
+        response = self.client.post(reverse('login'), credentials, HTTP_HOST='salsa.example.com')
+        self.assertEqual(response.status_code, 200)
+        self.assertContains(response, 'Invalid username or password.')
+
+        response = self.client.post(reverse('login'), credentials)
+        self.assertRedirects(response, reverse('dashboard'), fetch_redirect_response=False)
+        self.assertEqual(self.client.get(reverse('students')).status_code, 200)
+        for name in ('dashboard', 'students', 'debtors'):
+            response = self.client.get(reverse(name), HTTP_HOST='salsa.example.com')
+            self.assertEqual(response.status_code, 302, name)
+            self.assertTrue(response['Location'].startswith(reverse('login')))
+
+        response = self.client.post(
+            reverse('login'), {'username': 'carla', 'password': 'testpass123'}, HTTP_HOST='salsa.example.com'
+        )
+        self.assertRedirects(response, reverse('dashboard'), fetch_redirect_response=False)
+        self.assertEqual(self.client.get(reverse('dashboard'), HTTP_HOST='salsa.example.com').status_code, 200)
+
+    @pytest.mark.timeout(30)
+    def test_visits_cannot_move_to_another_studio(self):
+        """Test the admin offers and accepts only the current studio's groups as a move target"""
+        # kind: endpoint_tests, original method: django_app.admin.StudentVisitActionForm
+        group = Group.objects.create(
+            name='Lindy', schedule=[{"day": "tue", "time": "19:30"}], duration='1hr', start_at=date(2024, 1, 1)
+        )
+        visit = StudentVisit.objects.create(student=self.anna, group=group, date=date(2024, 1, 2))
+        self.client.force_login(self.admin)
+        url = reverse('admin:django_app_studentvisit_changelist')
+
+        response = self.client.get(url)
+        choices = [choice for choice, _ in response.context['action_form'].fields['target_group'].choices]
+        self.assertNotIn(self.group.pk, [getattr(choice, 'value', choice) for choice in choices])
+
+        response = self.client.post(url, {
+            'action': 'move_to_lesson', '_selected_action': [str(visit.pk)],
+            'target_group': str(self.group.pk), 'target_date': '2024-01-04',
+        })
+        self.assertEqual(response.status_code, 302)
+        visit.refresh_from_db()
+        self.assertEqual((visit.group_id, visit.date, visit.studio_id), (group.pk, date(2024, 1, 2), group.studio_id))
+
+        with self.assertRaises(ValueError):
+            StudentVisit.objects.filter(pk=visit.pk).move_to(self.group, date(2024, 1, 4))
+
+    @pytest.mark.timeout(30)
+    def test_cross_studio_admins_are_superuser_only(self):
+        """Test staff of one studio cannot reach admins whose rows are not scoped to a studio"""
+        # kind: endpoint_tests, original method: django_app.admin.SuperuserOnlyMixin
+        staff = User.objects.create_user(username='staff', is_staff=True)
+        staff.user_permissions.set(Permission.objects.all())
+        models = ['django_app_studio', 'auth_user', 'django_app_task', 'django_app_queryplan', 'django_app_profiletrace']
+
+        self.client.force_login(staff)
+        self.assertEqual(self.client.get(reverse('admin:django_app_student_changelist')).status_code, 200)
+        index = self.client.get(reverse('admin:index'))
+        for model in models:
+            self.assertEqual(self.client.get(reverse(f'admin:{model}_changelist')).status_code, 403, model)
+            self.assertNotContains(index, reverse(f'admin:{model}_changelist'))
+        self.assertEqual(self.client.get(reverse('admin:auth_user_change', args=[self.admin.pk])).status_code, 403)
+
+        self.client.force_login(self.admin)
+        for model in models:
+            self.assertEqual(self.client.get(reverse(f'admin:{model}_changelist')).status_code, 200, model)
+
+    @pytest.mark.timeout(30)
+    def test_default_studio_is_recreated(self):
+        """Test the default studio is recreated when missing (as after a flush)"""
+        # kind: unit_tests, original method: django_app.tenancy.ensure_default_studio
+        self.anna.delete()
+        Studio.objects.filter(pk=settings.DEFAULT_STUDIO_ID).delete()
+        tenancy.ensure_default_studio()
+        self.assertEqual(Studio.objects.get(pk=settings.DEFAULT_STUDIO_ID).slug, 'main')
+        tenancy.ensure_default_studio()
+        self.assertEqual(Studio.objects.count(), 2)
@@ -1,57 +1,59 @@
 import pytest
 from datetime import date, datetime
-from django.test import TestCase, Client
+from django.test import TestCase
 from django.urls import reverse
 from django.contrib.auth.models import User
+from django.db import connection
+from django.test.utils import CaptureQueriesContext
 from django.utils import timezone
 from freezegun import freeze_time
 from django_app.models import Group, Pass, Teacher, Student, StudentVisit, Purchase
+from factories import make_group, make_pass, make_purchases, make_students, make_users, make_visits
 
 
 class TestViews(TestCase):
     """Endpoint tests for views"""
 
-    def setUp(self):
-        self.client = Client()
-
+    @classmethod
+    def setUpTestData(cls):
         # Create test users
-        self.admin_user = User.objects.create_user(
+        cls.admin_user = User.objects.create_user(
             username='admin',
             password='testpass123',
             is_staff=True,
             is_superuser=True
         )
 
-        self.teacher_user = User.objects.create_user(
+        cls.teacher_user = User.objects.create_user(
             username='teacher',
             password='testpass123',
             first_name='John',
             last_name='Teacher'
         )
-        self.teacher = Teacher.objects.create(user=self.teacher_user)
+        cls.teacher = Teacher.objects.create(user=cls.teacher_user)
 
-        self.student_user = User.objects.create_user(
+        cls.student_user = User.objects.create_user(
             username='student',
             password='testpass123',
             first_name='Jane',
             last_name='Student'
         )
-        self.student = Student.objects.create(user=self.student_user, phone='1234567890')
+        cls.student = Student.objects.create(user=cls.student_user, phone='1234567890')
 
         # Create test group and pass
-        self.group = Group.objects.create(
+        cls.group = Group.objects.create(
             name='Test Group',
             schedule=[{"day": "tue", "time": "19:30"}],
             duration='1hr',
             start_at=date.today(),
             location='Test Location'
         )
-        self.group.teachers.add(self.teacher)
+        cls.group.teachers.add(cls.teacher)
 
-        self.pass_obj = Pass.objects.create(
+        cls.pass_obj = Pass.objects.create(
             name='Test Pass',
             price=100.00,
-            group=self.group,
+            group=cls.group,
             lessons_included=10
         )
 
@@ -432,4 +434,118 @@ class TestViews(TestCase):
             date=date(2024, 1, 15)
         ).first()
         self.assertIsNotNone(visit)
-        self.assertTrue(visit.skipped)
\ No newline at end of file
+        self.assertTrue(visit.skipped)
+
+
+class TestAsyncViews(TestCase):
+    """Async client tests for views served through the async ORM"""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.teacher_user = User.objects.create_user(username='teacher', first_name='John', last_name='Teacher')
+        cls.teacher = Teacher.objects.create(user=cls.teacher_user)
+        cls.student = Student.objects.create(
+            user=User.objects.create_user(username='student', first_name='Jane', last_name='Student')
+        )
+        cls.group = Group.objects.create(
+            name='Test Group',
+            schedule=[{"day": "tue", "time": "19:30"}],
+            duration='1hr',
+            start_at=date.today(),
+            location='Test Location'
+        )
+        cls.group.teachers.add(cls.teacher)
+        cls.student.groups.add(cls.group)
+        cls.pass_obj = Pass.objects.create(name='Test Pass', price=100.00, group=cls.group, lessons_included=10)
+        Purchase.objects.create(student=cls.student, dance_pass=cls.pass_obj, paid_at=timezone.now())
+        Purchase.objects.create(student=cls.student, dance_pass=cls.pass_obj)
+        StudentVisit.objects.create(student=cls.student, group=cls.group, date=date.today())
+
+    @pytest.mark.timeout(30)
+    async def test_dashboard_async(self):
+        """Test dashboard renders under the async client without sync DB access"""
+        # kind: endpoint_tests, original method: django_app.views.dashboard
+        await self.async_client.aforce_login(self.teacher_user)
+        response = await self.async_client.get(reverse('dashboard'))
+        self.assertEqual(response.status_code, 200)
+        self.assertContains(response, 'Test Group')
+        self.assertContains(response, 'John Teacher')
+        self.assertContains(response, '<strong>My Groups:</strong> 1')
+
+    @pytest.mark.timeout(30)
+    async def test_students_async(self):
+        """Test students renders active passes under the async client"""
+        # kind: endpoint_tests, original method: django_app.views.students
+        await self.async_client.aforce_login(self.teacher_user)
+        response = await self.async_client.get(reverse('students'))
+        self.assertEqual(response.status_code, 200)
+        self.assertContains(response, 'Jane Student')
+        self.assertContains(response, '9 lessons remaining')
+
+    @pytest.mark.timeout(30)
+    async def test_student_detail_async(self):
+        """Test student_detail renders under the async client"""
+        # kind: endpoint_tests, original method: django_app.views.student_detail
+        await self.async_client.aforce_login(self.teacher_user)
+        response = await self.async_client.get(reverse('student_detail', kwargs={'student_id': self.student.id}))
+        self.assertEqual(response.status_code, 200)
+        self.assertContains(response, '(1/10 used)')
+        self.assertContains(response, 'Mark Paid')
+
+    @pytest.mark.timeout(30)
+    async def test_student_detail_async_not_found(self):
+        """Test student_detail returns 404 for a missing student"""
+        # kind: endpoint_tests, original method: django_app.views.student_detail
+        await self.async_client.aforce_login(self.teacher_user)
+        response = await self.async_client.get(reverse('student_detail', kwargs={'student_id': 999999}))
+        self.assertEqual(response.status_code, 404)
+
+    @pytest.mark.timeout(30)
+    def test_students_constant_queries(self):
+        """Test students list does not query per student"""
+        # kind: endpoint_tests, original method: django_app.views.students
+        self.client.force_login(self.teacher_user)
+        with CaptureQueriesContext(connection) as small:
+            self.client.get(reverse('students'))
+        for n in range(5):
+            student = Student.objects.create(user=User.objects.create_user(username=f'extra{n}'))
+            student.groups.add(self.group)
+            Purchase.objects.create(student=student, dance_pass=self.pass_obj, paid_at=timezone.now())
+        with CaptureQueriesContext(connection) as large:
+            self.client.get(reverse('students'))
+        self.assertEqual(len(small.captured_queries), len(large.captured_queries))
+
+
+class TestViewsAtScale(TestCase):
+    """Query counts of list views with a few hundred students, seeded once for the class"""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.admin_user = make_users(1, 'admin', is_staff=True, is_superuser=True)[0]
+        group = make_group()
+        students = make_students(300, groups=[group])
+        make_purchases(students, make_pass(group), paid=True)
+        make_purchases(students[:120], make_pass(group, name='Second pass'))
+        make_visits(students, group, [date(2024, 1, 2), date(2024, 1, 9)])
+
+    @pytest.mark.timeout(30)
+    def test_students_at_scale(self):
+        """Test the students list stays within a fixed number of queries for 300 students"""
+        # kind: endpoint_tests, original method: django_app.views.students
+        self.client.force_login(self.admin_user)
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get(reverse('students'))
+        self.assertEqual(len(response.context['students']), 300)
+        # Includes the studio, session and user lookups, which are not cached without a shared cache
+        self.assertLessEqual(len(queries.captured_queries), 6)
+
+    @pytest.mark.timeout(30)
+    def test_debtors_at_scale(self):
+        """Test the debtors list pages through every debtor within a fixed number of queries"""
+        # kind: endpoint_tests, original method: django_app.views.debtors
+        self.client.force_login(self.admin_user)
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get(reverse('debtors'), {'page': 3})
+        self.assertEqual(response.context['page'].paginator.count, 120)
+        self.assertEqual(len(response.context['page'].object_list), 20)
+        self.assertLessEqual(len(queries.captured_queries), 5)